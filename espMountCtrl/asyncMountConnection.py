@@ -0,0 +1,274 @@
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, Iterable, List, Optional, Tuple
+from time import perf_counter
+import asyncio
+import serial
+from serial.threaded import Packetizer, ReaderThread
+from .mountConnection import (
+    MountConnectionError, MountRejectedError, MountTimeoutError, MountStatus, TrackPointAddResult, RecoveryStats,
+    _open_serial, _format_cmd, _parse_int_response, _DEFAULT_COMMAND_TIMEOUT, _DEFAULT_COMMAND_TIMEOUTS,
+    _DEFAULT_QUERY_RETRIES, _QUERY_COMMANDS, _RESPONSE_ERROR, _response_cmd,
+    _CMD_FIRST_CHAR, _CMD_FORMATTING, _TRACK_POINT_UPLOAD_WINDOW,
+    _CMD_STR_GET_POS, _CMD_STR_SET_POS, _CMD_STR_SET_TIME, _CMD_STR_GET_TIME, _CMD_STR_GOTO, _CMD_STR_STOP,
+    _CMD_STR_GET_CPR, _CMD_STR_GET_PROTOCOL_VERSION, _CMD_STR_GET_TRACK_BUFFER_FREE_SPACE,
+    _CMD_STR_GET_TRACK_BUFFER_SIZE, _CMD_STR_TRACK_BUFFER_CLEAR, _CMD_STR_TRACK_POINT_ADD,
+    _CMD_STR_TRACKING_START, _CMD_STR_TRACKING_STOP, _CMD_STR_GET_STATUS
+)
+from .instrumentation import Instrumentation, OUTCOME_OK, OUTCOME_TIMEOUT, OUTCOME_ERROR
+
+@dataclass
+class _PendingCommand:
+    cmdStr: str
+    future: asyncio.Future
+    timeout: float
+    # Set when nobody waits for the response anymore (timeout, cancellation), the response is then only consumed
+    abandoned: bool = False
+    # perf_counter at writing and command size, only set when the connection is instrumented
+    sent_at: Optional[float] = None
+    bytes_sent: int = 0
+
+class _ResponseReader(Packetizer):
+    """Runs on pyserial's reader thread, hands complete lines over to the event loop"""
+    TERMINATOR = b"\n"
+
+    def __init__(self, connection: "AsyncMountConnection"):
+        super().__init__()
+        self.connection = connection
+
+    def handle_packet(self, packet: bytes) -> None:
+        self.connection._call_soon(self.connection._on_line, packet.decode(_CMD_FORMATTING, "replace"))
+
+    def connection_lost(self, exc: Exception) -> None:
+        super().connection_lost(None)
+        self.connection._call_soon(self.connection._on_connection_lost, exc)
+
+class AsyncMountConnection:
+    """Mount connection for asyncio applications.
+
+    Serial reading happens on pyserial's ReaderThread, so no call blocks the event loop. Commands
+    are written in the order they were issued and responses are matched to them first in, first
+    out, which is how the mount answers. Any number of commands may be in flight, each waits for
+    its response at most its timeout: `timeout` by default, or the value in `command_timeouts`
+    for its command string.
+
+    A command that timed out stays in the queue as abandoned, so that its late response is
+    consumed instead of being taken for the response of the next command. Queries are repeated up
+    to `query_retries` times after a timeout or a garbled response, as by MountConnection.
+    """
+    def __init__(self, timeout: float = _DEFAULT_COMMAND_TIMEOUT, command_timeouts: Dict[str, float] = None,
+                 query_retries: int = _DEFAULT_QUERY_RETRIES):
+        self.timeout = timeout
+        self.command_timeouts: Dict[str, float] = dict(_DEFAULT_COMMAND_TIMEOUTS if command_timeouts is None else command_timeouts)
+        self.query_retries = query_retries
+        self.recovery = RecoveryStats()
+        self.ser: Optional[serial.SerialBase] = None
+        self._reader: Optional[ReaderThread] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pending: Deque[_PendingCommand] = deque()
+        # Per command statistics, None keeps them off
+        self.instrumentation: Optional[Instrumentation] = None
+
+    async def open(self, device: str = None) -> bool:
+        """Opens serial port `device`, or any pyserial URL, see MountConnection.open"""
+        self._loop = asyncio.get_running_loop()
+        self.ser = await self._loop.run_in_executor(None, _open_serial, device)
+        self._reader = ReaderThread(self.ser, lambda: _ResponseReader(self))
+        self._reader.start()
+        await self._loop.run_in_executor(None, self._reader.connect)
+        return self.ser.is_open
+
+    async def close(self) -> None:
+        if self._reader is not None:
+            reader = self._reader
+            self._reader = None
+            await self._loop.run_in_executor(None, reader.close)
+        self._fail_pending(MountConnectionError("connection closed"))
+
+    def is_connected(self) -> bool:
+        return self._reader is not None and self._reader.alive and self.ser.is_open
+
+    def _format_cmd(self, cmdStr: str, *args) -> bytes:
+        return _format_cmd(cmdStr, *args)
+
+    def _call_soon(self, callback, *args) -> None:
+        try:
+            self._loop.call_soon_threadsafe(callback, *args)
+        except RuntimeError:
+            # Event loop already closed, nobody is waiting for anything
+            pass
+
+    def _on_line(self, line: str) -> None:
+        response_cmd = _response_cmd(line)
+        # Abandoned commands whose responses got lost, the line belongs to a later one
+        while len(self._pending) > 0 and self._pending[0].abandoned and self._pending[0].cmdStr != response_cmd:
+            self._pending.popleft()
+        if len(self._pending) == 0:
+            # Lines nobody asked for are ignored
+            return
+        command = self._pending[0]
+        if command.abandoned:
+            self._pending.popleft()
+            # Earlier attempts of a repeated query
+            while len(self._pending) > 0 and self._pending[0].abandoned and self._pending[0].cmdStr == response_cmd:
+                self._pending.popleft()
+            waiting = self._pending[0] if len(self._pending) > 0 else None
+            if waiting is None or waiting.abandoned or waiting.cmdStr != response_cmd or response_cmd not in _QUERY_COMMANDS:
+                return
+            # The query was repeated after the timeout, either response answers it
+            command = waiting
+        if response_cmd == command.cmdStr:
+            self._pending.popleft()
+            if not command.future.done():
+                self._record(command, len(line) + 1, OUTCOME_OK)
+                command.future.set_result(line.split(" "))
+            return
+        if response_cmd is None or response_cmd == _RESPONSE_ERROR:
+            self._pending.popleft()
+            if not command.future.done():
+                self._record(command, len(line) + 1, OUTCOME_ERROR)
+                command.future.set_exception(MountRejectedError(command.cmdStr) if response_cmd == _RESPONSE_ERROR else MountConnectionError(line))
+            return
+        later = next((i for i, pending in enumerate(self._pending) if pending.cmdStr == response_cmd), None)
+        if later is None:
+            # Late response of a command that failed before
+            self.recovery.skipped_lines += 1
+            return
+        # Commands before the answered one lost their responses
+        for _ in range(later):
+            missed = self._pending.popleft()
+            if not missed.abandoned and not missed.future.done():
+                self._record(missed, 0, OUTCOME_ERROR)
+                missed.future.set_exception(MountConnectionError())
+        self._on_line(line)
+
+    def _record(self, command: _PendingCommand, bytes_received: int, outcome: str) -> None:
+        if command.sent_at is not None and self.instrumentation is not None:
+            self.instrumentation.record(command.cmdStr, perf_counter() - command.sent_at, command.bytes_sent, bytes_received, outcome)
+
+    def _on_connection_lost(self, exc: Exception) -> None:
+        self._fail_pending(MountConnectionError(f"connection lost: {exc}" if exc is not None else "connection closed"))
+
+    def _fail_pending(self, error: Exception) -> None:
+        while len(self._pending) > 0:
+            command = self._pending.popleft()
+            if not command.abandoned and not command.future.done():
+                command.future.set_exception(error)
+
+    def _start_cmd(self, cmdStr: str, *args) -> _PendingCommand:
+        """Writes the command and queues it for its response. No await happens in between, so the
+        queue stays in the order of the commands on the wire."""
+        if not self.is_connected():
+            raise MountConnectionError("not connected")
+        command = _PendingCommand(cmdStr, self._loop.create_future(), self.command_timeouts.get(cmdStr, self.timeout))
+        self._pending.append(command)
+        data = _format_cmd(cmdStr, *args)
+        if self.instrumentation is not None:
+            command.sent_at = perf_counter()
+            command.bytes_sent = len(data)
+        try:
+            self._reader.write(data)
+        except serial.SerialException:
+            command.abandoned = True
+            raise
+        return command
+
+    async def _wait(self, command: _PendingCommand) -> List[str]:
+        try:
+            return await asyncio.wait_for(asyncio.shield(command.future), command.timeout)
+        except asyncio.TimeoutError:
+            self._record(command, 0, OUTCOME_TIMEOUT)
+            raise MountTimeoutError(command.cmdStr, command.timeout) from None
+        finally:
+            if not command.future.done():
+                command.abandoned = True
+
+    async def _send(self, cmdStr: str, args: Tuple, intCount: int = None) -> List[str]:
+        attempts = 1 + (self.query_retries if cmdStr in _QUERY_COMMANDS else 0)
+        for attempt in range(attempts):
+            try:
+                segments = await self._wait(self._start_cmd(cmdStr, *args))
+                return segments if intCount is None else _parse_int_response(segments, intCount)
+            except MountConnectionError as e:
+                if attempt + 1 == attempts or isinstance(e, MountRejectedError) or not self.is_connected():
+                    raise
+                self.recovery.retries += 1
+
+    async def _sendCmd(self, cmdStr: str, *args) -> List[str]:
+        return await self._send(cmdStr, args)
+
+    async def _send_int_cmd(self, cmdStr: str, intCount: int, *args) -> Tuple:
+        return await self._send(cmdStr, args, intCount)
+
+    async def get_position(self) -> Tuple[int, int]:
+        return await self._send_int_cmd(_CMD_STR_GET_POS, 2)
+
+    async def set_position(self, posAx1: int, posAx2: int) -> None:
+        await self._sendCmd(_CMD_STR_SET_POS, posAx1, posAx2)
+
+    async def get_time(self) -> int:
+        return (await self._send_int_cmd(_CMD_STR_GET_TIME, 1))[0]
+
+    async def set_time(self, time: int) -> None:
+        await self._sendCmd(_CMD_STR_SET_TIME, time)
+
+    async def goto(self, posAx1: int, posAx2: int) -> None:
+        await self._sendCmd(_CMD_STR_GOTO, posAx1, posAx2)
+
+    async def stop(self, instant: bool = False) -> None:
+        await self._sendCmd(_CMD_STR_STOP, int(instant))
+
+    async def get_cpr(self) -> Tuple[int, int]:
+        return await self._send_int_cmd(_CMD_STR_GET_CPR, 2)
+
+    async def get_protocol_version(self) -> int:
+        return (await self._send_int_cmd(_CMD_STR_GET_PROTOCOL_VERSION, 1))[0]
+
+    async def get_track_buffer_free_space(self) -> int:
+        return (await self._send_int_cmd(_CMD_STR_GET_TRACK_BUFFER_FREE_SPACE, 1))[0]
+
+    async def get_track_buffer_size(self) -> int:
+        return (await self._send_int_cmd(_CMD_STR_GET_TRACK_BUFFER_SIZE, 1))[0]
+
+    async def clear_track_buffer(self) -> None:
+        await self._sendCmd(_CMD_STR_TRACK_BUFFER_CLEAR)
+
+    async def add_track_point(self, posAx1: int, posAx2: int, time: int) -> TrackPointAddResult:
+        return TrackPointAddResult((await self._send_int_cmd(_CMD_STR_TRACK_POINT_ADD, 1, posAx1, posAx2, time))[0])
+
+    async def add_track_points(self, points: Iterable[Tuple[int, int, int]], window: int = _TRACK_POINT_UPLOAD_WINDOW) -> List[TrackPointAddResult]:
+        """Uploads (ax1, ax2, time) track points with up to `window` commands in flight, see MountConnection.add_track_points"""
+        if window < 1:
+            raise ValueError("Upload window must be at least 1")
+        results: List[TrackPointAddResult] = []
+        in_flight: Deque[_PendingCommand] = deque()
+        failed = False
+        points = iter(points)
+        try:
+            while True:
+                while not failed and len(in_flight) < window:
+                    point = next(points, None)
+                    if point is None:
+                        break
+                    in_flight.append(self._start_cmd(_CMD_STR_TRACK_POINT_ADD, *point))
+                if len(in_flight) == 0:
+                    break
+                segments = await self._wait(in_flight.popleft())
+                result = TrackPointAddResult(_parse_int_response(segments, 1)[0])
+                results.append(result)
+                if result != TrackPointAddResult.OK:
+                    failed = True
+        finally:
+            # After an error the remaining responses are only consumed
+            for command in in_flight:
+                command.abandoned = True
+        return results
+
+    async def tracking_start(self) -> None:
+        await self._sendCmd(_CMD_STR_TRACKING_START)
+
+    async def tracking_stop(self) -> None:
+        await self._sendCmd(_CMD_STR_TRACKING_STOP)
+
+    async def get_mount_status(self) -> MountStatus:
+        return MountStatus((await self._send_int_cmd(_CMD_STR_GET_STATUS, 1))[0])
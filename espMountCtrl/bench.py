@@ -0,0 +1,214 @@
+"""Benchmarks of the host-side hot paths.
+
+Run with `python -m espMountCtrl.bench`. Results are printed as JSON, `--output` saves them and
+`--baseline` compares against previously saved results, exiting with status 1 on regressions.
+The track upload benchmark runs against the simulated mount (espmountsim://), so no hardware is needed.
+"""
+import argparse
+import json
+import platform
+import subprocess
+import sys
+from time import perf_counter
+from typing import Callable, Dict, List, Tuple
+
+_DEFAULT_REPEAT = 5
+_DEFAULT_THRESHOLD = 1.25
+_SIM_URL = "espmountsim://?buffer=100000&latency=0.5"
+
+# Reference satellite, so that the benchmarks don't need network access
+_TLE_NAME = "ISS (ZARYA)"
+_TLE_LINE1 = "1 25544U 98067A   14020.93268519  .00009878  00000-0  18200-3 0  5082"
+_TLE_LINE2 = "2 25544  51.6498 109.4756 0003572  55.9686 274.8005 15.49815350868473"
+_TLE_EPOCH = "2014-01-21T00:00:00"
+
+_benchmarks: List[Tuple[str, Callable[[], Callable[[], None]]]] = []
+
+def benchmark(name: str):
+    """Registers a benchmark. The decorated function does the setup and returns the timed callable.
+    If the timed callable returns a float, it is used as the measured duration in seconds."""
+    def register(setup: Callable[[], Callable[[], None]]):
+        _benchmarks.append((name, setup))
+        return setup
+    return register
+
+def _mount():
+    from .mount import Mount
+    mount = Mount.from_ax_altaz(alt='49deg', az='0deg', lon='16deg', lat='49deg')
+    mount.cprRa = 160000
+    mount.cprDec = 160000
+    return mount
+
+def _satellite():
+    from skyfield.api import EarthSatellite
+    from .satellites import timescale
+    return EarthSatellite(_TLE_LINE1, _TLE_LINE2, _TLE_NAME, timescale())
+
+def _transit():
+    from astropy.time import Time
+    import astropy.units as u
+    from .satellites import SatelliteTracker
+    t0 = Time(_TLE_EPOCH)
+    return SatelliteTracker(_mount(), use_cache=False).find_transits(_satellite(), t0 + 1 * u.day, 10 * u.deg, t0)[0]
+
+@benchmark("coord_to_mount_pos")
+def _bench_coord_to_mount_pos():
+    mount = _mount()
+    coord = mount.local_altaz('30deg', '120deg')
+    return lambda: mount._coord_to_mount_pos(coord)
+
+@benchmark("coord_to_mount_pos_array_1000")
+def _bench_coord_to_mount_pos_array():
+    import numpy as np
+    import astropy.units as u
+    mount = _mount()
+    coords = mount.local_altaz(np.linspace(0, 90, 1000) * u.deg, np.linspace(0, 360, 1000) * u.deg)
+    return lambda: mount._coord_to_mount_pos(coords)
+
+@benchmark("mount_pos_to_coord")
+def _bench_mount_pos_to_coord():
+    mount = _mount()
+    return lambda: mount._mount_pos_to_coord(12345, 6789)
+
+def _bench_track(count: int):
+    def setup():
+        transit = _transit()
+        return lambda: transit.calculate_track(count)
+    return setup
+
+def _bench_track_points(count: int):
+    def setup():
+        transit = _transit()
+        return lambda: transit.calculate_track_points(count)
+    return setup
+
+for _count in (100, 600, 1000):
+    benchmark(f"calculate_track_{_count}")(_bench_track(_count))
+    # TrackPoint list kept for the compatibility shim
+    benchmark(f"calculate_track_points_{_count}")(_bench_track_points(_count))
+
+@benchmark("calculate_adaptive_track_20arcsec")
+def _bench_adaptive_track():
+    mount = _mount()
+    transit = _transit()
+    return lambda: transit.calculate_adaptive_track(mount, 20)
+
+def _bench_find_transits(days: int):
+    def setup():
+        from astropy.time import Time
+        import astropy.units as u
+        from .satellites import SatelliteTracker
+        tracker = SatelliteTracker(_mount(), use_cache=False)
+        sat = _satellite()
+        t0 = Time(_TLE_EPOCH)
+        return lambda: tracker.find_transits(sat, t0 + days * u.day, 10 * u.deg, t0)
+    return setup
+
+for _days in (1, 3, 7):
+    benchmark(f"find_transits_{_days}d")(_bench_find_transits(_days))
+
+@benchmark("find_transits_3d_cached")
+def _bench_find_transits_cached():
+    from astropy.time import Time
+    import astropy.units as u
+    from .satellites import SatelliteTracker
+    from .satellites.transitCache import TransitCache
+    tracker = SatelliteTracker(_mount())
+    tracker.transit_cache = TransitCache(":memory:")
+    sat = _satellite()
+    t0 = Time(_TLE_EPOCH)
+    tracker.find_transits(sat, t0 + 3 * u.day, 10 * u.deg, t0)
+    return lambda: tracker.find_transits(sat, t0 + 3 * u.day, 10 * u.deg, t0)
+
+@benchmark("track_upload_600")
+def _bench_track_upload():
+    import astropy.units as u
+    from .mount import TrackPoint
+    mount = _mount()
+    mount.connect(_SIM_URL)
+    t0 = mount.time + 1 * u.hour
+    points = [TrackPoint(mount.local_altaz((10 + i * 0.1) * u.deg, (90 + i * 0.2) * u.deg), t0 + i * u.s) for i in range(600)]
+    return lambda: mount.track(points)
+
+@benchmark("goto_sequence_4")
+def _bench_goto_sequence():
+    import astropy.units as u
+    mount = _mount()
+    # Fast axes, so that the time between the end of a slew and noticing it weighs in
+    mount.connect(_SIM_URL + "&speed=90&accel=180")
+    coords = [mount.local_altaz(alt * u.deg, az * u.deg) for alt, az in ((30, 120), (60, 200), (20, 90), (45, 300))]
+    def run():
+        for coord in coords:
+            mount.goto(coord, block=True)
+    return run
+
+@benchmark("import_satellites_first_use")
+def _bench_import_satellites():
+    # A fresh interpreter is needed, the modules are already cached in this one. The package import alone
+    # is a lazy stub, so the first real use is timed: the tracker with its dependencies and the timescale.
+    code = ("from time import perf_counter; t = perf_counter(); "
+            "from espMountCtrl.satellites import SatelliteTracker, timescale; timescale(); print(perf_counter() - t)")
+    def run() -> float:
+        result = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True)
+        return float(result.stdout)
+    return run
+
+def run_benchmarks(repeat: int = _DEFAULT_REPEAT, name_filter: str = None) -> Dict[str, Dict[str, float]]:
+    results = {}
+    for name, setup in _benchmarks:
+        if name_filter is not None and name_filter not in name:
+            continue
+        func = setup()
+        times = []
+        for _ in range(repeat):
+            t_start = perf_counter()
+            duration = func()
+            times.append(duration if isinstance(duration, float) else perf_counter() - t_start)
+        results[name] = {"min": min(times), "mean": sum(times) / len(times), "repeat": repeat}
+        print(f"{name:<36} min {min(times) * 1000:10.3f} ms", file=sys.stderr)
+    return results
+
+def compare(results: Dict, baseline: Dict, threshold: float = _DEFAULT_THRESHOLD) -> List[str]:
+    """Returns names of benchmarks whose minimal time grew more than `threshold` times against the baseline"""
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        ratio = result["min"] / baseline[name]["min"]
+        result["baseline_ratio"] = ratio
+        if ratio > threshold:
+            regressions.append(name)
+    return regressions
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m espMountCtrl.bench", description="Benchmarks of espMountCtrl hot paths")
+    parser.add_argument("-r", "--repeat", type=int, default=_DEFAULT_REPEAT, help="number of timed runs per benchmark")
+    parser.add_argument("-k", "--filter", default=None, help="run only benchmarks containing this string")
+    parser.add_argument("-o", "--output", default=None, help="save results as JSON to this file")
+    parser.add_argument("-b", "--baseline", default=None, help="compare against results saved earlier")
+    parser.add_argument("-t", "--threshold", type=float, default=_DEFAULT_THRESHOLD, help="slowdown ratio reported as regression")
+    args = parser.parse_args(argv)
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": run_benchmarks(args.repeat, args.filter),
+    }
+    regressions = []
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(report["results"], baseline, args.threshold)
+        report["regressions"] = regressions
+
+    output = json.dumps(report, indent=2)
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            f.write(output)
+    print(output)
+    for name in regressions:
+        print(f"Regression: {name} is {report['results'][name]['baseline_ratio']:.2f}x slower than baseline", file=sys.stderr)
+    return 1 if len(regressions) > 0 else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,173 @@
+"""`espmount` command-line tool.
+
+Commands go to the daemon (`espmount daemon`) if one is running, which answers in milliseconds.
+Otherwise the mount is opened for just this one command. The site and axis orientation come from
+--site/--ax or the ESP_MOUNT_SITE/ESP_MOUNT_AX environment variables, the port from --device or
+ESP_MOUNT_PORT, as for Mount.connect.
+"""
+from typing import Any, Dict, List
+import argparse
+import json
+import os
+import signal
+import sys
+from .daemon import DaemonClient, DaemonError, MountDaemon, MountSession, default_socket_path
+
+_ENVVAR_SITE = "ESP_MOUNT_SITE"
+_ENVVAR_AX = "ESP_MOUNT_AX"
+
+def _parse_floats(value: str, name: str, counts) -> List[float]:
+    try:
+        values = [float(part) for part in value.split(",")]
+    except ValueError:
+        raise SystemExit(f"{name} has to be comma separated numbers: {value}")
+    if len(values) not in counts:
+        raise SystemExit(f"{name} needs {' or '.join(str(c) for c in counts)} values: {value}")
+    return values
+
+def _make_mount(args: argparse.Namespace):
+    import astropy.units as u
+    from .mount import Mount
+    if args.site is None:
+        raise SystemExit(f"Site is unknown, use --site lat,lon[,elevation_m] or set {_ENVVAR_SITE}")
+    site = _parse_floats(args.site, "site", (2, 3))
+    lat, lon = site[0], site[1]
+    elevation = site[2] if len(site) > 2 else 0.0
+    # Without a given orientation, the first axis is assumed to point to the north celestial pole
+    ax = [lat, 0.0] if args.ax is None else _parse_floats(args.ax, "ax", (2,))
+    return Mount.from_ax_altaz(alt=ax[0] * u.deg, az=ax[1] * u.deg, lon=lon * u.deg, lat=lat * u.deg, elevation=elevation * u.m)
+
+def _request(args: argparse.Namespace) -> Dict[str, Any]:
+    """Request for the daemon protocol from the parsed command line"""
+    request: Dict[str, Any] = {"cmd": args.command}
+    for key in ("alt", "az", "ra", "dec", "wait", "norad", "name", "hours", "min_elev"):
+        value = getattr(args, key, None)
+        if value is not None and value is not False:
+            request[key] = value
+    if args.command == "track-file":
+        request["path"] = os.path.abspath(args.path)
+    return request
+
+def _run_local(args: argparse.Namespace, request: Dict[str, Any]) -> Any:
+    mount = _make_mount(args)
+    session = MountSession(mount)
+    if request["cmd"] == "find-transits":
+        # Only the site is needed
+        return session.handle(request)
+    mount.connect(args.device)
+    try:
+        result = session.handle(request)
+        streamer = session.streamer
+        if request["cmd"] == "track-file" and streamer is not None:
+            # Nobody would refill the buffer after this process exits
+            print(f"Streaming {result['points']} points, Ctrl+C stops", file=sys.stderr)
+            try:
+                streamer.join()
+            except KeyboardInterrupt:
+                pass
+        return result
+    finally:
+        session.close()
+
+def _raise_interrupt(signum, frame) -> None:
+    raise KeyboardInterrupt()
+
+def _connect_daemon(args: argparse.Namespace) -> DaemonClient:
+    """Returns a client of the running daemon, or None to run the command locally"""
+    if args.no_daemon or not os.path.exists(args.socket):
+        return None
+    try:
+        return DaemonClient(args.socket)
+    except OSError:
+        # Socket left behind by a daemon that is gone
+        return None
+
+def _run_daemon(args: argparse.Namespace) -> int:
+    mount = _make_mount(args)
+    mount.connect(args.device, multiplexed=True)
+    session = MountSession(mount)
+    server = MountDaemon(session, args.socket)
+    # SIGTERM ends serve_forever the same way as Ctrl+C
+    signal.signal(signal.SIGTERM, _raise_interrupt)
+    print(f"Serving on {server.socket_path}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        session.close()
+    return 0
+
+def _print_result(command: str, result: Any) -> None:
+    if command == "find-transits":
+        print(f"Transits of {result['satellite']}:")
+        for transit in result["transits"]:
+            print(f"  rise {transit['rise']}  culmination {transit['culmination']}  set {transit['set']}  max. elevation {round(transit['max_elev'], 1)} deg")
+        return
+    for key, value in result.items():
+        print(f"{key}: {round(value, 4) if isinstance(value, float) else value}")
+
+def _add_position_args(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--alt", type=float, help="altitude in degrees")
+    parser.add_argument("--az", type=float, help="azimuth in degrees")
+    parser.add_argument("--ra", type=float, help="right ascension in degrees")
+    parser.add_argument("--dec", type=float, help="declination in degrees")
+
+def _parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="espmount", description="Controls an esp-mount, directly or through the espmount daemon")
+    parser.add_argument("-d", "--device", default=None, help="serial port or pyserial URL, ESP_MOUNT_PORT by default")
+    parser.add_argument("--site", default=os.getenv(_ENVVAR_SITE), help=f"lat,lon[,elevation_m] of the mount, {_ENVVAR_SITE} by default")
+    parser.add_argument("--ax", default=os.getenv(_ENVVAR_AX), help=f"alt,az direction of the first axis in degrees, {_ENVVAR_AX} by default")
+    parser.add_argument("--socket", default=default_socket_path(), help="socket of the daemon")
+    parser.add_argument("--no-daemon", action="store_true", help="open the mount even if a daemon is running")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("status", help="mount status, position and time")
+    goto = commands.add_parser("goto", help="slew to a position")
+    _add_position_args(goto)
+    goto.add_argument("-w", "--wait", action="store_true", help="wait until the slew ends")
+    stop = commands.add_parser("stop", help="stop any motion")
+    stop.add_argument("-w", "--wait", action="store_true", help="wait until the mount stands still")
+    calibrate = commands.add_parser("calibrate", help="declare the current pointing to be the given position")
+    _add_position_args(calibrate)
+    track = commands.add_parser("track-file", help="track a binary track file or a CSV saved by TrackPath.to_csv")
+    track.add_argument("path")
+    transits = commands.add_parser("find-transits", help="list transits of a satellite")
+    transits.add_argument("--norad", type=int, help="NORAD catalogue number")
+    transits.add_argument("--name", help="satellite name")
+    transits.add_argument("--hours", type=float, default=24, help="search window from now (default 24 h)")
+    transits.add_argument("--min-elev", dest="min_elev", type=float, default=10, help="minimal elevation in degrees (default 10)")
+    commands.add_parser("daemon", help="keep the mount open and serve commands on --socket")
+    commands.add_parser("shutdown", help="stop the running daemon")
+    return parser
+
+def main(argv: List[str] = None) -> int:
+    args = _parser().parse_args(argv)
+    if args.command == "daemon":
+        return _run_daemon(args)
+
+    request = _request(args)
+    client = _connect_daemon(args)
+    try:
+        if client is not None:
+            with client:
+                result = client.request(**request)
+        elif args.command == "shutdown":
+            print("No daemon is running", file=sys.stderr)
+            return 1
+        else:
+            result = _run_local(args, request)
+    except DaemonError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+    if args.json:
+        print(json.dumps(result))
+    elif result:
+        _print_result(args.command, result)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
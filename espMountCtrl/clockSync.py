@@ -0,0 +1,160 @@
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+import asyncio
+import time
+import numpy as np
+from .mountConnection import MountConnection, _CMD_FIRST_CHAR, _CMD_STR_GET_TIME, _CMD_STR_SET_TIME
+
+_CLOCK_SYNC_SAMPLES = 8
+# Start bit, 8 data bits and a stop bit
+_BITS_PER_BYTE = 10
+# Mount reports whole milliseconds
+_MOUNT_TIME_RESOLUTION_MS = 1.0
+
+# Host time is derived from the monotonic clock, so it is cheap to query and doesn't jump between
+# reads. Once per check interval it is compared to the system clock, and re-anchored if they diverged
+# more than the threshold (clock stepped by NTP or by hand, or drift of the monotonic clock).
+_ANCHOR_CHECK_S = 1.0
+_ANCHOR_THRESHOLD_MS = 2.0
+# (unix ms, monotonic s) read together, replaced as a whole so that threads see a consistent pair
+_anchor = (time.time() * 1000, time.monotonic())
+_next_anchor_check = _anchor[1] + _ANCHOR_CHECK_S
+
+def host_time_ms() -> float:
+    """Current host unix time in milliseconds, based on the monotonic clock and kept close to the system clock"""
+    global _anchor, _next_anchor_check
+    now = time.monotonic()
+    unix_ms, monotonic_anchor = _anchor
+    derived_ms = unix_ms + (now - monotonic_anchor) * 1000
+    if now >= _next_anchor_check:
+        _next_anchor_check = now + _ANCHOR_CHECK_S
+        system_ms = time.time() * 1000
+        if abs(system_ms - derived_ms) > _ANCHOR_THRESHOLD_MS:
+            _anchor = (system_ms, now)
+            return system_ms
+    return derived_ms
+
+@dataclass
+class ClockSample:
+    host_ms: float          # Host time at which the mount most likely read its clock
+    mount_ms: int
+    rtt_ms: float
+    transport_ms: float     # Round trip time not explained by the bytes on the wire
+
+    @property
+    def offset_ms(self) -> float:
+        return self.mount_ms - self.host_ms
+
+@dataclass
+class ClockSync:
+    offset_ms: float                # Mount time minus host time
+    uncertainty_ms: float           # Bound of the offset error, given by the best round trip and mount time resolution
+    rtt_ms: float                   # Best round trip time
+    transport_ms: float             # Transport latency (both directions) of the best round trip
+    drift_ppm: Optional[float]      # Mount clock rate error relative to host, only when measured over time
+    samples: List[ClockSample]
+
+def _byte_time_ms(connection: MountConnection) -> float:
+    baudrate = getattr(connection.ser, "baudrate", None)
+    if not baudrate:
+        return 0.0
+    return _BITS_PER_BYTE / baudrate * 1000
+
+def _clock_sample(connection, t0: float, mount_ms: int, t1: float) -> ClockSample:
+    """Builds a sample from one get time exchange, sent at host time t0 and answered at t1.
+
+    Bytes on the wire are accounted for exactly (the command is short, the response long), only
+    the remaining transport latency is split in half, as in NTP.
+    """
+    byte_ms = _byte_time_ms(connection)
+    tx_ms = len(connection._format_cmd(_CMD_STR_GET_TIME)) * byte_ms
+    rx_ms = len(f"{_CMD_FIRST_CHAR}{_CMD_STR_GET_TIME} {mount_ms}\n") * byte_ms
+    rtt = t1 - t0
+    transport = max(0.0, rtt - tx_ms - rx_ms)
+    return ClockSample(t0 + tx_ms + transport / 2, mount_ms, rtt, transport)
+
+def sample_clock(connection: MountConnection, host_clock: Callable[[], float] = host_time_ms) -> ClockSample:
+    """Reads the mount time once and estimates the host time at which the mount read it"""
+    t0 = host_clock()
+    mount_ms = connection.get_time()
+    return _clock_sample(connection, t0, mount_ms, host_clock())
+
+def _clock_sync(sample_list: List[ClockSample], interval: float) -> ClockSync:
+    """The offset comes from the sample with the shortest round trip, which has the smallest possible
+    error. Drift is fitted only when the samples span some time (`interval` seconds apart)."""
+    best = min(sample_list, key=lambda sample: sample.rtt_ms)
+    drift = None
+    host = np.array([sample.host_ms for sample in sample_list])
+    if len(sample_list) >= 3 and host[-1] - host[0] > 0 and interval > 0:
+        offsets = np.array([sample.offset_ms for sample in sample_list])
+        drift = float(np.polyfit(host - host[0], offsets, 1)[0] * 1e6)
+    return ClockSync(
+        offset_ms=best.offset_ms,
+        uncertainty_ms=best.transport_ms / 2 + _MOUNT_TIME_RESOLUTION_MS / 2,
+        rtt_ms=best.rtt_ms,
+        transport_ms=best.transport_ms,
+        drift_ppm=drift,
+        samples=sample_list
+    )
+
+def measure_clock(connection: MountConnection, samples: int = _CLOCK_SYNC_SAMPLES, interval: float = 0,
+                  host_clock: Callable[[], float] = host_time_ms) -> ClockSync:
+    """Measures offset of the mount clock from `host_clock` over repeated exchanges"""
+    if samples < 1:
+        raise ValueError("At least one sample is needed")
+    sample_list: List[ClockSample] = []
+    for i in range(samples):
+        if i > 0 and interval > 0:
+            time.sleep(interval)
+        sample_list.append(sample_clock(connection, host_clock))
+    return _clock_sync(sample_list, interval)
+
+def _clock_value(connection, host_clock: Callable[[], float], transport_ms: float, correction_ms: float) -> int:
+    """Mount time to send now, so that it is right when the set time command arrives"""
+    byte_ms = _byte_time_ms(connection)
+    tx_ms = len(connection._format_cmd(_CMD_STR_SET_TIME, round(host_clock()))) * byte_ms
+    return round(host_clock() + tx_ms + transport_ms / 2 + correction_ms)
+
+def set_clock(connection: MountConnection, host_clock: Callable[[], float], transport_ms: float, correction_ms: float = 0) -> None:
+    """Sets mount time to `host_clock`, compensated for the time the command takes to reach the mount"""
+    connection.set_time(_clock_value(connection, host_clock, transport_ms, correction_ms))
+
+def sync_clock(connection: MountConnection, host_clock: Callable[[], float] = host_time_ms,
+               samples: int = _CLOCK_SYNC_SAMPLES) -> ClockSync:
+    """Sets the mount clock to `host_clock` and returns the measured residual offset.
+
+    When the residual offset is larger than its uncertainty (e.g. asymmetric transport latency),
+    the clock is set once more with the measured offset subtracted.
+    """
+    transport = measure_clock(connection, samples, host_clock=host_clock).transport_ms
+    set_clock(connection, host_clock, transport)
+    sync = measure_clock(connection, samples, host_clock=host_clock)
+    if abs(sync.offset_ms) > sync.uncertainty_ms:
+        set_clock(connection, host_clock, transport, -sync.offset_ms)
+        sync = measure_clock(connection, samples, host_clock=host_clock)
+    return sync
+
+async def measure_clock_async(connection, samples: int = _CLOCK_SYNC_SAMPLES, interval: float = 0,
+                              host_clock: Callable[[], float] = host_time_ms) -> ClockSync:
+    """measure_clock for an AsyncMountConnection"""
+    if samples < 1:
+        raise ValueError("At least one sample is needed")
+    sample_list: List[ClockSample] = []
+    for i in range(samples):
+        if i > 0 and interval > 0:
+            await asyncio.sleep(interval)
+        t0 = host_clock()
+        mount_ms = await connection.get_time()
+        sample_list.append(_clock_sample(connection, t0, mount_ms, host_clock()))
+    return _clock_sync(sample_list, interval)
+
+async def sync_clock_async(connection, host_clock: Callable[[], float] = host_time_ms,
+                           samples: int = _CLOCK_SYNC_SAMPLES) -> ClockSync:
+    """sync_clock for an AsyncMountConnection"""
+    transport = (await measure_clock_async(connection, samples, host_clock=host_clock)).transport_ms
+    await connection.set_time(_clock_value(connection, host_clock, transport, 0))
+    sync = await measure_clock_async(connection, samples, host_clock=host_clock)
+    if abs(sync.offset_ms) > sync.uncertainty_ms:
+        await connection.set_time(_clock_value(connection, host_clock, transport, -sync.offset_ms))
+        sync = await measure_clock_async(connection, samples, host_clock=host_clock)
+    return sync
@@ -0,0 +1,381 @@
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Deque, Dict, Iterable, List, Optional, Tuple
+from time import monotonic, perf_counter
+import heapq
+import itertools
+import threading
+from .mountConnection import (
+    MountConnection, MountConnectionError, MountRejectedError, MountTimeoutError, MountStatus, TrackPointAddResult,
+    MOTION_VERIFY, UPLOAD_RESYNC, _QUERY_COMMANDS, _MOTION_COMMANDS, _RESPONSE_ERROR, _motion_took_effect, _response_cmd, _stored_unconfirmed,
+    _format_cmd, _parse_int_response, _CMD_FIRST_CHAR, _CMD_FORMATTING, _TRACK_POINT_UPLOAD_WINDOW,
+    _CMD_STR_GET_POS, _CMD_STR_SET_POS, _CMD_STR_SET_TIME, _CMD_STR_GET_TIME, _CMD_STR_GOTO, _CMD_STR_STOP,
+    _CMD_STR_GET_CPR, _CMD_STR_GET_PROTOCOL_VERSION, _CMD_STR_GET_TRACK_BUFFER_FREE_SPACE,
+    _CMD_STR_GET_TRACK_BUFFER_SIZE, _CMD_STR_TRACK_BUFFER_CLEAR, _CMD_STR_TRACK_POINT_ADD,
+    _CMD_STR_TRACKING_START, _CMD_STR_TRACKING_STOP, _CMD_STR_GET_STATUS
+)
+from .instrumentation import Instrumentation, OUTCOME_OK, OUTCOME_TIMEOUT, OUTCOME_ERROR
+
+PRIORITY_URGENT = 0
+PRIORITY_NORMAL = 1
+PRIORITY_BULK = 2
+
+_COMMAND_PRIORITIES = {
+    _CMD_STR_STOP: PRIORITY_URGENT,
+    _CMD_STR_TRACKING_STOP: PRIORITY_URGENT,
+    _CMD_STR_GET_STATUS: PRIORITY_URGENT,
+    _CMD_STR_TRACK_POINT_ADD: PRIORITY_BULK,
+}
+
+# Queries without side effects. Concurrent identical requests still waiting in the queue share one round trip.
+_COALESCED_COMMANDS = _QUERY_COMMANDS
+
+@dataclass
+class _Request:
+    cmdStr: str
+    data: bytes
+    priority: int
+    submitted: float
+    futures: List[Future] = field(default_factory=list)
+    # perf_counter at writing, only set when the connection is instrumented
+    sent_at: Optional[float] = None
+
+@dataclass
+class _PriorityStats:
+    commands: int = 0
+    total_wait: float = 0.0
+    max_wait: float = 0.0
+
+    @property
+    def mean_wait(self) -> float:
+        return 0.0 if self.commands == 0 else self.total_wait / self.commands
+
+@dataclass
+class MultiplexerStats:
+    # Requests waiting to be written, now and at most
+    queue_depth: int = 0
+    max_queue_depth: int = 0
+    # Requests answered by another caller's round trip
+    coalesced: int = 0
+    # Time from submission to writing the command, per priority
+    wait: Dict[int, _PriorityStats] = field(default_factory=lambda: {p: _PriorityStats() for p in (PRIORITY_URGENT, PRIORITY_NORMAL, PRIORITY_BULK)})
+
+    def __str__(self) -> str:
+        names = {PRIORITY_URGENT: "urgent", PRIORITY_NORMAL: "normal", PRIORITY_BULK: "bulk"}
+        waits = ", ".join(
+            f"{names[p]}: {s.commands} cmds, wait mean {round(s.mean_wait * 1000, 1)} ms max {round(s.max_wait * 1000, 1)} ms"
+            for p, s in self.wait.items())
+        return f"queue depth: {self.queue_depth} (max {self.max_queue_depth}), coalesced: {self.coalesced}, {waits}"
+
+class MountMultiplexer:
+    """Shares one MountConnection between any number of threads.
+
+    A single I/O thread owns the serial port. Callers queue requests and block until their response
+    arrives. Requests are written by priority (stop, tracking stop and status first, bulk track
+    point uploads last) and in submission order within a priority, with up to `window` commands in
+    flight. Identical queries (e.g. several threads polling `gp`) that meet in the queue are sent
+    once and all of them get that response.
+
+    Deadlines, query retries and the motion policy are those of the connection. A response to a
+    later command in flight means the earlier ones lost theirs, they fail and the rest stays in sync.
+
+    Has the same methods as MountConnection, so it can be used as `Mount.mountConnection`.
+    """
+    def __init__(self, connection: MountConnection, window: int = _TRACK_POINT_UPLOAD_WINDOW):
+        self.connection = connection
+        self.window = window
+        self.stats = MultiplexerStats()
+        self._cond = threading.Condition()
+        self._queue: List[Tuple[int, int, _Request]] = []
+        self._queued_queries: Dict[bytes, _Request] = {}
+        self._in_flight: Deque[_Request] = deque()
+        self._sequence = itertools.count()
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+        if connection.is_connected():
+            self._start()
+
+    @property
+    def ser(self):
+        return self.connection.ser
+
+    @property
+    def instrumentation(self) -> Optional[Instrumentation]:
+        """Instrumentation of the underlying connection, coalesced requests count as one command"""
+        return self.connection.instrumentation
+
+    @instrumentation.setter
+    def instrumentation(self, instrumentation: Optional[Instrumentation]) -> None:
+        self.connection.instrumentation = instrumentation
+
+    def open(self, device: str = None) -> bool:
+        opened = self.connection.open(device)
+        self._start()
+        return opened
+
+    def close(self) -> None:
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self.connection.close()
+
+    def is_connected(self) -> bool:
+        return self.connection.is_connected()
+
+    def _start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="MountMultiplexer", daemon=True)
+        self._thread.start()
+
+    def _format_cmd(self, cmdStr: str, *args) -> bytes:
+        return _format_cmd(cmdStr, *args)
+
+    def submit(self, cmdStr: str, *args, priority: int = None) -> Future:
+        """Queues a command, the returned future resolves to the response segments"""
+        if priority is None:
+            priority = _COMMAND_PRIORITIES.get(cmdStr, PRIORITY_NORMAL)
+        data = _format_cmd(cmdStr, *args)
+        future = Future()
+        with self._cond:
+            if not self._running:
+                raise MountConnectionError("multiplexer is not running")
+            queued = self._queued_queries.get(data) if cmdStr in _COALESCED_COMMANDS else None
+            if queued is not None:
+                queued.futures.append(future)
+                self.stats.coalesced += 1
+                return future
+            request = _Request(cmdStr, data, priority, monotonic(), [future])
+            heapq.heappush(self._queue, (priority, next(self._sequence), request))
+            if cmdStr in _COALESCED_COMMANDS:
+                self._queued_queries[data] = request
+            self.stats.queue_depth = len(self._queue)
+            self.stats.max_queue_depth = max(self.stats.max_queue_depth, self.stats.queue_depth)
+            self._cond.notify_all()
+        return future
+
+    def _run(self) -> None:
+        ser = self.connection.ser
+        while True:
+            with self._cond:
+                while self._running and len(self._queue) == 0 and len(self._in_flight) == 0:
+                    self._cond.wait()
+                if not self._running:
+                    break
+                to_write = []
+                while len(self._queue) > 0 and len(self._in_flight) + len(to_write) < self.window:
+                    _, _, request = heapq.heappop(self._queue)
+                    self._queued_queries.pop(request.data, None)
+                    to_write.append(request)
+                    wait = monotonic() - request.submitted
+                    priority_stats = self.stats.wait[request.priority]
+                    priority_stats.commands += 1
+                    priority_stats.total_wait += wait
+                    priority_stats.max_wait = max(priority_stats.max_wait, wait)
+                self.stats.queue_depth = len(self._queue)
+            try:
+                instrumented = self.connection.instrumentation is not None
+                for request in to_write:
+                    if instrumented:
+                        request.sent_at = perf_counter()
+                    ser.write(request.data)
+                    self._in_flight.append(request)
+                if len(self._in_flight) > 0:
+                    self._read_response(ser)
+            except Exception as e:
+                self._fail_in_flight(e)
+        self._fail_in_flight(MountConnectionError("connection closed"))
+        with self._cond:
+            while len(self._queue) > 0:
+                _, _, request = heapq.heappop(self._queue)
+                self._resolve(request, error=MountConnectionError("connection closed"))
+            self._queued_queries.clear()
+
+    def _read_response(self, ser) -> None:
+        connection = self.connection
+        request = self._in_flight[0]
+        timeout = connection.command_timeout(request.cmdStr)
+        line = connection._readline(timeout)
+        if not line.endswith(b"\n"):
+            # Timeout. Responses of the other commands in flight can't be trusted anymore.
+            self._in_flight.popleft()
+            self._record(request, line, OUTCOME_TIMEOUT)
+            self._resolve(request, error=MountTimeoutError(request.cmdStr, timeout))
+            self._fail_in_flight(MountConnectionError())
+            connection._drain()
+            return
+        text = line[:-1].decode(_CMD_FORMATTING, "replace")
+        response_cmd = _response_cmd(text)
+        if response_cmd == _RESPONSE_ERROR:
+            self._in_flight.popleft()
+            self._record(request, line, OUTCOME_ERROR)
+            self._resolve(request, error=MountRejectedError(request.cmdStr))
+            return
+        if response_cmd is None:
+            # Most likely the response of the oldest command, garbled on the way
+            self._in_flight.popleft()
+            self._record(request, line, OUTCOME_ERROR)
+            self._resolve(request, error=MountConnectionError(text))
+            return
+        lost = next((i for i, pending in enumerate(self._in_flight) if pending.cmdStr == response_cmd), None)
+        if lost is None:
+            # Late response of a command that failed before
+            connection.recovery.skipped_lines += 1
+            return
+        # Commands before the answered one lost their responses
+        for _ in range(lost):
+            missed = self._in_flight.popleft()
+            self._record(missed, b"", OUTCOME_ERROR)
+            self._resolve(missed, error=MountConnectionError())
+        request = self._in_flight.popleft()
+        self._record(request, line, OUTCOME_OK)
+        self._resolve(request, text.split(" "))
+
+    def _record(self, request: _Request, line: bytes, outcome: str) -> None:
+        instrumentation = self.connection.instrumentation
+        if request.sent_at is not None and instrumentation is not None:
+            instrumentation.record(request.cmdStr, perf_counter() - request.sent_at, len(request.data), len(line), outcome)
+
+    def _fail_in_flight(self, error: Exception) -> None:
+        while len(self._in_flight) > 0:
+            self._resolve(self._in_flight.popleft(), error=error)
+
+    def _resolve(self, request: _Request, segments: List[str] = None, error: Exception = None) -> None:
+        for future in request.futures:
+            if error is None:
+                future.set_result(segments)
+            else:
+                future.set_exception(error)
+
+    def _send(self, cmdStr: str, args: Tuple, intCount: int = None) -> List[str]:
+        """Same recovery as MountConnection._send, around queued requests"""
+        connection = self.connection
+        attempts = 1 + (connection.query_retries if cmdStr in _QUERY_COMMANDS else 0)
+        for attempt in range(attempts):
+            try:
+                segments = self.submit(cmdStr, *args).result()
+                return segments if intCount is None else _parse_int_response(segments, intCount)
+            except MountConnectionError as e:
+                if not self._running or isinstance(e, MountRejectedError):
+                    raise
+                if cmdStr in _MOTION_COMMANDS and connection.motion_policy == MOTION_VERIFY:
+                    if _motion_took_effect(self, cmdStr, args):
+                        connection.recovery.verified += 1
+                        return [f"{_CMD_FIRST_CHAR}{cmdStr}"]
+                    connection.recovery.repeated += 1
+                    try:
+                        return self.submit(cmdStr, *args).result()
+                    except MountConnectionError:
+                        raise e
+                if attempt + 1 == attempts:
+                    raise
+                connection.recovery.retries += 1
+
+    def _sendCmd(self, cmdStr: str, *args) -> List[str]:
+        return self._send(cmdStr, args)
+
+    def _send_int_cmd(self, cmdStr: str, intCount: int, *args) -> Tuple:
+        return self._send(cmdStr, args, intCount)
+
+    def get_position(self) -> Tuple[int, int]:
+        return self._send_int_cmd(_CMD_STR_GET_POS, 2)
+
+    def set_position(self, posAx1: int, posAx2: int) -> None:
+        self._sendCmd(_CMD_STR_SET_POS, posAx1, posAx2)
+
+    def get_time(self) -> int:
+        return self._send_int_cmd(_CMD_STR_GET_TIME, 1)[0]
+
+    def set_time(self, time: int) -> None:
+        self._sendCmd(_CMD_STR_SET_TIME, time)
+
+    def goto(self, posAx1: int, posAx2: int) -> None:
+        self._sendCmd(_CMD_STR_GOTO, posAx1, posAx2)
+
+    def stop(self, instant: bool = False) -> None:
+        self._sendCmd(_CMD_STR_STOP, int(instant))
+
+    def get_cpr(self) -> Tuple[int, int]:
+        return self._send_int_cmd(_CMD_STR_GET_CPR, 2)
+
+    def get_protocol_version(self) -> int:
+        return self._send_int_cmd(_CMD_STR_GET_PROTOCOL_VERSION, 1)[0]
+
+    def get_track_buffer_free_space(self) -> int:
+        return self._send_int_cmd(_CMD_STR_GET_TRACK_BUFFER_FREE_SPACE, 1)[0]
+
+    def get_track_buffer_size(self) -> int:
+        return self._send_int_cmd(_CMD_STR_GET_TRACK_BUFFER_SIZE, 1)[0]
+
+    def clear_track_buffer(self) -> None:
+        self._sendCmd(_CMD_STR_TRACK_BUFFER_CLEAR)
+
+    def add_track_point(self, posAx1: int, posAx2: int, time: int) -> TrackPointAddResult:
+        return TrackPointAddResult(self._send_int_cmd(_CMD_STR_TRACK_POINT_ADD, 1, posAx1, posAx2, time)[0])
+
+    def add_track_points(self, points: Iterable[Tuple[int, int, int]], window: int = _TRACK_POINT_UPLOAD_WINDOW,
+                         free_space: int = None) -> List[TrackPointAddResult]:
+        """Queues track points at bulk priority, at most `window` at a time, see MountConnection.add_track_points"""
+        if window < 1:
+            raise ValueError("Upload window must be at least 1")
+        connection = self.connection
+        resync = connection.upload_policy == UPLOAD_RESYNC
+        if resync and free_space is None:
+            free_space = self.get_track_buffer_free_space()
+        results: List[TrackPointAddResult] = []
+        stored = 0
+        failures = 0
+        pending: Deque[Tuple[Tuple[int, int, int], Future]] = deque()
+        resend: Deque[Tuple[int, int, int]] = deque()
+        failed = False
+        points = iter(points)
+        while True:
+            while not failed and len(pending) < window:
+                point = resend.popleft() if len(resend) > 0 else next(points, None)
+                if point is None:
+                    break
+                pending.append((point, self.submit(_CMD_STR_TRACK_POINT_ADD, *point)))
+            if len(pending) == 0:
+                break
+            try:
+                result = TrackPointAddResult(_parse_int_response(pending[0][1].result(), 1)[0])
+            except (MountConnectionError, ValueError) as e:
+                failures += 1
+                if not resync or not self._running or isinstance(e, MountRejectedError) or failures > connection.query_retries:
+                    raise
+                # The free space query goes before queued bulk requests, so the pending points are settled first
+                for _, future in pending:
+                    future.exception()
+                current_free_space = self.get_track_buffer_free_space()
+                for _ in range(_stored_unconfirmed(free_space, current_free_space, stored, len(pending))):
+                    pending.popleft()
+                    results.append(TrackPointAddResult.OK)
+                    stored += 1
+                resend.extendleft(reversed([point for point, _ in pending]))
+                pending.clear()
+                if current_free_space == 0 and len(resend) > 0:
+                    results.append(TrackPointAddResult.BUFFER_FULL)
+                    failed = True
+                connection.recovery.upload_resyncs += 1
+                continue
+            pending.popleft()
+            failures = 0
+            results.append(result)
+            if result == TrackPointAddResult.OK:
+                stored += 1
+            else:
+                failed = True
+        return results
+
+    def tracking_start(self) -> None:
+        self._sendCmd(_CMD_STR_TRACKING_START)
+
+    def tracking_stop(self) -> None:
+        self._sendCmd(_CMD_STR_TRACKING_STOP)
+
+    def get_mount_status(self) -> MountStatus:
+        return MountStatus(self._send_int_cmd(_CMD_STR_GET_STATUS, 1)[0])
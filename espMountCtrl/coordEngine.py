@@ -0,0 +1,67 @@
+import numpy as np
+from typing import Tuple, Union
+
+ArrayLike = Union[float, np.ndarray]
+
+class CoordEngine:
+    """Closed-form conversion between local alt/az and mount axis coordinates.
+
+    The mount's first axis points to (ax_alt, ax_az), so in the mount's own frame an alt/az
+    direction is just an hour angle/declination at a fake location with latitude ax_alt. That
+    is a fixed spherical rotation, so it is precomputed once and then applied to whole arrays.
+    """
+    def __init__(self, ax_alt_deg: float, ax_az_deg: float):
+        self.ax_alt_deg = float(ax_alt_deg)
+        self.ax_az_deg = float(ax_az_deg)
+
+        lat = np.radians(self.ax_alt_deg)
+        az0 = np.radians(self.ax_az_deg)
+        s_lat, c_lat = np.sin(lat), np.cos(lat)
+        s_az0, c_az0 = np.sin(az0), np.cos(az0)
+        # Rotates (north, east, up) by -ax_az around the zenith
+        rot_az = np.array([
+            [c_az0, s_az0, 0.0],
+            [-s_az0, c_az0, 0.0],
+            [0.0, 0.0, 1.0]
+        ])
+        # (north, east, up) at latitude lat -> (cos(dec)cos(ha), cos(dec)sin(ha), sin(dec))
+        rot_lat = np.array([
+            [-s_lat, 0.0, c_lat],
+            [0.0, -1.0, 0.0],
+            [c_lat, 0.0, s_lat]
+        ])
+        self._altaz_to_hadec = rot_lat @ rot_az
+        self._hadec_to_altaz = self._altaz_to_hadec.T
+
+    def altaz_to_hadec(self, alt: ArrayLike, az: ArrayLike) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns mount hour angle in [0, 360) and declination in [-90, 90], all in degrees"""
+        alt = np.radians(alt)
+        az = np.radians(az)
+        c_alt = np.cos(alt)
+        vec = np.stack((c_alt * np.cos(az), c_alt * np.sin(az), np.sin(alt)))
+        x, y, z = np.tensordot(self._altaz_to_hadec, vec, axes=1)
+        ha = np.degrees(np.arctan2(y, x)) % 360.0
+        dec = np.degrees(np.arcsin(np.clip(z, -1.0, 1.0)))
+        return ha, dec
+
+    def hadec_to_altaz(self, ha: ArrayLike, dec: ArrayLike) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns altitude and azimuth in [0, 360), in degrees. Declinations beyond the pole fold over naturally."""
+        ha = np.radians(ha)
+        dec = np.radians(dec)
+        c_dec = np.cos(dec)
+        vec = np.stack((c_dec * np.cos(ha), c_dec * np.sin(ha), np.sin(dec)))
+        n, e, u = np.tensordot(self._hadec_to_altaz, vec, axes=1)
+        alt = np.degrees(np.arcsin(np.clip(u, -1.0, 1.0)))
+        az = np.degrees(np.arctan2(e, n)) % 360.0
+        return alt, az
+
+    def altaz_to_mount_pos(self, alt: ArrayLike, az: ArrayLike, cpr_ra: int, cpr_dec: int) -> Tuple[np.ndarray, np.ndarray]:
+        ha, dec = self.altaz_to_hadec(alt, az)
+        ax1 = np.rint(((ha + 180.0) % 360.0) / 360.0 * cpr_ra).astype(np.int64)
+        ax2 = np.rint(dec / 360.0 * cpr_dec).astype(np.int64)
+        return ax1, ax2
+
+    def mount_pos_to_altaz(self, ax1: ArrayLike, ax2: ArrayLike, cpr_ra: int, cpr_dec: int) -> Tuple[np.ndarray, np.ndarray]:
+        ha = np.asarray(ax1, dtype=np.float64) * 360.0 / cpr_ra - 180.0
+        dec = np.asarray(ax2, dtype=np.float64) * 360.0 / cpr_dec
+        return self.hadec_to_altaz(ha, dec)
@@ -0,0 +1,287 @@
+"""Long-running mount session served over a local Unix socket.
+
+The daemon keeps the mount connected and calibrated, and the satellite catalogue, timescale and
+transit cache loaded, so that requests are answered in milliseconds instead of paying the start-up
+cost of a fresh process. The protocol is JSON lines: every request is one object with a "cmd" key
+(plus its arguments), every response is {"ok": true, "result": ...} or {"ok": false, "error": "..."}.
+An "id" given in the request is copied to its response.
+
+Only the standard library is imported at module level, so that clients start fast.
+"""
+from typing import Any, Callable, Dict
+import json
+import os
+import socket
+import socketserver
+import tempfile
+import threading
+
+_ENVVAR_SOCKET = "ESP_MOUNT_SOCKET"
+
+def default_socket_path() -> str:
+    """Socket from ESP_MOUNT_SOCKET, or a per-user one in the temporary directory"""
+    path = os.getenv(_ENVVAR_SOCKET)
+    if path is None:
+        uid = os.getuid() if hasattr(os, "getuid") else 0
+        path = os.path.join(tempfile.gettempdir(), f"espmount-{uid}.sock")
+    return path
+
+class DaemonError(Exception):
+    """The daemon has refused or failed a request"""
+
+class MountSession:
+    """Executes requests against one mount, shared by the daemon and the command-line tool.
+
+    `handle` takes a request dict and returns a JSON serializable result. Heavy modules are only
+    imported by the handlers, on first use. Handlers that move the mount or replace the track
+    streamer are serialized, the daemon runs every client on its own thread. Waiting for a slew
+    to end happens outside the lock, so that a stop request isn't held up by it. Transit searches
+    are serialized by a lock of their own, so that they don't hold up motion commands either.
+    """
+    def __init__(self, mount):
+        self.mount = mount
+        self._tracker = None
+        self._streamer = None
+        self._lock = threading.RLock()
+        # Tracker creation and transit searches, which share the catalogue and transit cache
+        self._search_lock = threading.RLock()
+        self._handlers: Dict[str, Callable[[Dict[str, Any]], Any]] = {
+            "ping": self._ping,
+            "status": self._status,
+            "goto": self._goto,
+            "stop": self._stop,
+            "calibrate": self._calibrate,
+            "track-file": self._track_file,
+            "find-transits": self._find_transits,
+        }
+
+    @property
+    def commands(self):
+        return list(self._handlers)
+
+    def handle(self, request: Dict[str, Any]) -> Any:
+        handler = self._handlers.get(request.get("cmd"))
+        if handler is None:
+            raise DaemonError(f"Unknown command: {request.get('cmd')}")
+        return handler(request)
+
+    @property
+    def streamer(self):
+        """TrackStreamer of the track being streamed, None if there is none"""
+        return self._streamer
+
+    def tracker(self):
+        with self._search_lock:
+            if self._tracker is None:
+                from .satellites import SatelliteTracker
+                self._tracker = SatelliteTracker(self.mount)
+            return self._tracker
+
+    def _coord(self, request: Dict[str, Any]):
+        import astropy.units as u
+        if "alt" in request and "az" in request:
+            return self.mount.local_altaz(float(request["alt"]) * u.deg, float(request["az"]) * u.deg)
+        if "ra" in request and "dec" in request:
+            return self.mount.local_radec(float(request["ra"]) * u.deg, float(request["dec"]) * u.deg)
+        raise DaemonError("Position needs either alt and az, or ra and dec (degrees)")
+
+    def _ping(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        return {"pid": os.getpid()}
+
+    def _status(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        mount = self.mount
+        ax1, ax2 = mount.mountConnection.get_position()
+        status = mount.get_status()
+        alt, az = mount._coordEngine.mount_pos_to_altaz(ax1, ax2, mount.cprRa, mount.cprDec)
+        result = {
+            "status": status.name,
+            "ax1": ax1,
+            "ax2": ax2,
+            "alt": float(alt),
+            "az": float(az),
+            "mount_time_ms": mount.mountConnection.get_time(),
+        }
+        streamer = self._streamer
+        if streamer is not None:
+            result["track_stream"] = {"running": streamer.is_running(), "stats": str(streamer.stats)}
+        return result
+
+    def _goto(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        coord = self._coord(request)
+        with self._lock:
+            self._stop_streamer()
+            self.mount.goto(coord)
+            ax1, ax2 = self.mount._goto_target
+        if request.get("wait", False):
+            self.mount.wait_for_stop()
+        return {"ax1": ax1, "ax2": ax2}
+
+    def _stop(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            self._stop_streamer()
+            self.mount.stop()
+        if request.get("wait", False):
+            self.mount.wait_for_stop()
+        return {}
+
+    def _calibrate(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Sets the axis counts so that the mount's current pointing is the given position"""
+        coord = self._coord(request)
+        with self._lock:
+            self.mount.calibrate_ant_coord(coord)
+            ax1, ax2 = self.mount.mountConnection.get_position()
+        return {"ax1": ax1, "ax2": ax2}
+
+    def _track_file(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Tracks a binary track file or a CSV saved by TrackPath.to_csv. Tracks longer than the mount buffer are streamed."""
+        from .trackFile import TrackFile, is_track_file
+        from .trackPath import TrackPath
+        if is_track_file(request["path"]):
+            path = TrackFile(request["path"])
+            path.check_mount(self.mount)
+        else:
+            path = TrackPath.from_csv(request["path"], self.mount.location)
+            if not path.has_mount_pos:
+                path = path.with_mount_pos(self.mount)
+        with self._lock:
+            self._stop_streamer()
+            if len(path) <= self.mount.mountConnection.get_track_buffer_size():
+                self.mount.track(path)
+                return {"points": len(path), "streamed": False}
+            self._streamer = self.mount.track_stream(path)
+            return {"points": len(path), "streamed": True}
+
+    def _find_transits(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        with self._search_lock:
+            return self._search_transits(request)
+
+    def _search_transits(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        import astropy.units as u
+        from astropy.time import Time
+        from .satellites import SatelliteFinder
+        if "norad" in request:
+            norad = int(request["norad"])
+            sats = SatelliteFinder.fromCatalogueNumber(norad, offline=True) or SatelliteFinder.fromCatalogueNumber(norad, reload=False)
+        elif "name" in request:
+            sats = SatelliteFinder.fromName(request["name"], offline=True) or SatelliteFinder.fromName(request["name"], reload=False)
+        else:
+            raise DaemonError("Satellite needs either norad or name")
+        if len(sats) == 0:
+            raise DaemonError("Satellite not found")
+        sat = sats[0]
+        t0 = Time.now()
+        transits = self.tracker().find_transits(sat, t0 + float(request.get("hours", 24)) * u.hour,
+                                                float(request.get("min_elev", 10)) * u.deg, t0)
+        return {
+            "satellite": sat.name,
+            "transits": [{
+                "rise": transit.time_rise.isot,
+                "culmination": transit.time_culm.isot,
+                "set": transit.time_set.isot,
+                "max_elev": float(transit.max_elev_altaz.alt.deg),
+            } for transit in transits],
+        }
+
+    def _stop_streamer(self) -> None:
+        if self._streamer is not None:
+            self._streamer.stop()
+            self._streamer = None
+
+    def close(self) -> None:
+        with self._lock:
+            self._stop_streamer()
+            self.mount.disconnect()
+
+def _execute(session: MountSession, request: Dict[str, Any]) -> Dict[str, Any]:
+    try:
+        response = {"ok": True, "result": session.handle(request)}
+    except Exception as e:
+        response = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+    if "id" in request:
+        response["id"] = request["id"]
+    return response
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        server: MountDaemon = self.server
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise ValueError("Request has to be a JSON object")
+            except ValueError as e:
+                self._send({"ok": False, "error": f"Invalid request: {e}"})
+                continue
+            if request.get("cmd") == "shutdown":
+                self._send({"ok": True, "result": {}})
+                # shutdown() waits for serve_forever, which runs on another thread
+                threading.Thread(target=server.shutdown, daemon=True).start()
+                return
+            self._send(_execute(server.session, request))
+
+    def _send(self, response: Dict[str, Any]) -> None:
+        self.wfile.write(json.dumps(response).encode() + b"\n")
+        self.wfile.flush()
+
+class MountDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Serves a MountSession on a Unix socket, every client connection on its own thread.
+    The "shutdown" request stops the server."""
+    daemon_threads = True
+
+    def __init__(self, session: MountSession, socket_path: str = None):
+        self.session = session
+        self.socket_path = default_socket_path() if socket_path is None else socket_path
+        if os.path.exists(self.socket_path):
+            if is_running(self.socket_path):
+                raise DaemonError(f"Daemon already running at {self.socket_path}")
+            # Left behind by a daemon that didn't exit cleanly
+            os.unlink(self.socket_path)
+        super().__init__(self.socket_path, _RequestHandler)
+        os.chmod(self.socket_path, 0o600)
+
+    def server_close(self) -> None:
+        super().server_close()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+class DaemonClient:
+    """Connection to a running daemon, reused for any number of requests"""
+    def __init__(self, socket_path: str = None, timeout: float = None):
+        self.socket_path = default_socket_path() if socket_path is None else socket_path
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.settimeout(timeout)
+        self._sock.connect(self.socket_path)
+        self._file = self._sock.makefile("rb")
+        self._lock = threading.Lock()
+
+    def request(self, cmd: str, **args) -> Any:
+        """Sends one request and returns its result. Raises DaemonError if it failed."""
+        with self._lock:
+            self._sock.sendall(json.dumps({"cmd": cmd, **args}).encode() + b"\n")
+            line = self._file.readline()
+        if not line:
+            raise DaemonError("Daemon closed the connection")
+        response = json.loads(line)
+        if not response.get("ok"):
+            raise DaemonError(response.get("error"))
+        return response.get("result")
+
+    def close(self) -> None:
+        self._file.close()
+        self._sock.close()
+
+    def __enter__(self) -> "DaemonClient":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+def is_running(socket_path: str = None) -> bool:
+    try:
+        with DaemonClient(socket_path, timeout=1.0) as client:
+            client.request("ping")
+        return True
+    except (OSError, ValueError, DaemonError):
+        return False
@@ -1,2 +1,14 @@
+from importlib import import_module
 from .trackGui import TrackGUI
-from .matplotlibTrackGui import MatplotlibTrackGUI
\ No newline at end of file
+
+# Matplotlib is imported only once the GUI is actually used
+_LAZY_EXPORTS = {
+    "MatplotlibTrackGUI": ".matplotlibTrackGui",
+}
+
+def __getattr__(name: str):
+    if name in _LAZY_EXPORTS:
+        value = getattr(import_module(_LAZY_EXPORTS[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -2,28 +2,65 @@ import numpy as np
 
 from espMountCtrl.mountConnection import MountStatus
 from .trackGui import TrackGUI
-from ..mount import Mount, TrackPoint
+from ..mount import Mount, TrackPoint, TrackPath, Track
 from matplotlib import pyplot as plt
 import math
-from typing import Callable
+from time import monotonic
+from typing import Callable, List
 from astropy.coordinates import SkyCoord
+import astropy.units as u
+
+_DEFAULT_FPS = 10.0
+# Maximum number of plotted samples per line, longer history is decimated
+_DEFAULT_POINT_BUDGET = 2000
+# Headroom added when the tracking error leaves the current y range
+_ERROR_YLIM_MARGIN = 1.5
+
+def minmax_decimate(y: np.ndarray, budget: int) -> np.ndarray:
+    """Returns indices of samples to plot, keeping the minimum and maximum of each of budget/2 buckets.
+
+    Peaks stay visible no matter how long the history is, and the indices stay in time order.
+    """
+    n = len(y)
+    if n <= budget:
+        return np.arange(n)
+    buckets = budget // 2
+    edges = np.linspace(0, n, buckets + 1).astype(np.int64)
+    width = int(math.ceil(n / buckets))
+    # Pad into a (buckets, width) matrix so that the extremes of all buckets are found at once
+    idx = edges[:-1, None] + np.arange(width)[None, :]
+    valid = idx < edges[1:, None]
+    idx = np.minimum(idx, n - 1)
+    values = y[idx]
+    rows = np.arange(buckets)
+    i_min = idx[rows, np.argmin(np.where(valid, values, np.inf), axis=1)]
+    i_max = idx[rows, np.argmax(np.where(valid, values, -np.inf), axis=1)]
+    return np.unique(np.concatenate((i_min, i_max, [n - 1])))
 
 class MatplotlibTrackGUI(TrackGUI):
-    def __init__(self, mount: Mount, points: TrackPoint):
+    """Plots the expected track together with the mount position and tracking error.
+
+    With `blit` enabled only the "Mount" artists are redrawn on each frame, over a cached
+    background. Frames are rendered at `fps`, independently of the telemetry polling rate, and
+    plotted history is decimated to `point_budget` samples per line.
+    """
+    def __init__(self, mount: Mount, points: Track, blit: bool = True, fps: float = _DEFAULT_FPS, point_budget: int = _DEFAULT_POINT_BUDGET):
         self.mount = mount
-        self.points = points
+        self.points = TrackPath.of(points)
+        self.blit = blit
+        self.fps = fps
+        self.point_budget = point_budget
 
         self.alts_real = np.array([], dtype=np.float64)
         self.azs_real = np.array([], dtype=np.float64)
         self.times_real = np.array([], dtype=np.float64)
         self.show_launched = False
-    
+
     def show(self) -> None:
         plt.ion()
 
-        self.alts_sim = np.fromiter([point.coord.alt.deg for point in self.points], dtype=np.float64)
-        self.azs_sim = np.fromiter([point.coord.az.deg for point in self.points], dtype=np.float64)
-        self.times = np.array([point.t.unix for point in self.points], dtype=np.float64)
+        self.alts_sim, self.azs_sim = self.points.altaz(self.mount)
+        self.times = self.points.times_ms / 1000
 
         self.fig_altaz, self.ax_altaz = plt.subplots(subplot_kw={"projection":"polar"})
         self.ax_altaz.plot(self.azs_sim * math.pi / 180, self.alts_sim, label="Expected")
@@ -33,65 +70,157 @@ class MatplotlibTrackGUI(TrackGUI):
         self.ax_altaz.set_rticks(range(0, 91, 20))
         self.ax_altaz.invert_yaxis()
         self.ax_altaz.grid(True)
-
         self.ax_altaz.set_title("Transit prediction - altaz")
-        self.ax_altaz.legend()
-
-        self.fig_alt = plt.figure()
-        plt.plot(self.times, self.alts_sim, label="Expected")
-        plt.title("Altitude")
-        plt.legend()
-        self.ticks_alt = plt.xticks()
-
-        self.fig_az = plt.figure()
-        plt.plot(self.times, self.azs_sim, label="Expected")
-        plt.title("Azimuth")
-        plt.legend()
-        self.ticks_az = plt.xticks()
+
+        self.fig_alt, self.ax_alt = plt.subplots()
+        self.ax_alt.plot(self.times, self.alts_sim, label="Expected")
+        self.ax_alt.set_title("Altitude")
+
+        self.fig_az, self.ax_az = plt.subplots()
+        self.ax_az.plot(self.times, self.azs_sim, label="Expected")
+        self.ax_az.set_title("Azimuth")
+
+        self.fig_err, self.ax_err = plt.subplots()
+        self.ax_err.axhline(0, color="gray", linewidth=0.5)
+        self.ax_err.set_title("Tracking error")
+        self.ax_err.set_ylabel("arcmin")
+        self.ax_err.set_xlim(self.times[0], self.times[-1])
+        self.ax_err.set_ylim(-1, 1)
+
+        # Limits are fixed, so that the cached backgrounds stay valid while data is added
+        for ax in (self.ax_alt, self.ax_az):
+            ax.set_xlim(self.times[0], self.times[-1])
+            ax.set_autoscale_on(False)
+
+        animated = self._can_blit()
+        self.graph_altaz = self.ax_altaz.plot([], [], label="Mount", animated=animated)[0]
+        self.graph_alt = self.ax_alt.plot([], [], label="Mount", animated=animated)[0]
+        self.graph_az = self.ax_az.plot([], [], label="Mount", animated=animated)[0]
+        self.graph_err_alt = self.ax_err.plot([], [], label="Altitude", animated=animated)[0]
+        self.graph_err_az = self.ax_err.plot([], [], label="Azimuth (on sky)", animated=animated)[0]
+        for ax in (self.ax_altaz, self.ax_alt, self.ax_az, self.ax_err):
+            ax.legend()
+
+        self._backgrounds = {}
+        for fig in self._figures():
+            fig.canvas.mpl_connect("draw_event", self._on_draw)
         plt.draw()
-    
-        plt.figure(self.fig_altaz)
-        self.graph_altaz = plt.plot(self.azs_real, self.alts_real, label="Mount")[0]
-        plt.legend()
-
-        plt.figure(self.fig_alt)
-        self.graph_alt = plt.plot(self.times_real, self.alts_real, label="Mount")[0]
-        plt.legend()
-
-        plt.figure(self.fig_az)
-        self.graph_az = plt.plot(self.times_real, self.azs_real, label="Mount")[0]
-        plt.legend()
-    
+        plt.pause(0.01)
+        self.show_launched = True
+
+    def _figures(self) -> List:
+        return [self.fig_altaz, self.fig_alt, self.fig_az, self.fig_err]
+
+    def _axes_artists(self) -> List:
+        return [
+            (self.fig_altaz, self.ax_altaz, [self.graph_altaz]),
+            (self.fig_alt, self.ax_alt, [self.graph_alt]),
+            (self.fig_az, self.ax_az, [self.graph_az]),
+            (self.fig_err, self.ax_err, [self.graph_err_alt, self.graph_err_az]),
+        ]
+
+    def _can_blit(self) -> bool:
+        return self.blit and self.fig_alt.canvas.supports_blit
+
+    def _on_draw(self, event) -> None:
+        # Full redraw (first show, resize, new limits) - cache the background without the animated artists
+        for fig, ax, artists in self._axes_artists():
+            if fig.canvas is event.canvas:
+                self._backgrounds[id(ax)] = fig.canvas.copy_from_bbox(ax.bbox)
+                for artist in artists:
+                    ax.draw_artist(artist)
+
+    def _tracking_error(self, times: np.ndarray, alts: np.ndarray, azs: np.ndarray):
+        """Returns (alt error, on-sky az error) in arcmin against the expected track"""
+        alt_expected = np.interp(times, self.times, self.alts_sim)
+        az_expected = np.degrees(np.unwrap(np.radians(self.azs_sim)))
+        az_expected = np.interp(times, self.times, az_expected)
+        err_alt = (alts - alt_expected) * 60
+        err_az = ((azs - az_expected + 180) % 360 - 180) * np.cos(np.radians(alts)) * 60
+        return err_alt, err_az
+
+    def _update_artists(self) -> bool:
+        """Sets decimated data of the mount artists. Returns True when axes limits changed and full redraw is needed."""
+        idx_alt = minmax_decimate(self.alts_real, self.point_budget)
+        idx_az = minmax_decimate(self.azs_real, self.point_budget)
+        self.graph_altaz.set_data(self.azs_real[idx_alt] * math.pi / 180, self.alts_real[idx_alt])
+        self.graph_alt.set_data(self.times_real[idx_alt], self.alts_real[idx_alt])
+        self.graph_az.set_data(self.times_real[idx_az], self.azs_real[idx_az])
+
+        relimit = False
+        for ax, values in ((self.ax_alt, self.alts_real), (self.ax_az, self.azs_real)):
+            low, high = ax.get_ylim()
+            if values.min() < low or values.max() > high:
+                low, high = min(values.min(), low), max(values.max(), high)
+                ax.set_ylim(low - (high - low) * 0.05, high + (high - low) * 0.05)
+                relimit = True
+
+        in_track = (self.times_real >= self.times[0]) & (self.times_real <= self.times[-1])
+        times = self.times_real[in_track]
+        if len(times) == 0:
+            return relimit
+        err_alt, err_az = self._tracking_error(times, self.alts_real[in_track], self.azs_real[in_track])
+        idx = minmax_decimate(err_alt, self.point_budget)
+        self.graph_err_alt.set_data(times[idx], err_alt[idx])
+        idx = minmax_decimate(err_az, self.point_budget)
+        self.graph_err_az.set_data(times[idx], err_az[idx])
+
+        low, high = self.ax_err.get_ylim()
+        err_max = max(np.abs(err_alt).max(), np.abs(err_az).max())
+        if err_max > high or -err_max < low:
+            self.ax_err.set_ylim(-err_max * _ERROR_YLIM_MARGIN, err_max * _ERROR_YLIM_MARGIN)
+            relimit = True
+        return relimit
+
+    def _render(self) -> None:
+        relimit = self._update_artists()
+        if not self._can_blit() or relimit or len(self._backgrounds) < len(self._figures()):
+            for fig in self._figures():
+                fig.canvas.draw_idle()
+            plt.pause(0.001)
+            return
+        for fig, ax, artists in self._axes_artists():
+            fig.canvas.restore_region(self._backgrounds[id(ax)])
+            for artist in artists:
+                ax.draw_artist(artist)
+            fig.canvas.blit(ax.bbox)
+            fig.canvas.flush_events()
+
     def loop(self, loopCallback: Callable[[SkyCoord, float], None] = None) -> None:
         if not self.show_launched:
             self.show()
-        
-        while self.mount.get_status() != MountStatus.STOPPED:
-            time = self.mount.time
-            pos = self.mount.get_position().transform_to("altaz")
-            self.times_real = np.append(self.times_real, [time.unix])
-            self.alts_real = np.append(self.alts_real, [pos.alt.deg])
-            self.azs_real = np.append(self.azs_real, [pos.az.deg])
-            
-            plt.figure(self.fig_altaz)
-            self.graph_altaz.set_xdata(self.azs_real * math.pi / 180)
-            self.graph_altaz.set_ydata(self.alts_real)
-            plt.draw()
-
-            plt.figure(self.fig_alt)
-            self.graph_alt.set_xdata(self.times_real)
-            self.graph_alt.set_ydata(self.alts_real)
-            plt.xticks(self.ticks_alt[0], self.ticks_alt[1])
-            plt.draw()
-            plt.figure(self.fig_az)
-            self.graph_az.set_xdata(self.times_real)
-            self.graph_az.set_ydata(np.array(self.azs_real))
-            plt.xticks(self.ticks_az[0], self.ticks_az[1])
-            plt.draw()
-
-            plt.pause(0.01)
-
-            if not loopCallback is None:
-                # Number, where values 0 to 1 signalize time part of the transit
-                transit_part = (time.unix - self.times[0]) / (self.times[-1] - self.times[0])
-                loopCallback(pos, transit_part)
\ No newline at end of file
+
+        # Samples come from the mount's telemetry, started here if nobody else runs it
+        telemetry = self.mount.telemetry
+        own_telemetry = telemetry is None or not telemetry.is_running()
+        if own_telemetry:
+            telemetry = self.mount.start_telemetry()
+        first_sample = telemetry.buffer.count
+        frame_period = 1.0 / self.fps
+        try:
+            sample = telemetry.wait_for_sample(first_sample)
+            while sample is not None and sample.status != MountStatus.STOPPED:
+                if not telemetry.is_running():
+                    if telemetry.error is not None:
+                        raise telemetry.error
+                    # Stopped by someone else, there are no new samples to show
+                    break
+                frame_start = monotonic()
+                times_ms, self.alts_real, self.azs_real = telemetry.altaz(first_sample)
+                self.times_real = times_ms / 1000
+                self._render()
+
+                if not loopCallback is None:
+                    pos = self.mount.local_altaz(self.alts_real[-1] * u.deg, self.azs_real[-1] * u.deg)
+                    # Number, where values 0 to 1 signalize time part of the transit
+                    transit_part = (self.times_real[-1] - self.times[0]) / (self.times[-1] - self.times[0])
+                    loopCallback(pos, transit_part)
+
+                # Keep the windows responsive until the next frame, without redrawing them
+                remaining = frame_period - (monotonic() - frame_start)
+                if remaining > 0:
+                    self.fig_alt.canvas.start_event_loop(remaining)
+                sample = telemetry.latest
+        finally:
+            if own_telemetry:
+                self.mount.stop_telemetry()
@@ -1,6 +1,7 @@
 from abc import ABC, abstractclassmethod
-from typing import Callable
-from astropy.coordinates import SkyCoord
+from typing import Callable, TYPE_CHECKING
+if TYPE_CHECKING:
+    from astropy.coordinates import SkyCoord
 
 class TrackGUI(ABC):
 
@@ -9,5 +10,5 @@ class TrackGUI(ABC):
         pass
 
     @abstractclassmethod
-    def loop(self, loopCallback: Callable[[SkyCoord, float], None]) -> None:
+    def loop(self, loopCallback: Callable[["SkyCoord", float], None]) -> None:
         pass
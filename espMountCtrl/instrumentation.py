@@ -0,0 +1,181 @@
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+from time import perf_counter
+import logging
+import threading
+
+# Upper bounds of the round trip latency histogram buckets, the last bucket is unbounded
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+OUTCOME_OK = "ok"
+OUTCOME_TIMEOUT = "timeout"
+OUTCOME_ERROR = "error"
+
+_logger = logging.getLogger(__name__)
+
+@dataclass
+class CommandRecord:
+    cmdStr: str
+    latency_s: float        # From writing the command to reading its response (or giving up)
+    bytes_sent: int
+    bytes_received: int
+    outcome: str            # OUTCOME_OK, OUTCOME_TIMEOUT or OUTCOME_ERROR
+
+@dataclass
+class CommandStats:
+    calls: int = 0
+    bytes_sent: int = 0
+    bytes_received: int = 0
+    timeouts: int = 0
+    errors: int = 0
+    total_latency_s: float = 0.0
+    max_latency_s: float = 0.0
+    # Counts per LATENCY_BUCKETS_MS bucket, plus one for slower responses
+    latency_histogram: List[int] = field(default_factory=lambda: [0] * (len(LATENCY_BUCKETS_MS) + 1))
+
+    @property
+    def mean_latency_s(self) -> float:
+        return 0.0 if self.calls == 0 else self.total_latency_s / self.calls
+
+    def latency_percentile_ms(self, q: float) -> float:
+        """Upper bound of the histogram bucket holding the q-th (0 - 1) latency quantile, inf for the last bucket"""
+        target = q * self.calls
+        count = 0
+        for i, bucket_count in enumerate(self.latency_histogram):
+            count += bucket_count
+            if count >= target and count > 0:
+                return float(LATENCY_BUCKETS_MS[i]) if i < len(LATENCY_BUCKETS_MS) else float("inf")
+        return 0.0
+
+    def add(self, record: CommandRecord) -> None:
+        self.calls += 1
+        self.bytes_sent += record.bytes_sent
+        self.bytes_received += record.bytes_received
+        if record.outcome == OUTCOME_TIMEOUT:
+            self.timeouts += 1
+        elif record.outcome == OUTCOME_ERROR:
+            self.errors += 1
+        self.total_latency_s += record.latency_s
+        self.max_latency_s = max(self.max_latency_s, record.latency_s)
+        self.latency_histogram[bisect_left(LATENCY_BUCKETS_MS, record.latency_s * 1000)] += 1
+
+    def __str__(self) -> str:
+        return (f"calls: {self.calls}, sent: {self.bytes_sent} B, received: {self.bytes_received} B, "
+                f"latency: mean {round(self.mean_latency_s * 1000, 2)} ms, p95 <= {self.latency_percentile_ms(0.95)} ms, "
+                f"max {round(self.max_latency_s * 1000, 2)} ms, timeouts: {self.timeouts}, errors: {self.errors}")
+
+def _format_table(stats: Dict[str, CommandStats]) -> str:
+    return "\n".join(f"{cmdStr:<5} {command_stats}" for cmdStr, command_stats in sorted(stats.items()))
+
+class Instrumentation:
+    """Per command statistics of a mount connection.
+
+    Attached to a connection as its `instrumentation`, None (the default) disables it, leaving just
+    an attribute check per command. Every finished command is also passed to subscribers.
+    """
+    def __init__(self):
+        self.stats: Dict[str, CommandStats] = {}
+        self._subscribers: List[Callable[[CommandRecord], None]] = []
+        self._lock = threading.Lock()
+
+    def record(self, cmdStr: str, latency_s: float, bytes_sent: int, bytes_received: int, outcome: str = OUTCOME_OK) -> None:
+        record = CommandRecord(cmdStr, latency_s, bytes_sent, bytes_received, outcome)
+        with self._lock:
+            command_stats = self.stats.get(cmdStr)
+            if command_stats is None:
+                command_stats = self.stats[cmdStr] = CommandStats()
+            command_stats.add(record)
+        for callback in list(self._subscribers):
+            callback(record)
+
+    def subscribe(self, callback: Callable[[CommandRecord], None]) -> Callable[[], None]:
+        """Calls `callback` for every finished command. Returns a function that unsubscribes it."""
+        self._subscribers.append(callback)
+        return lambda: self._subscribers.remove(callback)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.stats = {}
+
+    def log_commands(self, logger: logging.Logger = _logger, level: int = logging.DEBUG) -> Callable[[], None]:
+        """Logs every command as it finishes. Returns a function that stops the logging."""
+        def log(record: CommandRecord) -> None:
+            logger.log(level, "+%s %s in %.2f ms (%d B sent, %d B received)",
+                       record.cmdStr, record.outcome, record.latency_s * 1000, record.bytes_sent, record.bytes_received)
+        return self.subscribe(log)
+
+    def log_summary(self, logger: logging.Logger = _logger, level: int = logging.INFO) -> None:
+        with self._lock:
+            for cmdStr, command_stats in sorted(self.stats.items()):
+                logger.log(level, "+%s %s", cmdStr, command_stats)
+
+    def prometheus_text(self, prefix: str = "espmount") -> str:
+        """Statistics in the Prometheus text exposition format"""
+        lines = []
+        counters = [
+            ("commands_total", "Commands sent", lambda s: s.calls),
+            ("bytes_sent_total", "Bytes written to the mount", lambda s: s.bytes_sent),
+            ("bytes_received_total", "Bytes read from the mount", lambda s: s.bytes_received),
+            ("timeouts_total", "Commands without a response in time", lambda s: s.timeouts),
+            ("errors_total", "Commands with an unexpected response", lambda s: s.errors),
+        ]
+        with self._lock:
+            stats = sorted(self.stats.items())
+            for name, help_text, value in counters:
+                lines.append(f"# HELP {prefix}_{name} {help_text}")
+                lines.append(f"# TYPE {prefix}_{name} counter")
+                for cmdStr, command_stats in stats:
+                    lines.append(f'{prefix}_{name}{{command="{cmdStr}"}} {value(command_stats)}')
+
+            name = f"{prefix}_command_latency_seconds"
+            lines.append(f"# HELP {name} Round trip time of commands")
+            lines.append(f"# TYPE {name} histogram")
+            for cmdStr, command_stats in stats:
+                cumulative = 0
+                for bound, count in zip(list(LATENCY_BUCKETS_MS) + [None], command_stats.latency_histogram):
+                    cumulative += count
+                    le = "+Inf" if bound is None else repr(bound / 1000)
+                    lines.append(f'{name}_bucket{{command="{cmdStr}",le="{le}"}} {cumulative}')
+                lines.append(f'{name}_sum{{command="{cmdStr}"}} {command_stats.total_latency_s}')
+                lines.append(f'{name}_count{{command="{cmdStr}"}} {command_stats.calls}')
+        return "\n".join(lines) + "\n"
+
+    def profile(self) -> "Profile":
+        return Profile(self)
+
+    def __str__(self) -> str:
+        with self._lock:
+            return _format_table(self.stats)
+
+class Profile:
+    """Context manager collecting statistics of the commands sent within its block"""
+    def __init__(self, instrumentation: Instrumentation):
+        self.instrumentation = instrumentation
+        self.stats: Dict[str, CommandStats] = {}
+        self.elapsed_s = 0.0
+        self._unsubscribe: Optional[Callable[[], None]] = None
+        self._start = 0.0
+
+    def _add(self, record: CommandRecord) -> None:
+        command_stats = self.stats.get(record.cmdStr)
+        if command_stats is None:
+            command_stats = self.stats[record.cmdStr] = CommandStats()
+        command_stats.add(record)
+
+    def __enter__(self) -> "Profile":
+        self._unsubscribe = self.instrumentation.subscribe(self._add)
+        self._start = perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.elapsed_s = perf_counter() - self._start
+        self._unsubscribe()
+
+    @property
+    def commands_per_second(self) -> float:
+        calls = sum(command_stats.calls for command_stats in self.stats.values())
+        return 0.0 if self.elapsed_s == 0 else calls / self.elapsed_s
+
+    def __str__(self) -> str:
+        return f"{round(self.elapsed_s, 3)} s, {round(self.commands_per_second, 1)} commands/s\n{_format_table(self.stats)}"
@@ -1,25 +1,37 @@
-from dataclasses import dataclass
-from .mountConnection import MountConnection, MountStatus
-from astropy.coordinates import SkyCoord, EarthLocation, AltAz, Angle, BaseRADecFrame
+from .mountConnection import MountConnection, MountStatus, TrackPointAddResult
+from .coordEngine import CoordEngine
+from .trackStreamer import TrackStreamer
+from .trackPath import TrackPoint, TrackPath
+from .trackFile import TrackFile
+from .clockSync import ClockSync, host_time_ms, sync_clock, measure_clock, sync_clock_async
+from .asyncMountConnection import AsyncMountConnection
+from .commandMultiplexer import MountMultiplexer
+from .telemetry import Telemetry, _DEFAULT_RATE_HZ, _DEFAULT_CAPACITY
+from .instrumentation import Instrumentation, Profile
+from .slewWatcher import SlewWatcher
+from astropy.coordinates import SkyCoord, EarthLocation, AltAz, BaseRADecFrame
 import astropy.units as u
 from astropy.units import Quantity
 from astropy.time import Time
-from typing import Iterable, Tuple, Callable, Union
-from time import sleep
+from typing import Iterable, Iterator, Tuple, Callable, Union, Optional
+from contextlib import contextmanager
 import math
-import alive_progress
+import numpy as np
 
 _MOUNT_REFRESH_INTERVAL = 0.5
-@dataclass
-class TrackPoint:
-    coord: SkyCoord
-    t: Time
+Track = Union[TrackPath, SkyCoord, TrackFile, Iterable[TrackPoint]]
 
 class Mount:
     def __init__(self, axCoord: SkyCoord):
         self.axCoord = axCoord
         self.mountConnection = MountConnection()
-        self._time_offset = 0
+        self._time_offset_ms = 0.0
+        self.clock_sync: ClockSync = None
+        self.telemetry: Telemetry = None
+        # Used instead of mountConnection by the *_async methods, after connect_async
+        self.asyncConnection: AsyncMountConnection = None
+        # Axis counts of the last goto, for estimating when the slew ends. None once it can't be the target anymore.
+        self._goto_target: Optional[Tuple[int, int]] = None
 
     @classmethod
     def from_ax_altaz(cls, alt: u.Quantity, az: u.Quantity, lon: u.Quantity, lat: u.Quantity, elevation: u.Quantity = "0m", obstime=Time.now()):
@@ -27,45 +39,56 @@ class Mount:
         coord = SkyCoord(alt=alt, az=az, frame="altaz", location=location, obstime=obstime)
         return cls(coord)
 
-    def _recalculate_fake_location(self):
-        axAltAz = self.axCoord.transform_to('altaz')
-        self._fakeLocation = EarthLocation.from_geodetic(lon= 0 * u.degree, lat=axAltAz.alt)
+    def _recalculate_coord_engine(self):
+        self._coordEngine = CoordEngine(self._axCoord.alt.deg, self._axCoord.az.deg)
+
+    def _coord_to_altaz(self, coord: SkyCoord) -> Tuple[np.ndarray, np.ndarray]:
+        if not isinstance(coord.frame, AltAz):
+            coord = coord.transform_to('altaz')
+        return coord.alt.deg, coord.az.deg
 
     def _coord_to_mount_pos(self, coord: SkyCoord) -> Tuple[int, int]:
-        true_altaz: AltAz = coord.transform_to('altaz')
-        fake_altaz = SkyCoord(alt=true_altaz.alt, az= true_altaz.az - self._axCoord.az, frame="altaz", obstime=self.time, location=self._fakeLocation)
-        fake_hadec = fake_altaz.transform_to('hadec')
-        ax1 = round((fake_hadec.ha + 180 * u.deg).wrap_at('360deg').deg / 360 * self.cprRa)
-        ax2 = round(fake_hadec.dec.wrap_at('180deg').deg / 360 * self.cprDec)
+        """Converts coordinate to mount axis positions. Array-valued coordinates return arrays of positions."""
+        alt, az = self._coord_to_altaz(coord)
+        ax1, ax2 = self._coordEngine.altaz_to_mount_pos(alt, az, self.cprRa, self.cprDec)
+        if np.ndim(ax1) == 0:
+            return int(ax1), int(ax2)
         return ax1, ax2
 
     def _mount_pos_to_coord(self, ax1: int, ax2: int) -> SkyCoord:
-        ax1_angle = Angle(ax1 * 360.0 / self.cprRa - 180, u.degree)
-        ax2_angle = Angle(ax2 * 360.0 / self.cprDec, u.deg)
-        
-        if ax2_angle > 90 * u.deg:
-            ax1_angle += 180 * u.deg
-            ax2_angle = 90 * u.deg - ax2_angle
-        if ax2_angle < -90 * u.deg:
-            ax1_angle += 180 * u.deg
-            ax2_angle = -90 * u.deg - ax2_angle
-
-        ax1_angle = ax1_angle.wrap_at('360d')
-        fake_hadec = SkyCoord(frame="hadec", ha=ax1_angle, dec=ax2_angle, obstime=self.time, location=self._fakeLocation)
-        fake_altaz = fake_hadec.transform_to('altaz')
-        coord = SkyCoord(frame="altaz", alt=fake_altaz.alt, az=fake_altaz.az + self._axCoord.az, obstime=fake_hadec.obstime, location=fake_hadec.location)
-        return coord
+        alt, az = self._coordEngine.mount_pos_to_altaz(ax1, ax2, self.cprRa, self.cprDec)
+        return SkyCoord(frame="altaz", alt=alt * u.deg, az=az * u.deg, obstime=self.time, location=self.location)
 
     def _time_to_mount_time(self, t: Time):
         return t.unix * 1000
 
+    def _track_point_to_cmd(self, point: TrackPoint) -> Tuple[int, int, int]:
+        ax1, ax2 = self._coord_to_mount_pos(point.coord)
+        return ax1, ax2, round(self._time_to_mount_time(point.t))
+
+    def _track_to_cmds(self, trackPoints: Track) -> Iterator[Tuple[int, int, int]]:
+        """Converts track points to (ax1, ax2, mount time) upload commands. Track paths and array-valued 
+        coordinates (with point times in their obstime) are converted in one go. Track files are read chunk by chunk."""
+        if isinstance(trackPoints, TrackFile):
+            return trackPoints.mount_cmds(self)
+        if isinstance(trackPoints, (TrackPath, SkyCoord)):
+            path = TrackPath.of(trackPoints)
+            ax1, ax2 = path.mount_pos(self)
+            mount_times = np.rint(path.times_ms).astype(np.int64)
+            return zip(ax1.tolist(), ax2.tolist(), mount_times.tolist())
+        return (self._track_point_to_cmd(point) for point in trackPoints)
+
+    def time_ms(self) -> float:
+        """Mount time as unix milliseconds. Cheap, meant for hot paths instead of `time`."""
+        return host_time_ms() + self._time_offset_ms
+
     @property
     def time(self) -> Time:
-        return Time.now() + self._time_offset
+        return Time(self.time_ms() / 1000, format="unix")
 
     @time.setter
     def time(self, t: Time):
-        self._time_offset = t - Time.now()
+        self._time_offset_ms = t.unix * 1000 - host_time_ms()
 
     @property
     def axCoord(self) -> SkyCoord:
@@ -75,58 +98,113 @@ class Mount:
     def axCoord(self, val: SkyCoord):
         self._axCoord = val.transform_to("altaz")
         self.location: EarthLocation = val.location
-        self._recalculate_fake_location()
+        self._recalculate_coord_engine()
     
     def calibrate_ant_coord(self, antCoord: SkyCoord):
         ax1, ax2 = self._coord_to_mount_pos(antCoord)
         self.mountConnection.set_position(ax1, ax2)
 
-    def goto(self, coord: SkyCoord, block: bool = False) -> None:
+    def goto(self, coord: SkyCoord, block: bool = False, on_transition: Callable[[MountStatus, MountStatus], None] = None) -> None:
         ax1, ax2 = self._coord_to_mount_pos(coord)
         self.mountConnection.goto(ax1, ax2)
+        self._goto_target = (int(ax1), int(ax2))
         if block:
-            self.wait_for_stop()
+            self.wait_for_stop(on_transition)
     
     def stop(self, block: bool = False) -> None:
         self.mountConnection.stop(False)
+        self._goto_target = None
         if block:
             self.wait_for_stop()
 
-    def wait_for_stop(self):
-        while(self.mountConnection.get_mount_status() != MountStatus.STOPPED):
-            sleep(_MOUNT_REFRESH_INTERVAL)
+    def wait_for_stop(self, on_transition: Callable[[MountStatus, MountStatus], None] = None, timeout: float = None) -> SlewWatcher:
+        """Blocks until the mount stops, polling sparsely during a slew and densely near its estimated end.
+        `on_transition(old, new)` is called on status changes (e.g. GOTO -> STOPPED)."""
+        watcher = SlewWatcher(self._goto_target, on_transition)
+        watcher.wait(self.mountConnection, timeout)
+        return watcher
+
+    def watch_slew(self, on_transition: Callable[[MountStatus, MountStatus], None] = None, timeout: float = None) -> SlewWatcher:
+        """Like wait_for_stop, but polls on a background thread. Use `watcher.future(status)` to wait for a status."""
+        watcher = SlewWatcher(self._goto_target, on_transition)
+        watcher.start(self.mountConnection, timeout)
+        return watcher
 
-    def sync_time(self) -> None:
-        current_mount_time = self._time_to_mount_time(self.time)
-        self.mountConnection.set_time(current_mount_time)
+    def sync_time(self) -> ClockSync:
+        """Sets the mount clock to `time`, compensating for serial latency. Returns the residual offset and its uncertainty."""
+        self.clock_sync = sync_clock(self.mountConnection, self.time_ms)
+        return self.clock_sync
+
+    def measure_clock(self, samples: int = 10, interval: float = 1.0) -> ClockSync:
+        """Measures offset and drift of the mount clock against `time` over `samples` exchanges `interval` seconds apart"""
+        return measure_clock(self.mountConnection, samples, interval, self.time_ms)
     
     def get_position(self) -> SkyCoord:
         ax1, ax2 = self.mountConnection.get_position()
         return self._mount_pos_to_coord(ax1, ax2)
 
-    def track(self, trackPoints: Iterable[TrackPoint], update_callback: Callable[[int, int], None] = None, print_upload_progres=False) -> None:
+    def track(self, trackPoints: Track, update_callback: Callable[[int, int], None] = None, print_upload_progres=False) -> None:
         self.mountConnection.stop()
+        self._goto_target = None
         self.mountConnection.clear_track_buffer()
         
         track_buffer_space = self.mountConnection.get_track_buffer_free_space()
         if track_buffer_space < len(trackPoints):
-            raise Exception("Track point count exceeds maximum mount's buffer. It is possible to overcome this, but it is not implemented yet")
+            raise Exception("Track point count exceeds maximum mount's buffer. Use track_stream to track longer paths")
         point_count = len(trackPoints)
+        track_cmds = self._track_to_cmds(trackPoints)
         if print_upload_progres:
-            trackPoints = alive_progress.alive_it(trackPoints)
-        for idx, point in enumerate(trackPoints):
-            if update_callback != None:
-                update_callback(idx, point_count)
-            
-            ax1, ax2 = self._coord_to_mount_pos(point.coord)
-            mount_time = self._time_to_mount_time(point.t)
-            self.mountConnection.add_track_point(ax1, ax2, mount_time)
+            import alive_progress
+            track_cmds = alive_progress.alive_it(track_cmds, total=point_count)
+
+        def commands():
+            for idx, cmd in enumerate(track_cmds):
+                if update_callback != None:
+                    update_callback(idx, point_count)
+                yield cmd
+
+        results = self.mountConnection.add_track_points(commands(), free_space=track_buffer_space)
+        for idx, result in enumerate(results):
+            if result != TrackPointAddResult.OK:
+                raise Exception(f"Mount rejected track point {idx}: {result.name}")
         
         if update_callback != None:
             update_callback(point_count, point_count)
         self.sync_time()
         self.mountConnection.tracking_start()
 
+    def track_stream(self, trackPoints: Track, refill_interval: float = _MOUNT_REFRESH_INTERVAL) -> TrackStreamer:
+        """Starts tracking a path of any length, including generators. Points are uploaded by a background
+        thread as the mount consumes its track buffer. Returns the running streamer, see its `stats`."""
+        self._goto_target = None
+        streamer = TrackStreamer(self, trackPoints, refill_interval)
+        streamer.start()
+        return streamer
+
+    @contextmanager
+    def profile(self) -> Iterator[Profile]:
+        """Collects per command latency and throughput of the block, e.g.
+
+            with mount.profile() as profile:
+                mount.track(points)
+            print(profile)
+
+        Connections without instrumentation get one for the duration of the block only.
+        """
+        connections = [c for c in (self.mountConnection, self.asyncConnection) if c is not None]
+        instrumentation = next((c.instrumentation for c in connections if c.instrumentation is not None), None)
+        if instrumentation is None:
+            instrumentation = Instrumentation()
+        attached = [c for c in connections if c.instrumentation is None]
+        for connection in attached:
+            connection.instrumentation = instrumentation
+        try:
+            with instrumentation.profile() as profile:
+                yield profile
+        finally:
+            for connection in attached:
+                connection.instrumentation = None
+
     def get_status(self) -> MountStatus:
         return self.mountConnection.get_mount_status()
 
@@ -134,16 +212,101 @@ class Mount:
         time_raw = self.mountConnection.get_time()
         return Time(time_raw/1000.0, format="unix")
 
-    def connect(self, device: str = None):
+    def connect(self, device: str = None, multiplexed: bool = False):
+        """Opens the connection. With `multiplexed`, commands go through a MountMultiplexer, so that
+        several threads (GUI, telemetry, track uploads) can share the link with priorities."""
         self.mountConnection.open(device)
+        if multiplexed and not isinstance(self.mountConnection, MountMultiplexer):
+            self.mountConnection = MountMultiplexer(self.mountConnection)
         self.cprRa, self.cprDec = self.mountConnection.get_cpr()
     
     def is_connected(self):
         return self.mountConnection.is_connected()
 
+    def start_telemetry(self, rate_hz: float = _DEFAULT_RATE_HZ, capacity: int = _DEFAULT_CAPACITY) -> Telemetry:
+        """Starts polling position and status in the background. Already running telemetry is reused."""
+        if self.telemetry is None or (not self.telemetry.is_running() and self.telemetry.buffer.capacity != capacity):
+            self.telemetry = Telemetry(self, rate_hz, capacity)
+        self.telemetry.rate_hz = rate_hz
+        self.telemetry.start()
+        return self.telemetry
+
+    def stop_telemetry(self) -> None:
+        if self.telemetry is not None:
+            self.telemetry.stop()
+
     def disconnect(self):
+        self.stop_telemetry()
         self.mountConnection.close()
 
+    async def connect_async(self, device: str = None, timeout: float = None) -> AsyncMountConnection:
+        """Connects through AsyncMountConnection, for use with the *_async methods. The blocking
+        methods can't be used on the same port then."""
+        self.asyncConnection = AsyncMountConnection() if timeout is None else AsyncMountConnection(timeout)
+        await self.asyncConnection.open(device)
+        self.cprRa, self.cprDec = await self.asyncConnection.get_cpr()
+        return self.asyncConnection
+
+    async def disconnect_async(self) -> None:
+        if self.asyncConnection is not None:
+            await self.asyncConnection.close()
+
+    async def goto_async(self, coord: SkyCoord, block: bool = False) -> None:
+        ax1, ax2 = self._coord_to_mount_pos(coord)
+        await self.asyncConnection.goto(ax1, ax2)
+        self._goto_target = (int(ax1), int(ax2))
+        if block:
+            await self.wait_for_stop_async()
+
+    async def stop_async(self, block: bool = False) -> None:
+        await self.asyncConnection.stop(False)
+        self._goto_target = None
+        if block:
+            await self.wait_for_stop_async()
+
+    async def wait_for_stop_async(self, on_transition: Callable[[MountStatus, MountStatus], None] = None, timeout: float = None) -> SlewWatcher:
+        watcher = SlewWatcher(self._goto_target, on_transition)
+        await watcher.wait_async(self.asyncConnection, timeout)
+        return watcher
+
+    async def get_position_async(self) -> SkyCoord:
+        ax1, ax2 = await self.asyncConnection.get_position()
+        return self._mount_pos_to_coord(ax1, ax2)
+
+    async def get_status_async(self) -> MountStatus:
+        return await self.asyncConnection.get_mount_status()
+
+    async def sync_time_async(self) -> ClockSync:
+        self.clock_sync = await sync_clock_async(self.asyncConnection, self.time_ms)
+        return self.clock_sync
+
+    async def track_async(self, trackPoints: Track, update_callback: Callable[[int, int], None] = None) -> None:
+        """Same as track, over the AsyncMountConnection"""
+        connection = self.asyncConnection
+        await connection.stop()
+        self._goto_target = None
+        await connection.clear_track_buffer()
+
+        point_count = len(trackPoints)
+        if await connection.get_track_buffer_free_space() < point_count:
+            raise Exception("Track point count exceeds maximum mount's buffer. Use track_stream to track longer paths")
+
+        def commands():
+            for idx, cmd in enumerate(self._track_to_cmds(trackPoints)):
+                if update_callback != None:
+                    update_callback(idx, point_count)
+                yield cmd
+
+        results = await connection.add_track_points(commands())
+        for idx, result in enumerate(results):
+            if result != TrackPointAddResult.OK:
+                raise Exception(f"Mount rejected track point {idx}: {result.name}")
+
+        if update_callback != None:
+            update_callback(point_count, point_count)
+        await self.sync_time_async()
+        await connection.tracking_start()
+
     def local_altaz(self, alt: Union[Quantity, str], az: Union[Quantity, str], t: Time=None) -> SkyCoord:
         if t == None:
             t = self.time
@@ -1,10 +1,13 @@
 from dataclasses import dataclass
 from enum import Enum
 import serial
-import serial.tools.list_ports
 from collections.abc import Sequence
-from typing import Tuple, List
+from typing import Deque, Dict, Tuple, List, Iterable, Optional
+from collections import deque
+from time import monotonic, perf_counter
 import os
+import threading
+from .instrumentation import Instrumentation, OUTCOME_OK, OUTCOME_TIMEOUT, OUTCOME_ERROR
 
 _CMD_FIRST_CHAR = "+"
 _CMD_STR_GET_POS = "gp"
@@ -24,8 +27,54 @@ _CMD_STR_TRACKING_STOP = "ts"
 _CMD_STR_GET_STATUS = "gs"
 
 _CMD_FORMATTING = "ascii"
+# Response of the mount to a command it couldn't execute
+_RESPONSE_ERROR = "err"
+
+# Queries without side effects, safe to repeat after a lost or garbled response
+_QUERY_COMMANDS = {
+    _CMD_STR_GET_POS, _CMD_STR_GET_STATUS, _CMD_STR_GET_TIME, _CMD_STR_GET_CPR, _CMD_STR_GET_PROTOCOL_VERSION,
+    _CMD_STR_GET_TRACK_BUFFER_FREE_SPACE, _CMD_STR_GET_TRACK_BUFFER_SIZE
+}
+_MOTION_COMMANDS = {_CMD_STR_GOTO, _CMD_STR_STOP, _CMD_STR_TRACKING_START, _CMD_STR_TRACKING_STOP}
+# First tokens of valid response lines, anything else is line noise
+_RESPONSE_CMDS = _QUERY_COMMANDS | _MOTION_COMMANDS | {
+    _CMD_STR_SET_POS, _CMD_STR_SET_TIME, _CMD_STR_TRACK_BUFFER_CLEAR, _CMD_STR_TRACK_POINT_ADD, _RESPONSE_ERROR
+}
+
+# Motion commands that fail are reported at once...
+MOTION_FAIL_FAST = "fail-fast"
+# ...or the mount status is checked, and the command is repeated only if it didn't take effect
+MOTION_VERIFY = "verify"
+# Track point uploads abort on a lost or garbled response...
+UPLOAD_FAIL_FAST = "fail-fast"
+# ...or the buffer free space tells how many of the unconfirmed points were stored, and the rest is sent again
+UPLOAD_RESYNC = "resync"
+
+_DEFAULT_COMMAND_TIMEOUT = 1.0
+# Polled queries and track points are answered within milliseconds, a lost response shouldn't stall for
+# the full default. gc and gpv keep the default, they are the first commands after the port opens.
+_DEFAULT_COMMAND_TIMEOUTS = {
+    _CMD_STR_GET_POS: 0.25,
+    _CMD_STR_GET_STATUS: 0.25,
+    _CMD_STR_GET_TIME: 0.25,
+    _CMD_STR_GET_TRACK_BUFFER_FREE_SPACE: 0.25,
+    _CMD_STR_GET_TRACK_BUFFER_SIZE: 0.25,
+    _CMD_STR_TRACK_POINT_ADD: 0.25,
+}
+_DEFAULT_QUERY_RETRIES = 2
+# Port timeout is kept while the remaining time of a command is this close to it (seconds)
+_TIMEOUT_SLACK = 0.005
 
 _ENVVAR_MOUNT_PORT = "ESP_MOUNT_PORT"
+_SIMULATOR_HANDLER_PACKAGE = "espMountCtrl.simulator"
+
+# Number of track point commands kept in flight by default. Each command is ~30 bytes,
+# so this stays well within the mount's UART receive buffer.
+_TRACK_POINT_UPLOAD_WINDOW = 8
+
+# Makes "espmountsim://" URLs open the software mount simulator
+if _SIMULATOR_HANDLER_PACKAGE not in serial.protocol_handler_packages:
+    serial.protocol_handler_packages.append(_SIMULATOR_HANDLER_PACKAGE)
 
 class TrackPointAddResult(Enum):
     OK = 0
@@ -46,18 +95,133 @@ class MountConnectionError(Exception):
         else:
             super().__init__(f"Mount responded incorrectly: {received}")
 
-class MountConnection:
+class MountTimeoutError(MountConnectionError):
+    """Mount hasn't responded to a command in time"""
+    def __init__(self, cmdStr: str, timeout: float):
+        Exception.__init__(self, f"Mount didn't respond to {_CMD_FIRST_CHAR}{cmdStr} within {timeout} s")
+
+class MountRejectedError(MountConnectionError):
+    """Mount has answered a command with an error"""
+    def __init__(self, cmdStr: str):
+        Exception.__init__(self, f"Mount rejected {_CMD_FIRST_CHAR}{cmdStr}")
+
+class MountPortNotFoundError(MountConnectionError):
+    """No port was given and none could be found"""
     def __init__(self):
+        Exception.__init__(self, f"No serial port found, pass device or set {_ENVVAR_MOUNT_PORT}")
+
+def _open_serial(device: str = None, timeout: float = _DEFAULT_COMMAND_TIMEOUT) -> serial.SerialBase:
+    """Opens `device`, the port from ESP_MOUNT_PORT, or the first serial port found, in this order"""
+    if device is None:
+        device = os.getenv(_ENVVAR_MOUNT_PORT)
+    if device is None:
+        from serial.tools import list_ports
+        ports = list_ports.comports()
+        if len(ports) > 0:
+            device = ports[0].device
+    if device is None:
+        raise MountPortNotFoundError()
+    return serial.serial_for_url(device, 115200, timeout=timeout)
+
+def _format_cmd(cmdStr: str, *args) -> bytes:
+    if len(args) == 0:
+        cmd = f"{_CMD_FIRST_CHAR}{cmdStr}\n"
+    else:
+        args_joined = " ".join([str(arg) for arg in args])
+        cmd = f"{_CMD_FIRST_CHAR}{cmdStr} {args_joined}\n"
+    return cmd.encode(_CMD_FORMATTING)
+
+def _parse_int_response(segments: List[str], intCount: int) -> Tuple:
+    if len(segments) != intCount + 1:
+        raise MountConnectionError(" ".join(segments))
+    try:
+        return tuple(int(segment) for segment in segments[1:])
+    except ValueError:
+        raise MountConnectionError(" ".join(segments)) from None
+
+def _response_cmd(line: str) -> Optional[str]:
+    """Command string a decoded response line answers, None for a garbled line"""
+    if not line.startswith(_CMD_FIRST_CHAR):
+        return None
+    cmdStr = line[1:].rstrip("\n").split(" ")[0]
+    return cmdStr if cmdStr in _RESPONSE_CMDS else None
+
+def _motion_took_effect(connection, cmdStr: str, args: Tuple) -> bool:
+    """Tells from the mount status whether a motion command, whose response got lost, was executed"""
+    status = connection.get_mount_status()
+    if cmdStr == _CMD_STR_GOTO:
+        # A short goto may have ended already
+        return status == MountStatus.GOTO or (status == MountStatus.STOPPED and connection.get_position() == (int(args[0]), int(args[1])))
+    if cmdStr == _CMD_STR_STOP:
+        return status != MountStatus.GOTO and status != MountStatus.TRACKING
+    if cmdStr == _CMD_STR_TRACKING_START:
+        return status == MountStatus.TRACKING
+    return status != MountStatus.TRACKING
+
+@dataclass
+class RecoveryStats:
+    # Queries repeated after a lost or garbled response
+    retries: int = 0
+    # Well-formed stale responses to other commands skipped while waiting for the right response
+    skipped_lines: int = 0
+    # Input buffer resets after a failed exchange
+    drains: int = 0
+    # Failed motion commands confirmed by the mount status, and motion commands repeated (MOTION_VERIFY)
+    verified: int = 0
+    repeated: int = 0
+    # Track point uploads resumed after a failed response (UPLOAD_RESYNC)
+    upload_resyncs: int = 0
+
+    def __str__(self) -> str:
+        return (f"retries: {self.retries}, skipped lines: {self.skipped_lines}, drains: {self.drains}, "
+                f"verified: {self.verified}, repeated: {self.repeated}, upload resyncs: {self.upload_resyncs}")
+
+def _stored_unconfirmed(free_space_before: int, free_space: int, stored: int, unconfirmed: int) -> int:
+    """How many of the `unconfirmed` points sent after `stored` confirmed ones the mount kept, judged by the
+    buffer free space at the start of the upload and now. Points the mount consumed meanwhile make it an
+    underestimate, so a point may be sent twice, but none is skipped."""
+    return max(0, min(unconfirmed, free_space_before - free_space - stored))
+
+class MountConnection:
+    """Blocking connection to the mount.
+
+    Every command waits for its response at most its deadline: `timeout` by default, or the value
+    in `command_timeouts` for its command string (short for the polled queries and track points).
+    Responses to other commands, e.g. the late response of a command that timed out, are skipped
+    until the deadline, a garbled line fails the command. After a failed exchange the input buffer
+    is drained before the next command, so one lost response doesn't shift all the following ones.
+
+    Queries are repeated up to `query_retries` times after a timeout or a garbled response. Motion
+    commands (goto, stop, tracking start/stop) follow `motion_policy`: with MOTION_FAIL_FAST a
+    failure raises at once, with MOTION_VERIFY the mount status tells whether the command took
+    effect and it is repeated only if not. Track point uploads follow `upload_policy`, see
+    add_track_points. Other commands are never repeated. `recovery` counts what was done.
+    """
+    def __init__(self, timeout: float = _DEFAULT_COMMAND_TIMEOUT, command_timeouts: Dict[str, float] = None,
+                 query_retries: int = _DEFAULT_QUERY_RETRIES, motion_policy: str = MOTION_FAIL_FAST,
+                 upload_policy: str = UPLOAD_RESYNC):
+        if motion_policy not in (MOTION_FAIL_FAST, MOTION_VERIFY):
+            raise ValueError(f"Unknown motion policy: {motion_policy}")
+        if upload_policy not in (UPLOAD_FAIL_FAST, UPLOAD_RESYNC):
+            raise ValueError(f"Unknown upload policy: {upload_policy}")
         self.ser = serial.Serial()
+        self.timeout = timeout
+        self.command_timeouts: Dict[str, float] = dict(_DEFAULT_COMMAND_TIMEOUTS if command_timeouts is None else command_timeouts)
+        self.query_retries = query_retries
+        self.motion_policy = motion_policy
+        self.upload_policy = upload_policy
+        self.recovery = RecoveryStats()
+        # Serializes whole command/response exchanges, so that e.g. a track refill thread and a GUI can share the link
+        self._lock = threading.RLock()
+        # Per command statistics, None keeps them off
+        self.instrumentation: Optional[Instrumentation] = None
+        # Set after a failed exchange, the input is drained before the next command
+        self._needs_drain = False
 
     def open(self, device: str = None) -> bool:
-        if device is None:
-            device = os.getenv(_ENVVAR_MOUNT_PORT)
-        if device is None:
-            ports = serial.tools.list_ports.comports()
-            if len(ports) > 0:
-                device = ports[0].device
-        self.ser = serial.Serial(device, 115200, timeout=1)
+        """Opens serial port `device`, or any pyserial URL (e.g. "espmountsim://" for the simulated mount)"""
+        self.ser = _open_serial(device, self.timeout)
+        self._needs_drain = False
         return self.ser.is_open
 
     def close(self):
@@ -67,29 +231,107 @@ class MountConnection:
     def is_connected(self):
         return self.ser.is_open
 
+    def _format_cmd(self, cmdStr: str, *args) -> bytes:
+        return _format_cmd(cmdStr, *args)
+
+    def command_timeout(self, cmdStr: str) -> float:
+        return self.command_timeouts.get(cmdStr, self.timeout)
+
+    def _drain(self) -> None:
+        self.ser.reset_input_buffer()
+        self._needs_drain = False
+        self.recovery.drains += 1
+
+    def _readline(self, timeout: float) -> bytes:
+        # Changing the timeout reconfigures a real port (tcsetattr), so it is kept while it is within
+        # a few ms of the remaining time. Pipelined reads of one command type then never touch it.
+        current = self.ser.timeout
+        if current is None or abs(current - timeout) > _TIMEOUT_SLACK:
+            self.ser.timeout = timeout
+        return self.ser.readline()
+
+    def _read_response(self, cmdStr: str, instrumentation: Instrumentation = None, sent_at: float = None, bytes_sent: int = 0) -> List[str]:
+        """Reads the response to `cmdStr`, skipping responses to other commands until the command's deadline.
+        With `instrumentation` (as read when the command was written) and `sent_at` (perf_counter at writing)
+        the exchange is recorded. `self.instrumentation` isn't read again, another thread may detach it meanwhile."""
+        timeout = self.command_timeout(cmdStr)
+        deadline = monotonic() + timeout
+        outcome = OUTCOME_ERROR
+        received = 0
+        try:
+            while True:
+                line = self._readline(max(0.0, deadline - monotonic()))
+                received += len(line)
+                if not line.endswith(b'\n'):
+                    outcome = OUTCOME_TIMEOUT
+                    raise MountTimeoutError(cmdStr, timeout)
+                text = line[:-1].decode(_CMD_FORMATTING, "replace")
+                response_cmd = _response_cmd(text)
+                if response_cmd == cmdStr:
+                    outcome = OUTCOME_OK
+                    return text.split(" ")
+                if response_cmd == _RESPONSE_ERROR:
+                    raise MountRejectedError(cmdStr)
+                if response_cmd is None:
+                    # Most likely this command's response, garbled on the way
+                    raise MountConnectionError(text)
+                # Late response of a command that failed before
+                self.recovery.skipped_lines += 1
+        except MountConnectionError:
+            self._needs_drain = True
+            raise
+        finally:
+            if instrumentation is not None and sent_at is not None:
+                instrumentation.record(cmdStr, perf_counter() - sent_at, bytes_sent, received, outcome)
+
+    def _exchange(self, cmdStr: str, *args) -> List[str]:
+        data = self._format_cmd(cmdStr, *args)
+        if self._needs_drain:
+            self._drain()
+        instrumentation = self.instrumentation
+        if instrumentation is None:
+            self.ser.write(data)
+            return self._read_response(cmdStr)
+        sent_at = perf_counter()
+        self.ser.write(data)
+        return self._read_response(cmdStr, instrumentation, sent_at, len(data))
+
+    def _send(self, cmdStr: str, args: Tuple, intCount: int = None) -> List[str]:
+        """Runs one command, recovering from failures as the command's policy allows. Returns the
+        response segments, or the parsed ints with `intCount`."""
+        with self._lock:
+            attempts = 1 + (self.query_retries if cmdStr in _QUERY_COMMANDS else 0)
+            for attempt in range(attempts):
+                try:
+                    segments = self._exchange(cmdStr, *args)
+                    return segments if intCount is None else self._parse_int_response(segments, intCount)
+                except MountConnectionError as e:
+                    self._needs_drain = True
+                    if cmdStr in _MOTION_COMMANDS and self.motion_policy == MOTION_VERIFY and not isinstance(e, MountRejectedError):
+                        return self._verify_motion(cmdStr, args, e)
+                    if attempt + 1 == attempts or isinstance(e, MountRejectedError):
+                        raise
+                    self.recovery.retries += 1
+
+    def _verify_motion(self, cmdStr: str, args: Tuple, error: MountConnectionError) -> List[str]:
+        if _motion_took_effect(self, cmdStr, args):
+            self.recovery.verified += 1
+            return [f"{_CMD_FIRST_CHAR}{cmdStr}"]
+        self.recovery.repeated += 1
+        try:
+            return self._exchange(cmdStr, *args)
+        except MountConnectionError:
+            self._needs_drain = True
+            raise error
+
     def _sendCmd(self, cmdStr: str, *args) -> List[str]:
-        if len(args) == 0:
-            cmd = f"{_CMD_FIRST_CHAR}{cmdStr}\n"
-        else:
-            args_joined = " ".join([str(arg) for arg in args])
-            cmd = f"{_CMD_FIRST_CHAR}{cmdStr} {args_joined}\n"
-        self.ser.write(cmd.encode(_CMD_FORMATTING))
-        line = self.ser.readline()
-        line = line.replace(b'\n', b'')
-        segments = line.decode(_CMD_FORMATTING).split(" ")
-        if segments[0] != f"{_CMD_FIRST_CHAR}{cmdStr}":
-            raise MountConnectionError(line.decode(_CMD_FORMATTING))
-        return segments
+        return self._send(cmdStr, args)
+
+    def _parse_int_response(self, segments: List[str], intCount: int) -> Tuple:
+        return _parse_int_response(segments, intCount)
 
     def _send_int_cmd(self, cmdStr: str, intCount: int, *args) -> Tuple:
-        segments = self._sendCmd(cmdStr, *args)
-        if len(segments) != intCount + 1:
-            raise MountConnectionError()
-        
-        resultList = list()
-        for i in range(0, intCount):
-            resultList.append(int(segments[i + 1]))
-        return tuple(resultList)
+        return self._send(cmdStr, args, intCount)
 
     def get_position(self) -> Tuple[int, int]:
         return self._send_int_cmd(_CMD_STR_GET_POS, 2)
@@ -127,6 +369,81 @@ class MountConnection:
     
     def add_track_point(self, posAx1: int, posAx2: int, time: int) -> TrackPointAddResult:
         return TrackPointAddResult(self._send_int_cmd(_CMD_STR_TRACK_POINT_ADD, 1, posAx1, posAx2, time)[0])
+
+    def add_track_points(self, points: Iterable[Tuple[int, int, int]], window: int = _TRACK_POINT_UPLOAD_WINDOW,
+                         free_space: int = None) -> List[TrackPointAddResult]:
+        """Uploads (ax1, ax2, time) track points with up to `window` commands in flight.
+
+        Responses are matched to points in order. No new points are sent after the first result
+        other than OK, but the points already in flight are still read out, so the returned list
+        contains a result for every point that was actually sent.
+
+        With UPLOAD_RESYNC, a lost or garbled response doesn't abort the upload: the buffer free
+        space, compared to `free_space` at the start (queried if not given), tells how many of the
+        unconfirmed points were stored, and the upload continues after them. It gives up after
+        `query_retries` failures in a row. With UPLOAD_FAIL_FAST the failure is raised at once.
+        """
+        if window < 1:
+            raise ValueError("Upload window must be at least 1")
+        with self._lock:
+            if self._needs_drain:
+                self._drain()
+            resync = self.upload_policy == UPLOAD_RESYNC
+            if resync and free_space is None:
+                free_space = self.get_track_buffer_free_space()
+            results: List[TrackPointAddResult] = []
+            stored = 0
+            failures = 0
+            failed = False
+            instrumentation = self.instrumentation
+            # (point, perf_counter at writing, command size) of the points in flight
+            in_flight: Deque[Tuple[Tuple[int, int, int], Optional[float], int]] = deque()
+            # Points to send again after a resync, they precede the rest of `points`
+            resend: Deque[Tuple[int, int, int]] = deque()
+            points = iter(points)
+            while True:
+                while not failed and len(in_flight) < window:
+                    point = resend.popleft() if len(resend) > 0 else next(points, None)
+                    if point is None:
+                        break
+                    data = self._format_cmd(_CMD_STR_TRACK_POINT_ADD, *point)
+                    in_flight.append((point, perf_counter() if instrumentation is not None else None, len(data)))
+                    self.ser.write(data)
+                if len(in_flight) == 0:
+                    break
+                _, sent_at, size = in_flight[0]
+                try:
+                    segments = self._read_response(_CMD_STR_TRACK_POINT_ADD, instrumentation, sent_at, size)
+                    result = TrackPointAddResult(self._parse_int_response(segments, 1)[0])
+                except (MountConnectionError, ValueError) as e:
+                    failures += 1
+                    if not resync or isinstance(e, MountRejectedError) or failures > self.query_retries:
+                        # Responses to the remaining in-flight points would confuse the next command
+                        self._drain()
+                        raise
+                    # All points in flight were written before the query, so the mount has processed them
+                    # by the time it answers. Their late responses are skipped as stale.
+                    self._needs_drain = True
+                    current_free_space = self.get_track_buffer_free_space()
+                    for _ in range(_stored_unconfirmed(free_space, current_free_space, stored, len(in_flight))):
+                        in_flight.popleft()
+                        results.append(TrackPointAddResult.OK)
+                        stored += 1
+                    resend.extendleft(reversed([point for point, _, _ in in_flight]))
+                    in_flight.clear()
+                    if current_free_space == 0 and len(resend) > 0:
+                        results.append(TrackPointAddResult.BUFFER_FULL)
+                        failed = True
+                    self.recovery.upload_resyncs += 1
+                    continue
+                in_flight.popleft()
+                failures = 0
+                results.append(result)
+                if result == TrackPointAddResult.OK:
+                    stored += 1
+                else:
+                    failed = True
+            return results
     
     def tracking_start(self) -> None:
         self._sendCmd(_CMD_STR_TRACKING_START)
@@ -0,0 +1,205 @@
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Mapping, Optional, Sequence, TypeVar, Union
+from astropy.coordinates import SkyCoord
+from astropy.time import Time
+from .mount import Mount, Track
+from .mountConnection import MountStatus
+from .clockSync import ClockSync, host_time_ms
+from .slewWatcher import SlewWatcher
+from .telemetry import Telemetry, _DEFAULT_RATE_HZ
+from .trackStreamer import TrackStreamer
+
+T = TypeVar("T")
+# Value for every mount of a group, or a dict of values by mount name
+PerMount = Union[T, Mapping[str, T]]
+
+class MountGroupError(Exception):
+    """Some mounts of a group have failed, `errors` maps their names to the exceptions. Results of
+    the other mounts are in `results`."""
+    def __init__(self, action: str, errors: Dict[str, Exception], results: Dict[str, object]):
+        self.errors = errors
+        self.results = results
+        super().__init__(f"{action} failed on " + ", ".join(f"{name} ({error})" for name, error in errors.items()))
+
+@dataclass
+class MountState:
+    status: Optional[MountStatus] = None
+    ax1: Optional[int] = None
+    ax2: Optional[int] = None
+    alt: Optional[float] = None
+    az: Optional[float] = None
+    # Why the mount couldn't be queried
+    error: Optional[str] = None
+
+    def __str__(self) -> str:
+        if self.error is not None:
+            return f"error: {self.error}"
+        return f"{self.status.name}, alt {round(self.alt, 2)} deg, az {round(self.az, 2)} deg ({self.ax1}, {self.ax2})"
+
+@dataclass
+class GroupStatus:
+    mounts: Dict[str, MountState] = field(default_factory=dict)
+
+    @property
+    def stopped(self) -> bool:
+        return all(state.status == MountStatus.STOPPED for state in self.mounts.values())
+
+    @property
+    def failed(self) -> List[str]:
+        return [name for name, state in self.mounts.items() if state.error is not None]
+
+    def count(self, status: MountStatus) -> int:
+        return sum(1 for state in self.mounts.values() if state.status == status)
+
+    def __str__(self) -> str:
+        return "\n".join(f"{name}: {state}" for name, state in self.mounts.items())
+
+def _mount_state(mount: Mount, ax1: int, ax2: int, status: MountStatus) -> MountState:
+    alt, az = mount._coordEngine.mount_pos_to_altaz(ax1, ax2, mount.cprRa, mount.cprDec)
+    return MountState(status, ax1, ax2, float(alt), float(az))
+
+class MountGroup:
+    """Controls several mounts at once.
+
+    Every operation runs on all mounts concurrently, one thread per mount, and returns a dict of
+    results by mount name. If any mount fails, the others still finish and MountGroupError is
+    raised with all the errors. Arguments taking a PerMount value accept either one value for all
+    mounts (e.g. a SkyCoord, converted by each mount for its own site), or a dict by mount name.
+
+    All mounts share one time base (`time`), which their clocks are synchronized to, so that
+    track points with the same timestamp are reached at the same moment by every mount.
+    """
+    def __init__(self, mounts: Union[Mapping[str, Mount], Iterable[Mount]]):
+        if isinstance(mounts, Mapping):
+            self.mounts: Dict[str, Mount] = dict(mounts)
+        else:
+            self.mounts = {f"mount{i}": mount for i, mount in enumerate(mounts)}
+        if len(self.mounts) == 0:
+            raise ValueError("Mount group needs at least one mount")
+        self._time_offset_ms = 0.0
+        # Created on first use and dropped by disconnect, so that the group can be connected again
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def __len__(self) -> int:
+        return len(self.mounts)
+
+    def __getitem__(self, name: str) -> Mount:
+        return self.mounts[name]
+
+    def _run_all(self, action: str, fn: Callable[[str, Mount], T]) -> Dict[str, T]:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=len(self.mounts), thread_name_prefix="MountGroup")
+        futures = {name: self._executor.submit(fn, name, mount) for name, mount in self.mounts.items()}
+        results: Dict[str, T] = {}
+        errors: Dict[str, Exception] = {}
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                errors[name] = e
+        if len(errors) > 0:
+            raise MountGroupError(action, errors, results)
+        return results
+
+    def _value(self, value: PerMount, name: str):
+        if isinstance(value, Mapping):
+            return value[name]
+        return value
+
+    def connect(self, devices: Union[Mapping[str, str], Sequence[str]], multiplexed: bool = False) -> None:
+        """Opens all mounts in parallel, `devices` are ports or URLs by mount name, or in the order of the mounts"""
+        if not isinstance(devices, Mapping):
+            if len(devices) != len(self.mounts):
+                raise ValueError(f"{len(devices)} devices given for {len(self.mounts)} mounts")
+            devices = dict(zip(self.mounts, devices))
+        self._run_all("connect", lambda name, mount: mount.connect(devices[name], multiplexed))
+        self.time = self.time
+
+    def disconnect(self) -> None:
+        try:
+            self._run_all("disconnect", lambda name, mount: mount.disconnect())
+        finally:
+            executor, self._executor = self._executor, None
+            if executor is not None:
+                executor.shutdown(wait=False)
+
+    def is_connected(self) -> Dict[str, bool]:
+        return {name: mount.is_connected() for name, mount in self.mounts.items()}
+
+    def time_ms(self) -> float:
+        return host_time_ms() + self._time_offset_ms
+
+    @property
+    def time(self) -> Time:
+        """Common time base of the group, the host clock by default"""
+        return Time(self.time_ms() / 1000, format="unix")
+
+    @time.setter
+    def time(self, t: Time):
+        self._time_offset_ms = t.unix * 1000 - host_time_ms()
+        for mount in self.mounts.values():
+            mount._time_offset_ms = self._time_offset_ms
+
+    def sync_time(self) -> Dict[str, ClockSync]:
+        """Synchronizes the clocks of all mounts to the group time base. Returns residual offsets."""
+        self.time = self.time
+        return self._run_all("sync_time", lambda name, mount: mount.sync_time())
+
+    def calibrate_ant_coord(self, antCoords: PerMount[SkyCoord]) -> None:
+        self._run_all("calibrate", lambda name, mount: mount.calibrate_ant_coord(self._value(antCoords, name)))
+
+    def goto(self, coords: PerMount[SkyCoord], block: bool = False) -> None:
+        self._run_all("goto", lambda name, mount: mount.goto(self._value(coords, name), block))
+
+    def stop(self, block: bool = False) -> None:
+        self._run_all("stop", lambda name, mount: mount.stop(block))
+
+    def wait_for_stop(self, timeout: float = None) -> Dict[str, SlewWatcher]:
+        return self._run_all("wait_for_stop", lambda name, mount: mount.wait_for_stop(timeout=timeout))
+
+    def get_position(self) -> Dict[str, SkyCoord]:
+        return self._run_all("get_position", lambda name, mount: mount.get_position())
+
+    def track(self, tracks: PerMount[Track], update_callback: Callable[[str, int, int], None] = None) -> None:
+        """Uploads the tracks and starts tracking on all mounts in parallel.
+        `update_callback(name, uploaded, total)` reports progress of every mount."""
+        self.time = self.time
+        def track(name: str, mount: Mount) -> None:
+            callback = None if update_callback is None else lambda idx, count: update_callback(name, idx, count)
+            mount.track(self._value(tracks, name), callback)
+        self._run_all("track", track)
+
+    def track_stream(self, tracks: PerMount[Track]) -> Dict[str, TrackStreamer]:
+        self.time = self.time
+        return self._run_all("track_stream", lambda name, mount: mount.track_stream(self._value(tracks, name)))
+
+    def status(self) -> GroupStatus:
+        """Queries all mounts. Unreachable mounts are reported in the status instead of raising."""
+        def state(name: str, mount: Mount) -> MountState:
+            try:
+                ax1, ax2 = mount.mountConnection.get_position()
+                return _mount_state(mount, ax1, ax2, mount.get_status())
+            except Exception as e:
+                return MountState(error=str(e))
+        return GroupStatus(self._run_all("status", state))
+
+    def start_telemetry(self, rate_hz: float = _DEFAULT_RATE_HZ) -> Dict[str, Telemetry]:
+        return {name: mount.start_telemetry(rate_hz) for name, mount in self.mounts.items()}
+
+    def stop_telemetry(self) -> None:
+        for mount in self.mounts.values():
+            mount.stop_telemetry()
+
+    def telemetry_status(self) -> GroupStatus:
+        """Status from the latest telemetry samples, without any serial traffic"""
+        result = GroupStatus()
+        for name, mount in self.mounts.items():
+            telemetry = mount.telemetry
+            if telemetry is None or telemetry.latest is None:
+                error = telemetry.error if telemetry is not None and telemetry.error is not None else "no telemetry"
+                result.mounts[name] = MountState(error=str(error))
+            else:
+                sample = telemetry.latest
+                result.mounts[name] = _mount_state(mount, sample.ax1, sample.ax2, sample.status)
+        return result
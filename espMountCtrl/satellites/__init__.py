@@ -1,10 +1,54 @@
 from os import path
-from skyfield.iokit import Loader
+from importlib import import_module
 from appdirs import user_cache_dir
 
-skyfield_load = Loader(path.join(user_cache_dir("espMountCtrl"), "skyfield"))
-skyfield_ts = skyfield_load.timescale()
+_SKYFIELD_DATA_DIR = path.join(user_cache_dir("espMountCtrl"), "skyfield")
 
-from .satelliteTracker import SatelliteTracker
-from . import satelliteFinder as SatelliteFinder
-from .transit import Transit
\ No newline at end of file
+# Skyfield, astropy and the timescale data are only loaded on first use, so that importing the
+# package stays cheap
+_loader = None
+_timescale = None
+
+def loader():
+    """Skyfield loader storing its files in the user cache directory"""
+    global _loader
+    if _loader is None:
+        from skyfield.iokit import Loader
+        _loader = Loader(_SKYFIELD_DATA_DIR)
+    return _loader
+
+def timescale():
+    global _timescale
+    if _timescale is None:
+        _timescale = loader().timescale()
+    return _timescale
+
+# Public names resolved on first access: (module, attribute), attribute None for the module itself
+_LAZY_EXPORTS = {
+    "SatelliteTracker": (".satelliteTracker", "SatelliteTracker"),
+    "SatelliteFinder": (".satelliteFinder", None),
+    "Transit": (".transit", "Transit"),
+    "AdaptiveTrack": (".transit", "AdaptiveTrack"),
+    "TleCatalogue": (".tleCatalogue", "TleCatalogue"),
+    "TransitCache": (".transitCache", "TransitCache"),
+    "PassScheduler": (".passScheduler", "PassScheduler"),
+    "ObservationPlan": (".passScheduler", "ObservationPlan"),
+    "PassPipeline": (".passPipeline", "PassPipeline"),
+}
+
+def __getattr__(name: str):
+    # Kept for compatibility, these used to be created at import
+    if name == "skyfield_load":
+        return loader()
+    if name == "skyfield_ts":
+        return timescale()
+    if name in _LAZY_EXPORTS:
+        module_name, attr = _LAZY_EXPORTS[name]
+        module = import_module(module_name, __name__)
+        value = module if attr is None else getattr(module, attr)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def __dir__():
+    return sorted(list(globals()) + list(_LAZY_EXPORTS) + ["skyfield_load", "skyfield_ts"])
@@ -0,0 +1,63 @@
+from typing import List, Sequence, Tuple
+import math
+import numpy as np
+from sgp4.api import SatrecArray
+from sgp4.exporter import export_tle
+from skyfield.api import EarthSatellite, wgs84, Time as SFTime
+from skyfield.toposlib import GeographicPosition
+from . import timescale
+
+# Spacing of the coarse elevation grid
+_SCREEN_STEP_S = 30.0
+# Satellites are kept when they get this close to the elevation mask on the coarse grid.
+# Covers passes that peak between two grid points and the simplified TEME -> Earth-fixed rotation.
+_SCREEN_MARGIN_DEG = 5.0
+# Grid points evaluated at once, bounds the memory used for large catalogues
+_SCREEN_CHUNK = 720
+
+def screen_visible(sats: Sequence[EarthSatellite], loc: GeographicPosition, t0: SFTime, t1: SFTime, min_elev_deg: float,
+                   step_s: float = _SCREEN_STEP_S, margin_deg: float = _SCREEN_MARGIN_DEG) -> np.ndarray:
+    """Returns a mask of satellites that may get above `min_elev_deg` between t0 and t1.
+
+    All satellites are propagated at once over a coarse time grid (SGP4 through SatrecArray). The
+    TEME frame is rotated to Earth-fixed by GMST only, which is accurate to well below the margin.
+    """
+    visible = np.zeros(len(sats), dtype=bool)
+    if len(sats) == 0:
+        return visible
+    satrecs = SatrecArray([sat.model for sat in sats])
+    site = np.asarray(loc.itrs_xyz.km)
+    lat, lon = loc.latitude.radians, loc.longitude.radians
+    up = np.array([math.cos(lat) * math.cos(lon), math.cos(lat) * math.sin(lon), math.sin(lat)])
+    sin_mask = math.sin(math.radians(min_elev_deg - margin_deg))
+
+    duration_s = (t1.tt - t0.tt) * 86400
+    offsets_s = np.append(np.arange(0, duration_s, step_s), duration_s)
+    for start in range(0, len(offsets_s), _SCREEN_CHUNK):
+        t = timescale().tt_jd(t0.whole, t0.tt_fraction + offsets_s[start:start + _SCREEN_CHUNK] / 86400)
+        ut1_fraction = np.asarray(t.ut1_fraction, dtype=np.float64)
+        ut1_whole = np.ascontiguousarray(np.broadcast_to(t.whole, ut1_fraction.shape), dtype=np.float64)
+        errors, r_teme, _ = satrecs.sgp4(ut1_whole, ut1_fraction)
+        theta = np.radians(t.gmst * 15)
+        c, s = np.cos(theta), np.sin(theta)
+        x = c * r_teme[..., 0] + s * r_teme[..., 1] - site[0]
+        y = -s * r_teme[..., 0] + c * r_teme[..., 1] - site[1]
+        z = r_teme[..., 2] - site[2]
+        sin_elev = (x * up[0] + y * up[1] + z * up[2]) / np.sqrt(x * x + y * y + z * z)
+        # Decayed or otherwise failed propagations count as not visible
+        sin_elev[errors != 0] = -1.0
+        visible |= np.any(sin_elev >= sin_mask, axis=1)
+    return visible
+
+def find_events(args: Tuple) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Process pool worker, runs skyfield's find_events for one satellite given as plain picklable values"""
+    line1, line2, name, lat, lon, elevation_m, t0, t1, min_elev_deg = args
+    sat = EarthSatellite(line1, line2, name, timescale())
+    t, events = sat.find_events(wgs84.latlon(lat, lon, elevation_m), timescale().tt_jd(*t0), timescale().tt_jd(*t1), min_elev_deg)
+    return np.asarray(t.whole), np.asarray(t.tt_fraction), np.asarray(events)
+
+def find_events_args(sat: EarthSatellite, loc: GeographicPosition, t0: SFTime, t1: SFTime, min_elev_deg: float) -> Tuple:
+    # Satrec objects can't be pickled, so satellites travel to the workers as TLE lines
+    line1, line2 = export_tle(sat.model)
+    return (line1, line2, sat.name, loc.latitude.degrees, loc.longitude.degrees, loc.elevation.m,
+            (t0.whole, t0.tt_fraction), (t1.whole, t1.tt_fraction), min_elev_deg)
@@ -0,0 +1,174 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Iterable, List, Optional, Tuple, Union
+from time import monotonic, sleep
+from espMountCtrl.mount import Mount
+from espMountCtrl.mountConnection import TrackPointAddResult
+from espMountCtrl.trackPath import TrackPath
+from .passScheduler import PlannedPass
+from .transit import Transit
+
+_DEFAULT_MAX_ERROR_ARCSEC = 20.0
+# Tracking is polled for its end only this long before the last track point, until then the pipeline sleeps
+_END_POLL_MARGIN_S = 1.0
+
+@dataclass
+class PassReport:
+    transit: Transit
+    points: int = 0
+    compute_s: float = 0.0          # Track computation on the worker
+    compute_wait_s: float = 0.0     # Time the pass waited for its track, zero when precomputed in time
+    slew_s: float = 0.0             # Goto to the rise position
+    upload_s: float = 0.0           # Track upload and clock sync, overlapped with the slew
+    idle_gap_s: float = 0.0         # From the end of the previous pass (or the start) until this one was armed
+    lead_s: float = 0.0             # Armed this long before the first track point, negative if late
+    streamed: bool = False
+    skipped: bool = False           # The pass was over before it could be armed
+
+    @property
+    def late(self) -> bool:
+        return not self.skipped and self.lead_s < 0
+
+    def __str__(self) -> str:
+        if self.skipped:
+            return f"{self.transit.satellite.name}: skipped, over before it could be armed"
+        return (f"{self.transit.satellite.name}: {self.points} points{' (streamed)' if self.streamed else ''}, "
+                f"idle gap {round(self.idle_gap_s, 2)} s (slew {round(self.slew_s, 2)} s, upload {round(self.upload_s, 2)} s, "
+                f"waited for track {round(self.compute_wait_s, 2)} s), armed {round(self.lead_s, 1)} s before rise")
+
+@dataclass
+class PipelineStats:
+    passes: List[PassReport] = field(default_factory=list)
+
+    @property
+    def total_idle_s(self) -> float:
+        return sum(report.idle_gap_s for report in self.passes if not report.skipped)
+
+    @property
+    def max_idle_s(self) -> float:
+        return max((report.idle_gap_s for report in self.passes if not report.skipped), default=0.0)
+
+    @property
+    def late(self) -> int:
+        return sum(1 for report in self.passes if report.late)
+
+    def __str__(self) -> str:
+        lines = [f"{len(self.passes)} passes, idle gap total {round(self.total_idle_s, 2)} s, max {round(self.max_idle_s, 2)} s, {self.late} armed late"]
+        lines.extend(f"  {report}" for report in self.passes)
+        return "\n".join(lines)
+
+class PassPipeline:
+    """Observes a sequence of passes back to back.
+
+    While one pass is tracked, the track of the next one is computed on a worker thread. As soon as
+    tracking ends, the mount slews to the next rise position, and the track is uploaded and the
+    clock synchronized while it moves. Once the slew ends, tracking is armed: the mount holds the
+    first track point until its time comes. The station is thus only idle for the slew, see the
+    idle gap of each pass in `stats`.
+
+    Passes are transits, or planned passes of PassScheduler.plan. Tracks are computed by
+    `compute(transit)`, Transit.calculate_adaptive_track by default. Tracks longer than the mount
+    buffer are streamed, which can only start after the slew.
+    """
+    def __init__(self, mount: Mount, passes: Iterable[Union[Transit, PlannedPass]], max_error_arcsec: float = _DEFAULT_MAX_ERROR_ARCSEC,
+                 compute: Callable[[Transit], TrackPath] = None, on_armed: Callable[[PassReport, TrackPath], None] = None):
+        self.mount = mount
+        self.transits: List[Transit] = [getattr(p, "transit", p) for p in passes]
+        self.max_error_arcsec = max_error_arcsec
+        self.compute = compute if compute is not None else self._adaptive_track
+        self.on_armed = on_armed
+        self.stats = PipelineStats()
+        self._stopped = False
+
+    def _adaptive_track(self, transit: Transit) -> TrackPath:
+        return transit.calculate_adaptive_track(self.mount, self.max_error_arcsec).track
+
+    def _timed_compute(self, transit: Transit) -> Tuple[TrackPath, float]:
+        t_start = monotonic()
+        track = self.compute(transit)
+        if not track.has_mount_pos:
+            track = track.with_mount_pos(self.mount)
+        return track, monotonic() - t_start
+
+    def stop(self) -> None:
+        """Ends the pipeline after the current pass, e.g. from another thread or on_armed"""
+        self._stopped = True
+
+    def run(self) -> PipelineStats:
+        """Observes all passes, returns when the last one ends"""
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="PassPipeline")
+        try:
+            future: Optional[Future] = None
+            if len(self.transits) > 0:
+                future = executor.submit(self._timed_compute, self.transits[0])
+            prev_end = monotonic()
+            for idx, transit in enumerate(self.transits):
+                if self._stopped:
+                    break
+                report = PassReport(transit)
+                t_wait = monotonic()
+                track, report.compute_s = future.result()
+                report.compute_wait_s = monotonic() - t_wait
+                if idx + 1 < len(self.transits):
+                    # Computed while this pass is positioned and tracked
+                    future = executor.submit(self._timed_compute, self.transits[idx + 1])
+
+                self.stats.passes.append(report)
+                if self.mount.time_ms() >= track.times_ms[-1]:
+                    report.skipped = True
+                    continue
+                streamer = self._arm(track, report)
+                report.idle_gap_s = monotonic() - prev_end
+                if self.on_armed is not None:
+                    self.on_armed(report, track)
+                self._wait_for_end(track)
+                if streamer is not None:
+                    streamer.stop()
+                    if streamer.error is not None:
+                        raise streamer.error
+                prev_end = monotonic()
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+        return self.stats
+
+    def _arm(self, track: TrackPath, report: PassReport):
+        """Slews to the first track point, uploading the track meanwhile, and starts tracking.
+        Returns the TrackStreamer if the track had to be streamed."""
+        mount = self.mount
+        connection = mount.mountConnection
+        report.points = len(track)
+        t_start = monotonic()
+        ax1, ax2 = int(track.ax1[0]), int(track.ax2[0])
+        connection.goto(ax1, ax2)
+        mount._goto_target = (ax1, ax2)
+
+        report.streamed = len(track) > connection.get_track_buffer_size()
+        if not report.streamed:
+            t_upload = monotonic()
+            connection.clear_track_buffer()
+            results = connection.add_track_points(mount._track_to_cmds(track))
+            for idx, result in enumerate(results):
+                if result != TrackPointAddResult.OK:
+                    raise Exception(f"Mount rejected track point {idx}: {result.name}")
+            mount.sync_time()
+            report.upload_s = monotonic() - t_upload
+
+        mount.wait_for_stop()
+        report.slew_s = monotonic() - t_start
+        streamer = None
+        if report.streamed:
+            # Streaming starts by stopping the mount, so it has to wait for the end of the slew
+            t_upload = monotonic()
+            streamer = mount.track_stream(track)
+            report.upload_s = monotonic() - t_upload
+        else:
+            connection.tracking_start()
+            mount._goto_target = None
+        report.lead_s = (track.times_ms[0] - mount.time_ms()) / 1000
+        return streamer
+
+    def _wait_for_end(self, track: TrackPath) -> None:
+        remaining_s = (track.times_ms[-1] - self.mount.time_ms()) / 1000 - _END_POLL_MARGIN_S
+        if remaining_s > 0:
+            sleep(remaining_s)
+        self.mount.wait_for_stop()
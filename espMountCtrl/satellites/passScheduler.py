@@ -0,0 +1,219 @@
+from bisect import bisect_right
+from dataclasses import dataclass
+from typing import Callable, Iterable, List, Optional, Sequence, Tuple, Union
+import math
+import numpy as np
+from astropy.coordinates import SkyCoord
+from astropy.time import Time
+import astropy.units as u
+from espMountCtrl.mount import Mount
+from .transit import Transit
+
+_SECONDS_PER_DAY = 86400.0
+# Defaults match the mount firmware (and its simulator)
+_DEFAULT_SLEW_RATE_DEG = 10.0
+_DEFAULT_ACCELERATION_DEG = 20.0
+# Time reserved after every slew, for settling and arming the track
+_DEFAULT_SETTLE_S = 5.0
+
+def max_elevation_value(transit: Transit) -> float:
+    """Default pass value, the culmination altitude in degrees"""
+    return float(transit.sf_culm_pos.altaz()[0].degrees)
+
+@dataclass
+class _Pass:
+    transit: Transit
+    norad: int
+    start_s: float      # Rise and set as TT seconds
+    end_s: float
+    rise_pos: Tuple[int, int]
+    set_pos: Tuple[int, int]
+    value: float
+
+@dataclass
+class PlannedPass:
+    transit: Transit
+    value: float
+    slew_s: float       # Slew from the previous pass (or the origin) to the rise position
+    gap_s: float        # Time from the end of the previous pass (or the origin) to the rise
+
+@dataclass
+class ObservationPlan:
+    passes: List[PlannedPass]
+    total_value: float
+    candidates: int
+
+    def __str__(self) -> str:
+        lines = [f"{len(self.passes)} of {self.candidates} passes, total value {round(self.total_value, 2)}"]
+        for planned in self.passes:
+            lines.append(f"{planned.transit}  value {round(planned.value, 2)}, slew {round(planned.slew_s, 1)} s of {round(planned.gap_s, 1)} s gap")
+        return "\n".join(lines)
+
+def _tt_seconds(t: Time) -> float:
+    return t.tt.jd * _SECONDS_PER_DAY
+
+class PassScheduler:
+    """Picks the most valuable set of passes one mount can observe.
+
+    Passes can't overlap, and between two passes the mount has to slew from the set position of
+    the first to the rise position of the second, plus `settle_s`. Slew time is estimated from the
+    mount axis counts (via Mount._coord_to_mount_pos), `slew_rate_deg` and `acceleration_deg` of
+    each axis, which move at the same time.
+
+    This is weighted interval scheduling with transition costs. Passes are processed by rise time,
+    and every pass takes the best plan ending before it: a running maximum covers the passes that
+    ended long enough ago for any slew, only the few that ended within the longest possible slew
+    are checked one by one. Plans of passes rising before the earliest added, replaced or removed
+    pass stay valid, so after `replace` (e.g. with transits from new TLEs) only the later part is
+    recomputed.
+    """
+    def __init__(self, mount: Mount, slew_rate_deg: Union[float, Tuple[float, float]] = _DEFAULT_SLEW_RATE_DEG,
+                 acceleration_deg: Union[float, Tuple[float, float]] = _DEFAULT_ACCELERATION_DEG, settle_s: float = _DEFAULT_SETTLE_S,
+                 value: Callable[[Transit], float] = max_elevation_value):
+        self.mount = mount
+        self.settle_s = settle_s
+        self.value = value
+        cpr = (mount.cprRa, mount.cprDec)
+        rates = slew_rate_deg if isinstance(slew_rate_deg, Sequence) else (slew_rate_deg, slew_rate_deg)
+        accels = acceleration_deg if isinstance(acceleration_deg, Sequence) else (acceleration_deg, acceleration_deg)
+        # Axis speeds and accelerations in counts
+        self._rates = tuple(rates[i] / 360 * cpr[i] for i in range(2))
+        self._accels = tuple(accels[i] / 360 * cpr[i] for i in range(2))
+        # No slew takes longer than a full turn of both axes
+        self._max_slew_s = self.slew_time((0, 0), cpr)
+        self._passes: List[_Pass] = []
+        self._starts: List[float] = []
+        self._best: List[float] = []
+        self._prev: List[int] = []
+        # Index of the first pass whose plan has to be recomputed
+        self._dirty = 0
+        self._origin: Optional[Tuple[float, Optional[Tuple[int, int]]]] = None
+
+    def __len__(self) -> int:
+        return len(self._passes)
+
+    def _axis_slew_time(self, counts: float, axis: int) -> float:
+        rate, accel = self._rates[axis], self._accels[axis]
+        if counts == 0:
+            return 0.0
+        if accel <= 0:
+            return counts / rate
+        # Trapezoidal profile, triangular when the axis can't reach full speed
+        if counts >= rate ** 2 / accel:
+            return counts / rate + rate / accel
+        return 2 * math.sqrt(counts / accel)
+
+    def slew_time(self, a: Tuple[int, int], b: Tuple[int, int]) -> float:
+        """Seconds of a goto between axis positions a and b"""
+        return max(self._axis_slew_time(abs(b[0] - a[0]), 0), self._axis_slew_time(abs(b[1] - a[1]), 1))
+
+    def set_origin(self, t: Time, position: Tuple[int, int] = None) -> None:
+        """Only passes reachable from `position` (axis counts, anywhere if None) at time `t` are planned"""
+        self._origin = (_tt_seconds(t), position)
+        self._dirty = 0
+
+    def _make_passes(self, transits: List[Transit]) -> List[_Pass]:
+        if len(transits) == 0:
+            return []
+        # All rise and set points in one array-valued coordinate, converted at once
+        alt = np.empty(2 * len(transits))
+        az = np.empty(2 * len(transits))
+        for i, transit in enumerate(transits):
+            for j, pos in enumerate((transit.sf_rise_pos, transit.sf_set_pos)):
+                pos_alt, pos_az, _ = pos.altaz()
+                alt[2 * i + j], az[2 * i + j] = pos_alt.degrees, pos_az.degrees
+        coord = SkyCoord(frame="altaz", alt=alt * u.deg, az=az * u.deg, location=self.mount.location)
+        ax1, ax2 = self.mount._coord_to_mount_pos(coord)
+        return [_Pass(
+            transit, transit.satellite.model.satnum,
+            transit.sf_rise_t.tt * _SECONDS_PER_DAY, transit.sf_set_t.tt * _SECONDS_PER_DAY,
+            (int(ax1[2 * i]), int(ax2[2 * i])), (int(ax1[2 * i + 1]), int(ax2[2 * i + 1])),
+            float(self.value(transit))
+        ) for i, transit in enumerate(transits)]
+
+    def add(self, transits: Iterable[Transit]) -> None:
+        for new_pass in self._make_passes(list(transits)):
+            idx = bisect_right(self._starts, new_pass.start_s)
+            self._passes.insert(idx, new_pass)
+            self._starts.insert(idx, new_pass.start_s)
+            self._dirty = min(self._dirty, idx)
+
+    def remove(self, norad: int) -> None:
+        """Removes all passes of the satellite"""
+        kept = []
+        for idx, planned in enumerate(self._passes):
+            if planned.norad == norad:
+                self._dirty = min(self._dirty, idx)
+            else:
+                kept.append(planned)
+        self._passes = kept
+        self._starts = [planned.start_s for planned in kept]
+
+    def replace(self, norad: int, transits: Iterable[Transit]) -> None:
+        """Replaces passes of the satellite, e.g. with ones found for its newer elements"""
+        self.remove(norad)
+        self.add(transits)
+
+    def _first_allowed(self, candidate: _Pass) -> bool:
+        if self._origin is None:
+            return True
+        t0, position = self._origin
+        slew = 0.0 if position is None else self.slew_time(position, candidate.rise_pos)
+        return t0 + slew + self.settle_s <= candidate.start_s
+
+    def _recompute(self) -> None:
+        passes = self._passes
+        n = len(passes)
+        dirty = min(self._dirty, n)
+        del self._best[dirty:]
+        del self._prev[dirty:]
+        by_end = sorted(range(n), key=lambda i: passes[i].end_s)
+        released = 0
+        released_best, released_arg = -math.inf, -1
+        for j in range(n):
+            candidate = passes[j]
+            # Passes that ended before even the longest slew could start are always compatible
+            always = candidate.start_s - self.settle_s - self._max_slew_s
+            while released < n and passes[by_end[released]].end_s <= always:
+                i = by_end[released]
+                if self._best[i] > released_best:
+                    released_best, released_arg = self._best[i], i
+                released += 1
+            if j < dirty:
+                continue
+            best, prev = released_best, released_arg
+            latest_end = candidate.start_s - self.settle_s
+            k = released
+            while k < n and passes[by_end[k]].end_s <= latest_end:
+                i = by_end[k]
+                if self._best[i] > best and passes[i].end_s + self.settle_s + self.slew_time(passes[i].set_pos, candidate.rise_pos) <= candidate.start_s:
+                    best, prev = self._best[i], i
+                k += 1
+            first = 0.0 if self._first_allowed(candidate) else -math.inf
+            if first >= best:
+                best, prev = first, -1
+            self._best.append(best + candidate.value)
+            self._prev.append(prev)
+        self._dirty = n
+
+    def plan(self) -> ObservationPlan:
+        self._recompute()
+        passes = self._passes
+        if len(passes) == 0 or max(self._best) == -math.inf:
+            return ObservationPlan([], 0.0, len(passes))
+        last = int(np.argmax(self._best))
+        chain = []
+        while last >= 0:
+            chain.append(last)
+            last = self._prev[last]
+        chain.reverse()
+
+        planned = []
+        prev_end, prev_pos = (None, None) if self._origin is None else self._origin
+        for idx in chain:
+            current = passes[idx]
+            slew = 0.0 if prev_pos is None else self.slew_time(prev_pos, current.rise_pos)
+            gap = 0.0 if prev_end is None else current.start_s - prev_end
+            planned.append(PlannedPass(current.transit, current.value, slew, gap))
+            prev_end, prev_pos = current.end_s, current.set_pos
+        return ObservationPlan(planned, float(self._best[chain[-1]]), len(passes))
@@ -5,19 +5,47 @@ from appdirs import user_cache_dir
 from skyfield.iokit import Loader
 from skyfield.sgp4lib import EarthSatellite
 from os import path
-from typing import List
-from . import skyfield_load
+from typing import Iterable, List
+from . import loader
+from .tleCatalogue import TleCatalogue
 
 
 _CELESTRAK_URL = "https://celestrak.com/NORAD/elements/gp.php"
 
+_catalogue: TleCatalogue = None
 
-def fromCatalogueNumber(catnr: int, reload: bool = True) -> List[EarthSatellite]:
-    return skyfield_load.tle_file(f"{_CELESTRAK_URL}?CATNR={catnr}&FORMAT=TLE", reload=reload, filename=f"sat-catnr-{catnr}.tle")
+def catalogue() -> TleCatalogue:
+    """Local TLE catalogue in the user cache directory. Everything downloaded by this module is added to it."""
+    global _catalogue
+    if _catalogue is None:
+        _catalogue = TleCatalogue()
+    return _catalogue
 
-def fromName(name: str, reload: bool = True) -> List[EarthSatellite]:
-    return skyfield_load.tle_file(f"{_CELESTRAK_URL}?NAME={name}&FORMAT=TLE", reload=reload, filename=f"sat-name-{name}.tle")
+def _remember(sats: List[EarthSatellite]) -> List[EarthSatellite]:
+    catalogue().ingest_satellites(sats)
+    return sats
+
+def fromCatalogueNumber(catnr: int, reload: bool = True, offline: bool = False) -> List[EarthSatellite]:
+    """Downloads elements of the object, or with `offline` takes them from the local catalogue only"""
+    if offline:
+        sat = catalogue().get(catnr)
+        return [] if sat is None else [sat]
+    return _remember(loader().tle_file(f"{_CELESTRAK_URL}?CATNR={catnr}&FORMAT=TLE", reload=reload, filename=f"sat-catnr-{catnr}.tle"))
+
+def fromCatalogueNumbers(catnrs: Iterable[int]) -> List[EarthSatellite]:
+    """Looks up many objects in the local catalogue at once, unknown numbers are skipped"""
+    return catalogue().get_many(catnrs)
+
+def fromName(name: str, reload: bool = True, offline: bool = False) -> List[EarthSatellite]:
+    if offline:
+        return catalogue().by_name(name)
+    return _remember(loader().tle_file(f"{_CELESTRAK_URL}?NAME={name}&FORMAT=TLE", reload=reload, filename=f"sat-name-{name}.tle"))
 
 def fromFile(filepath: str) -> List[EarthSatellite]:
-    return skyfield_load.tle_file(filepath)
+    """Loads a TLE or OMM file through the local catalogue, which only parses it again when it changed"""
+    return catalogue().load_file(filepath)
+
+def ingestFile(filepath: str) -> int:
+    """Adds a bulk TLE or OMM file to the local catalogue, for offline lookups by number or name"""
+    return catalogue().ingest_file(filepath)
     
\ No newline at end of file
@@ -6,17 +6,52 @@ from astropy.time import Time
 from astropy.units import Quantity
 import astropy.units as u
 from astropy.coordinates import AltAz
-from typing import List
+from typing import List, Iterable, Optional
+from concurrent.futures import ProcessPoolExecutor
+import os
+import numpy as np
 from skyfield.api import wgs84, Time as SFTime
-from . import skyfield_load, skyfield_ts as ts
+from . import timescale
+from . import catalogueSearch
+from .transitCache import TransitCache, TransitTimes, search_key
 
 _SF_SAT_RISE = 0
 _SF_SAT_CULMINATE = 1
 _SF_SAT_SET = 2
 
+TRANSIT_SORT_TIME = "time"
+TRANSIT_SORT_CULMINATION = "culmination"
+
+# Searches of a cached window continue past its end by this much (days) to complete a transit in progress
+_TRANSIT_COMPLETION_STEP = 1 / 24
+_TRANSIT_COMPLETION_MAX = 1.0
+
+_default_transit_cache: TransitCache = None
+
+def default_transit_cache() -> TransitCache:
+    global _default_transit_cache
+    if _default_transit_cache is None:
+        _default_transit_cache = TransitCache()
+    return _default_transit_cache
+
+def _split_times(tt: np.ndarray) -> List[SFTime]:
+    """Creates scalar times from TT julian dates, with nutation (most of the cost of a position) computed for all at once"""
+    if len(tt) == 0:
+        return []
+    times = timescale().tt_jd(tt)
+    d_psi, d_eps = times._nutation_angles_radians
+    result = []
+    for i in range(len(tt)):
+        t = times[i]
+        t._nutation_angles_radians = (d_psi[i], d_eps[i])
+        result.append(t)
+    return result
+
 class SatelliteTracker:
-    def __init__(self, mount: Mount):
+    def __init__(self, mount: Mount, use_cache: bool = True):
         self.mount = mount
+        # Results of find_transits are kept on disk, set to a different TransitCache or None as needed
+        self.transit_cache: Optional[TransitCache] = default_transit_cache() if use_cache else None
     
     @property
     def mount(self):
@@ -29,7 +64,7 @@ class SatelliteTracker:
 
     def get_sat_altaz(self, sat: EarthSatellite, t: Time) -> AltAz:
         sat_vector = sat - self._loc
-        topocentric = sat_vector.at(ts.from_astropy(t))
+        topocentric = sat_vector.at(timescale().from_astropy(t))
         alt, az, dst = topocentric.altaz()
         return AltAz(alt=alt.to(u.deg), az=az.to(u.deg), obstime=t, location=self.mount.location)
     
@@ -38,10 +73,38 @@ class SatelliteTracker:
         return sat_vector.at(t)
 
     def find_transits(self, sat: EarthSatellite, time_to: Time,  min_elev: Quantity = Quantity('0deg'), time_from: Time = Time.now()) -> List[Transit]:
-        t0 = ts.from_astropy(time_from)
-        t1 = ts.from_astropy(time_to)
-        sat_times, sat_events = sat.find_events(self._loc, t0, t1, min_elev.to(u.deg).value)
-        
+        t0 = timescale().from_astropy(time_from)
+        t1 = timescale().from_astropy(time_to)
+        min_elev_deg = min_elev.to(u.deg).value
+        if self.transit_cache is None:
+            sat_times, sat_events = sat.find_events(self._loc, t0, t1, min_elev_deg)
+            return self._events_to_transits(sat, sat_times, sat_events)
+
+        key = search_key(sat, self._loc, min_elev_deg)
+        for gap_t0, gap_t1 in self.transit_cache.gaps(key, t0.tt, t1.tt):
+            self.transit_cache.add(key, gap_t0, gap_t1, self._find_transit_times(sat, gap_t0, gap_t1, min_elev_deg))
+        cached = self.transit_cache.get(key, t0.tt, t1.tt)
+        times = _split_times(np.array(cached).reshape(-1))
+        return [self._transit_from_times(sat, *times[i * 3:i * 3 + 3]) for i in range(len(cached))]
+
+    def _find_transit_times(self, sat: EarthSatellite, t0: float, t1: float, min_elev_deg: float) -> List[TransitTimes]:
+        """Finds all transits rising between t0 and t1 (TT julian dates), including the ones setting after t1"""
+        extension = 0
+        while True:
+            sat_times, sat_events = sat.find_events(self._loc, timescale().tt_jd(t0), timescale().tt_jd(t1 + extension), min_elev_deg)
+            rises = [t for t, event in zip(sat_times.tt, sat_events) if event == _SF_SAT_RISE]
+            sets = [t for t, event in zip(sat_times.tt, sat_events) if event == _SF_SAT_SET]
+            in_progress = len(rises) > 0 and rises[-1] < t1 and (len(sets) == 0 or sets[-1] < rises[-1])
+            if not in_progress or extension >= _TRANSIT_COMPLETION_MAX:
+                break
+            extension += _TRANSIT_COMPLETION_STEP
+        transits = self._events_to_transits(sat, sat_times, sat_events)
+        return [(transit.sf_rise_t.tt, transit.sf_culm_t.tt, transit.sf_set_t.tt) for transit in transits if transit.sf_rise_t.tt < t1]
+
+    def _transit_from_times(self, sat: EarthSatellite, t_rise: SFTime, t_culm: SFTime, t_set: SFTime) -> Transit:
+        return Transit(t_rise, self._get_sat_pos(sat, t_rise), t_culm, self._get_sat_pos(sat, t_culm), t_set, self._get_sat_pos(sat, t_set), self._loc, sat)
+
+    def _events_to_transits(self, sat: EarthSatellite, sat_times: SFTime, sat_events) -> List[Transit]:
         transits: List[Transit] = []
 
         transit_t_rise = None
@@ -79,4 +142,42 @@ class SatelliteTracker:
         
         return transits
 
+    def find_transits_many(self, sats: Iterable[EarthSatellite], time_to: Time, min_elev: Quantity = Quantity('0deg'), time_from: Time = None,
+                           sort_by: str = TRANSIT_SORT_TIME, processes: int = None) -> List[Transit]:
+        """Finds transits of all given satellites, e.g. a whole TLE catalogue.
+
+        Satellites that never get near `min_elev` are discarded by a cheap vectorized pre-screen, only
+        the rest is refined with skyfield's find_events, in a process pool when there is more than one.
+        Transits are returned sorted by rise time, or by culmination altitude (highest first).
+        """
+        if sort_by not in (TRANSIT_SORT_TIME, TRANSIT_SORT_CULMINATION):
+            raise ValueError(f"Unknown transit sorting: {sort_by}")
+        if time_from is None:
+            time_from = Time.now()
+        sats = list(sats)
+        min_elev_deg = min_elev.to(u.deg).value
+        t0 = timescale().from_astropy(time_from)
+        t1 = timescale().from_astropy(time_to)
+
+        visible = catalogueSearch.screen_visible(sats, self._loc, t0, t1, min_elev_deg)
+        candidates = [sat for sat, is_visible in zip(sats, visible) if is_visible]
 
+        if processes is None:
+            processes = os.cpu_count() or 1
+        processes = min(processes, len(candidates))
+        transits: List[Transit] = []
+        if processes > 1:
+            args = [catalogueSearch.find_events_args(sat, self._loc, t0, t1, min_elev_deg) for sat in candidates]
+            with ProcessPoolExecutor(processes) as pool:
+                for sat, (whole, fraction, events) in zip(candidates, pool.map(catalogueSearch.find_events, args)):
+                    transits += self._events_to_transits(sat, timescale().tt_jd(whole, fraction), events)
+        else:
+            for sat in candidates:
+                sat_times, sat_events = sat.find_events(self._loc, t0, t1, min_elev_deg)
+                transits += self._events_to_transits(sat, sat_times, sat_events)
+
+        if sort_by == TRANSIT_SORT_TIME:
+            transits.sort(key=lambda transit: transit.sf_rise_t.tt)
+        else:
+            transits.sort(key=lambda transit: transit.sf_culm_pos.altaz()[0].degrees, reverse=True)
+        return transits
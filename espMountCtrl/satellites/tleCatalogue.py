@@ -0,0 +1,223 @@
+from os import path, makedirs, stat
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import sqlite3
+import threading
+from astropy.time import Time
+from appdirs import user_cache_dir
+from sgp4.api import Satrec, jday
+from sgp4.exporter import export_tle
+from sgp4 import omm
+from skyfield.sgp4lib import EarthSatellite
+from . import timescale
+
+_DEFAULT_CATALOGUE_PATH = path.join(user_cache_dir("espMountCtrl"), "tle-catalogue.sqlite")
+# Letters of the Alpha-5 catalogue number scheme (numbers above 99999), I and O are skipped
+_ALPHA5 = "ABCDEFGHJKLMNPQRSTUVWXYZ"
+
+# Elements of one object: (norad, name, line1, line2, epoch_jd)
+_Entry = Tuple[int, str, str, str, float]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS satellites (
+    norad INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    name_key TEXT NOT NULL,
+    line1 TEXT NOT NULL,
+    line2 TEXT NOT NULL,
+    epoch_jd REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS satellites_name ON satellites (name_key);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    tle TEXT NOT NULL
+);
+"""
+
+# Newer elements replace older ones, older elements never overwrite newer
+_UPSERT = """
+INSERT INTO satellites (norad, name, name_key, line1, line2, epoch_jd) VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (norad) DO UPDATE SET
+    name = excluded.name, name_key = excluded.name_key, line1 = excluded.line1, line2 = excluded.line2, epoch_jd = excluded.epoch_jd
+WHERE excluded.epoch_jd >= satellites.epoch_jd
+"""
+
+def _name_key(name: str) -> str:
+    return name.strip().upper()
+
+def _parse_norad(field: str) -> int:
+    field = field.strip()
+    if field[0].isalpha():
+        return (10 + _ALPHA5.index(field[0].upper())) * 10000 + int(field[1:])
+    return int(field)
+
+def _parse_epoch_jd(line1: str) -> float:
+    year = int(line1[18:20])
+    year += 1900 if year >= 57 else 2000
+    jd, fr = jday(year, 1, 1, 0, 0, 0)
+    return jd + fr + float(line1[20:32]) - 1
+
+def _tle_entry(name: Optional[str], line1: str, line2: str) -> _Entry:
+    norad = _parse_norad(line1[2:7])
+    if not name:
+        name = str(norad)
+    return norad, name, line1, line2, _parse_epoch_jd(line1)
+
+def _iter_tle_lines(lines: Iterable[str]) -> Iterator[_Entry]:
+    """Parses 2 and 3 line TLE text, only the fields needed for the index - no SGP4 initialization"""
+    name = None
+    line1 = None
+    for line in lines:
+        line = line.rstrip()
+        if line.startswith("1 ") and len(line) >= 64:
+            line1 = line
+        elif line.startswith("2 ") and line1 is not None:
+            yield _tle_entry(name, line1, line)
+            name = None
+            line1 = None
+        elif line:
+            name = line[2:] if line.startswith("0 ") else line
+            line1 = None
+
+def _iter_omm_fields(filepath: str) -> Iterator[_Entry]:
+    with open(filepath) as f:
+        records = omm.parse_xml(f) if filepath.lower().endswith(".xml") else omm.parse_csv(f)
+        for fields in records:
+            sat = Satrec()
+            omm.initialize(sat, fields)
+            line1, line2 = export_tle(sat)
+            yield _tle_entry(fields.get("OBJECT_NAME"), line1, line2)
+
+class TleCatalogue:
+    """Local store of orbital elements, indexed by NORAD catalogue number and name.
+
+    Bulk TLE or OMM (XML, CSV) files are ingested once into an SQLite index on disk, after which
+    lookups work offline and only touch the requested rows. EarthSatellite objects are built lazily
+    on first lookup and cached. For every object only the elements with the newest epoch are kept.
+    The catalogue can be shared by threads, its lookups and ingests are serialized.
+    """
+    def __init__(self, filepath: str = _DEFAULT_CATALOGUE_PATH):
+        self.filepath = filepath
+        if filepath != ":memory:":
+            makedirs(path.dirname(path.abspath(filepath)), exist_ok=True)
+        # One connection and satellite cache shared by all threads, lookups and ingests are serialized
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(filepath, check_same_thread=False)
+        self._db.executescript(_SCHEMA)
+        self._satellites: Dict[int, EarthSatellite] = {}
+        # Satellites of files loaded by load_file: path -> ((mtime, size), satellites)
+        self._files: Dict[str, Tuple[Tuple[int, int], List[EarthSatellite]]] = {}
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM satellites").fetchone()[0]
+
+    def __contains__(self, norad: int) -> bool:
+        with self._lock:
+            return self._db.execute("SELECT 1 FROM satellites WHERE norad = ?", (norad,)).fetchone() is not None
+
+    def _ingest_entries(self, entries: Iterable[_Entry]) -> int:
+        rows = [(norad, name, _name_key(name), line1, line2, epoch_jd) for norad, name, line1, line2, epoch_jd in entries]
+        with self._lock:
+            with self._db:
+                self._db.executemany(_UPSERT, rows)
+            # Cached satellites may have been replaced by newer elements
+            self._satellites.clear()
+            return len(rows)
+
+    def _file_entries(self, filepath: str) -> List[_Entry]:
+        lower = filepath.lower()
+        if lower.endswith(".xml") or lower.endswith(".csv"):
+            return list(_iter_omm_fields(filepath))
+        with open(filepath) as f:
+            return list(_iter_tle_lines(f))
+
+    def ingest_file(self, filepath: str) -> int:
+        """Adds all objects of a TLE (2 or 3 line) or OMM (.xml, .csv) file. Returns number of element sets read."""
+        return self._ingest_entries(self._file_entries(filepath))
+
+    def load_file(self, filepath: str) -> List[EarthSatellite]:
+        """Returns the objects of a TLE or OMM file with the file's own elements, in file order. The file is
+        parsed and ingested only when it changed (path, modification time or size) since it was last loaded,
+        otherwise its element sets are read back from the catalogue."""
+        filepath = path.abspath(filepath)
+        st = stat(filepath)
+        key = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            cached = self._files.get(filepath)
+            if cached is not None and cached[0] == key:
+                return list(cached[1])
+            row = self._db.execute("SELECT mtime_ns, size, tle FROM files WHERE path = ?", (filepath,)).fetchone()
+            if row is not None and (row[0], row[1]) == key:
+                entries = list(_iter_tle_lines(row[2].splitlines()))
+            else:
+                entries = self._file_entries(filepath)
+                self._ingest_entries(entries)
+                tle = "\n".join(f"{name}\n{line1}\n{line2}" for _, name, line1, line2, _ in entries)
+                with self._db:
+                    self._db.execute("INSERT OR REPLACE INTO files (path, mtime_ns, size, tle) VALUES (?, ?, ?, ?)",
+                                     (filepath, st.st_mtime_ns, st.st_size, tle))
+            sats = [EarthSatellite(line1, line2, name, timescale()) for _, name, line1, line2, _ in entries]
+            self._files[filepath] = (key, sats)
+            return list(sats)
+
+    def ingest_tle_text(self, text: str) -> int:
+        return self._ingest_entries(_iter_tle_lines(text.splitlines()))
+
+    def ingest_satellites(self, sats: Iterable[EarthSatellite]) -> int:
+        """Adds already loaded satellites, e.g. the ones downloaded by SatelliteFinder"""
+        return self._ingest_entries(_tle_entry(sat.name, *export_tle(sat.model)) for sat in sats)
+
+    def _satellite(self, row) -> EarthSatellite:
+        norad, name, line1, line2 = row
+        sat = self._satellites.get(norad)
+        if sat is None:
+            sat = EarthSatellite(line1, line2, name, timescale())
+            self._satellites[norad] = sat
+        return sat
+
+    def get(self, norad: int) -> Optional[EarthSatellite]:
+        with self._lock:
+            row = self._db.execute("SELECT norad, name, line1, line2 FROM satellites WHERE norad = ?", (norad,)).fetchone()
+            return None if row is None else self._satellite(row)
+
+    def get_many(self, norads: Iterable[int]) -> List[EarthSatellite]:
+        """Returns satellites in the order of `norads`, unknown numbers are skipped"""
+        with self._lock:
+            norads = list(norads)
+            rows = {}
+            # Stay below SQLite's limit of query parameters
+            for start in range(0, len(norads), 500):
+                chunk = norads[start:start + 500]
+                query = f"SELECT norad, name, line1, line2 FROM satellites WHERE norad IN ({','.join('?' * len(chunk))})"
+                for row in self._db.execute(query, chunk):
+                    rows[row[0]] = row
+            return [self._satellite(rows[norad]) for norad in norads if norad in rows]
+
+    def by_name(self, name: str) -> List[EarthSatellite]:
+        """Returns satellites with the given name (case insensitive)"""
+        with self._lock:
+            rows = self._db.execute("SELECT norad, name, line1, line2 FROM satellites WHERE name_key = ?", (_name_key(name),))
+            return [self._satellite(row) for row in rows]
+
+    def norads(self) -> List[int]:
+        with self._lock:
+            return [row[0] for row in self._db.execute("SELECT norad FROM satellites ORDER BY norad")]
+
+    def epoch(self, norad: int) -> Optional[Time]:
+        with self._lock:
+            row = self._db.execute("SELECT epoch_jd FROM satellites WHERE norad = ?", (norad,)).fetchone()
+        return None if row is None else Time(row[0], format="jd", scale="utc")
+
+    def stale(self, max_age_days: float, t: Time = None) -> List[int]:
+        """Returns NORAD numbers of objects whose elements are older than `max_age_days` at time `t` (now by default)"""
+        if t is None:
+            t = Time.now()
+        limit = t.utc.jd - max_age_days
+        with self._lock:
+            return [row[0] for row in self._db.execute("SELECT norad FROM satellites WHERE epoch_jd < ? ORDER BY norad", (limit,))]
@@ -6,9 +6,47 @@ from dataclasses import dataclass
 from skyfield.api import EarthSatellite, Time as SFTime
 from skyfield.positionlib import Geometric
 from skyfield.toposlib import GeographicPosition
-from typing import List
-from espMountCtrl.mount import TrackPoint
-from . import skyfield_ts as ts
+from skyfield.nutationlib import iau2000b_radians
+from typing import List, Tuple
+import math
+import numpy as np
+from espMountCtrl.mount import Mount, TrackPoint, TrackPath
+from . import timescale
+
+_ARCSEC_PER_TURN = 360 * 3600
+# Adaptive sampling starts from a uniform grid with this step, which is dense enough not to skip over
+# any feature of a satellite pass
+_ADAPTIVE_INITIAL_STEP_S = 60.0
+# Intervals are not split below this length, bounds the point count for unreachable error limits
+_ADAPTIVE_MIN_STEP_S = 0.5
+# Interval fractions at which the interpolation error is probed before an interval is accepted
+_ADAPTIVE_PROBES = np.array([0.25, 0.5, 0.75])
+# Step of the final check of the achieved error
+_ADAPTIVE_CHECK_STEP_S = 0.5
+
+@dataclass
+class AdaptiveTrack:
+    track: TrackPath
+    max_error_arcsec: float     # Largest on-sky distance between the linearly interpolated and the true position
+    max_error_limit_arcsec: float
+
+    @property
+    def point_count(self) -> int:
+        return len(self.track)
+
+    def __str__(self) -> str:
+        return f"{self.point_count} points, max error {self.max_error_arcsec:.1f}\" (limit {self.max_error_limit_arcsec:.1f}\")"
+
+def _wrap_counts(diff: np.ndarray, cpr: int) -> np.ndarray:
+    return (diff + cpr / 2) % cpr - cpr / 2
+
+def _interpolation_error_arcsec(mount: Mount, w, ax1_a, ax2_a, ax1_b, ax2_b, ax1, ax2) -> np.ndarray:
+    """On-sky error of the mount position linearly interpolated between a and b at fraction w, from the true position (ax1, ax2)"""
+    d1 = _wrap_counts(ax1_a + _wrap_counts(ax1_b - ax1_a, mount.cprRa) * w - ax1, mount.cprRa) * _ARCSEC_PER_TURN / mount.cprRa
+    d2 = (ax2_a + (ax2_b - ax2_a) * w - ax2) * _ARCSEC_PER_TURN / mount.cprDec
+    # First axis errors shrink towards the mount's pole
+    d1 *= np.cos(np.radians(ax2 * 360 / mount.cprDec))
+    return np.hypot(d1, d2)
 
 @dataclass
 class Transit:
@@ -63,25 +101,105 @@ class Transit:
 
     def get_sat_altaz(self, t: Time) -> SkyCoord:
         diff = self.satellite - self.sf_loc
-        sf_time = ts.from_astropy(t)
+        sf_time = timescale().from_astropy(t)
         return self._sf_pos_to_altaz(diff.at(sf_time), sf_time)
 
     def get_distance(self, t: Time) -> Quantity:
         diff = self.satellite - self.sf_loc
-        sf_time = ts.from_astropy(t)
+        sf_time = timescale().from_astropy(t)
         pos = diff.at(sf_time)
         _,_, dst = pos.altaz()
         return dst.km * u.km
 
+    def _sf_track_times(self, track_point_count) -> SFTime:
+        # Same sampling as before: track_point_count points from rise (inclusive) to set (exclusive)
+        return self._sf_times(np.arange(track_point_count) / track_point_count)
+
+    def _sf_times(self, fractions: np.ndarray) -> SFTime:
+        """Times at fractions of the transit, 0 is the rise and 1 the set"""
+        duration = self.sf_set_t.tt - self.sf_rise_t.tt
+        t = timescale().tt_jd(self.sf_rise_t.whole, self.sf_rise_t.tt_fraction + fractions * duration)
+        # The full IAU 2000A nutation series dominates the computation. The 2000B model is accurate to 
+        # a milliarcsecond, far below the mount's resolution
+        t._nutation_angles_radians = iau2000b_radians(t)
+        return t
+
+    def calculate_track(self, track_point_count) -> TrackPath:
+        t = self._sf_track_times(track_point_count)
+        alt, az, _ = (self.satellite - self.sf_loc).at(t).altaz()
+        return TrackPath(t.to_astropy().unix * 1000, alt=alt.degrees, az=az.degrees, location=self.location)
+
     def calculate_track_points(self, track_point_count) -> List[TrackPoint]:
-        dt = (self.time_set - self.time_rise) / track_point_count
-        track_points: List[TrackPoint] = []
-        for i in range(track_point_count):
-            t = self.time_rise + i * dt
-            pos = self.get_sat_altaz(t)
-            point = TrackPoint(pos, t)
-            track_points.append(point)
-        return track_points
+        """Compatibility shim returning TrackPoint objects, calculate_track is many times faster"""
+        return list(self.calculate_track(track_point_count))
+
+    def _mount_pos_at(self, mount: Mount, fractions: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Returns (alt, az, ax1, ax2) at fractions of the transit, mount positions are not rounded to whole counts"""
+        alt, az, _ = (self.satellite - self.sf_loc).at(self._sf_times(fractions)).altaz()
+        ha, dec = mount._coordEngine.altaz_to_hadec(alt.degrees, az.degrees)
+        return alt.degrees, az.degrees, (ha + 180.0) % 360.0 / 360.0 * mount.cprRa, dec / 360.0 * mount.cprDec
+
+    def calculate_adaptive_track(self, mount: Mount, max_error_arcsec: float) -> AdaptiveTrack:
+        """Samples the transit only as densely as needed for the mount's linear interpolation between track
+        points to stay within `max_error_arcsec` of the true position.
+
+        Intervals are split in half while any of their probes exceeds the limit, so points gather where
+        the path bends (culmination) and stay sparse elsewhere. Errors are measured against the rounded
+        mount positions that get uploaded, and finally checked on a dense grid, where any interval still
+        above the limit is split further.
+        """
+        duration_s = (self.sf_set_t.tt - self.sf_rise_t.tt) * 86400
+        min_width = _ADAPTIVE_MIN_STEP_S / duration_s
+        mid = len(_ADAPTIVE_PROBES) // 2
+
+        fractions = np.linspace(0, 1, max(2, int(math.ceil(duration_s / _ADAPTIVE_INITIAL_STEP_S)) + 1))
+        alt, az, ax1, ax2 = self._mount_pos_at(mount, fractions)
+        ax1, ax2 = np.rint(ax1), np.rint(ax2)
+        # Intervals still to be checked, as (left, right) values of (fraction, alt, az, ax1, ax2)
+        nodes = (fractions, alt, az, ax1, ax2)
+        left = tuple(values[:-1] for values in nodes)
+        right = tuple(values[1:] for values in nodes)
+
+        check = np.linspace(0, 1, max(2, int(math.ceil(duration_s / _ADAPTIVE_CHECK_STEP_S)) + 1))
+        _, _, check_ax1, check_ax2 = self._mount_pos_at(mount, check)
+        while True:
+            new_nodes = []
+            while len(left[0]) > 0:
+                probes = left[0][:, None] + (right[0] - left[0])[:, None] * _ADAPTIVE_PROBES
+                p_alt, p_az, p_ax1, p_ax2 = (values.reshape(probes.shape) for values in self._mount_pos_at(mount, probes.reshape(-1)))
+                error = _interpolation_error_arcsec(mount, _ADAPTIVE_PROBES, left[3][:, None], left[4][:, None],
+                                                    right[3][:, None], right[4][:, None], p_ax1, p_ax2)
+                split = (error.max(axis=1) > max_error_arcsec) & (right[0] - left[0] > min_width)
+                # Midpoint probes become new track points
+                mid_values = (probes[split, mid], p_alt[split, mid], p_az[split, mid], np.rint(p_ax1[split, mid]), np.rint(p_ax2[split, mid]))
+                new_nodes.append(mid_values)
+                left, right = (
+                    tuple(np.concatenate((l[split], m)) for l, m in zip(left, mid_values)),
+                    tuple(np.concatenate((m, r[split])) for m, r in zip(mid_values, right))
+                )
+            nodes = tuple(np.concatenate(values) for values in zip(nodes, *new_nodes))
+            order = np.argsort(nodes[0])
+            nodes = tuple(values[order] for values in nodes)
+            fractions, alt, az, ax1, ax2 = nodes
+
+            i = np.clip(np.searchsorted(fractions, check, side="right") - 1, 0, len(fractions) - 2)
+            w = (check - fractions[i]) / (fractions[i + 1] - fractions[i])
+            error = _interpolation_error_arcsec(mount, w, ax1[i], ax2[i], ax1[i + 1], ax2[i + 1], check_ax1, check_ax2)
+            bad = np.unique(i[error > max_error_arcsec])
+            bad = bad[fractions[bad + 1] - fractions[bad] > min_width]
+            if len(bad) == 0:
+                break
+            # The probes missed these, split them unconditionally
+            m_fractions = (fractions[bad] + fractions[bad + 1]) / 2
+            m_alt, m_az, m_ax1, m_ax2 = self._mount_pos_at(mount, m_fractions)
+            mid_values = (m_fractions, m_alt, m_az, np.rint(m_ax1), np.rint(m_ax2))
+            nodes = tuple(np.concatenate(values) for values in zip(nodes, mid_values))
+            left = tuple(np.concatenate((values[bad], m)) for values, m in zip((fractions, alt, az, ax1, ax2), mid_values))
+            right = tuple(np.concatenate((m, values[bad + 1])) for values, m in zip((fractions, alt, az, ax1, ax2), mid_values))
+
+        times_ms = self._sf_times(fractions).to_astropy().unix * 1000
+        track = TrackPath(times_ms, alt=alt, az=az, ax1=ax1, ax2=ax2, location=self.location)
+        return AdaptiveTrack(track, float(error.max()), max_error_arcsec)
 
     def __str__(self) -> str:
         s1 = f"{self.satellite.name}:"
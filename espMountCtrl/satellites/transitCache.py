@@ -0,0 +1,118 @@
+from os import path, makedirs
+from typing import List, Tuple
+import hashlib
+import sqlite3
+import threading
+import time
+from appdirs import user_cache_dir
+from sgp4.exporter import export_tle
+from skyfield.sgp4lib import EarthSatellite
+from skyfield.toposlib import GeographicPosition
+
+_DEFAULT_CACHE_PATH = path.join(user_cache_dir("espMountCtrl"), "transits.sqlite")
+# Size bound of the cache, least recently used searches are evicted above it
+_DEFAULT_MAX_TRANSITS = 100000
+
+# Rise, culmination and set time of one transit, as TT julian dates
+TransitTimes = Tuple[float, float, float]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS searches (
+    key TEXT PRIMARY KEY,
+    last_used REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS windows (
+    key TEXT NOT NULL,
+    t0 REAL NOT NULL,
+    t1 REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS windows_key ON windows (key);
+CREATE TABLE IF NOT EXISTS transits (
+    key TEXT NOT NULL,
+    rise REAL NOT NULL,
+    culm REAL NOT NULL,
+    set_ REAL NOT NULL,
+    UNIQUE (key, rise)
+);
+CREATE INDEX IF NOT EXISTS transits_key ON transits (key, rise);
+"""
+
+def search_key(sat: EarthSatellite, loc: GeographicPosition, min_elev_deg: float) -> str:
+    """Identifies one transit search - satellite elements (including their epoch), observer site and elevation mask"""
+    line1, line2 = export_tle(sat.model)
+    site = f"{loc.latitude.degrees:.9f} {loc.longitude.degrees:.9f} {loc.elevation.m:.3f}"
+    return hashlib.sha1(f"{line1}\n{line2}\n{site}\n{min_elev_deg:.9f}".encode()).hexdigest()
+
+class TransitCache:
+    """Transits found by earlier searches, stored on disk.
+
+    For every search key the cache knows which time windows were already searched, so a request
+    for an overlapping window only needs the uncovered parts computed. Transits are stored with
+    their rise in a searched window, complete even if they set after its end. New elements of a
+    satellite give a new key, so outdated results are never returned and eventually get evicted.
+    The cache can be shared by threads, its methods are serialized.
+    """
+    def __init__(self, filepath: str = _DEFAULT_CACHE_PATH, max_transits: int = _DEFAULT_MAX_TRANSITS):
+        self.filepath = filepath
+        self.max_transits = max_transits
+        if filepath != ":memory:":
+            makedirs(path.dirname(path.abspath(filepath)), exist_ok=True)
+        # One connection shared by all threads, transactions must not interleave
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(filepath, check_same_thread=False)
+        self._db.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def clear(self) -> None:
+        with self._lock, self._db:
+            for table in ("searches", "windows", "transits"):
+                self._db.execute(f"DELETE FROM {table}")
+
+    def gaps(self, key: str, t0: float, t1: float) -> List[Tuple[float, float]]:
+        """Returns parts of the window t0 - t1 (TT julian dates) not searched yet"""
+        gaps = []
+        start = t0
+        with self._lock:
+            windows = self._db.execute("SELECT t0, t1 FROM windows WHERE key = ? AND t1 > ? AND t0 < ? ORDER BY t0", (key, t0, t1)).fetchall()
+        for w0, w1 in windows:
+            if w0 > start:
+                gaps.append((start, w0))
+            start = max(start, w1)
+        if start < t1:
+            gaps.append((start, t1))
+        return gaps
+
+    def get(self, key: str, t0: float, t1: float) -> List[TransitTimes]:
+        """Returns transits that rise and set within t0 - t1, ordered by rise time"""
+        with self._lock, self._db:
+            self._db.execute("UPDATE searches SET last_used = ? WHERE key = ?", (time.time(), key))
+            return self._db.execute("SELECT rise, culm, set_ FROM transits WHERE key = ? AND rise >= ? AND set_ <= ? ORDER BY rise",
+                                    (key, t0, t1)).fetchall()
+
+    def add(self, key: str, t0: float, t1: float, transits: List[TransitTimes]) -> None:
+        """Stores results of a search of window t0 - t1, `transits` are the ones rising within it"""
+        with self._lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO searches (key, last_used) VALUES (?, ?)", (key, time.time()))
+            self._db.executemany("INSERT OR REPLACE INTO transits (key, rise, culm, set_) VALUES (?, ?, ?, ?)",
+                                 [(key, *transit) for transit in transits])
+            # Merge the window with the ones it touches, so that lookups stay short
+            for w0, w1 in self._db.execute("SELECT t0, t1 FROM windows WHERE key = ? AND t1 >= ? AND t0 <= ?", (key, t0, t1)).fetchall():
+                t0, t1 = min(t0, w0), max(t1, w1)
+            self._db.execute("DELETE FROM windows WHERE key = ? AND t1 >= ? AND t0 <= ?", (key, t0, t1))
+            self._db.execute("INSERT INTO windows (key, t0, t1) VALUES (?, ?, ?)", (key, t0, t1))
+            self._evict()
+
+    def _evict(self) -> None:
+        count = self._db.execute("SELECT COUNT(*) FROM transits").fetchone()[0]
+        if count <= self.max_transits:
+            return
+        for key, in self._db.execute("SELECT key FROM searches ORDER BY last_used").fetchall():
+            removed = self._db.execute("DELETE FROM transits WHERE key = ?", (key,)).rowcount
+            self._db.execute("DELETE FROM windows WHERE key = ?", (key,))
+            self._db.execute("DELETE FROM searches WHERE key = ?", (key,))
+            count -= removed
+            if count <= self.max_transits:
+                break
@@ -0,0 +1 @@
+from .mountSimulator import MountSimulator
@@ -0,0 +1,216 @@
+from collections import deque
+from typing import Deque, List, Tuple, Callable
+import math
+import time
+from ..mountConnection import MountStatus, TrackPointAddResult
+
+_PROTOCOL_VERSION = 1
+_DEFAULT_CPR = 160000
+_DEFAULT_TRACK_BUFFER_SIZE = 512
+_DEFAULT_SLEW_SPEED_DEG = 10.0
+_DEFAULT_ACCELERATION_DEG = 20.0
+# Integration step of the axis kinematics, in seconds
+_SIM_STEP = 0.005
+# Time constant of the tracking position loop, in seconds
+_TRACK_LOOP_TAU = 0.1
+_RESPONSE_ERROR = "+err"
+
+class _Axis:
+    def __init__(self, max_speed: float, acceleration: float):
+        self.max_speed = max_speed
+        self.acceleration = acceleration
+        self.pos = 0.0
+        self.vel = 0.0
+
+    def step(self, v_desired: float, dt: float) -> None:
+        v_desired = max(-self.max_speed, min(self.max_speed, v_desired))
+        dv = self.acceleration * dt
+        self.vel += max(-dv, min(dv, v_desired - self.vel))
+        self.pos += self.vel * dt
+
+    def goto_speed(self, target: float) -> float:
+        """Fastest speed towards target from which the axis can still brake in time"""
+        dist = target - self.pos
+        return math.copysign(min(self.max_speed, math.sqrt(2 * self.acceleration * abs(dist))), dist)
+
+class MountSimulator:
+    """Software model of the ESP mount firmware, speaking the same line protocol as the real mount.
+
+    Time is passed explicitly (in seconds of `clock`) to `handle_line`, so that a transport can
+    process a command at the moment its last byte would arrive over the wire.
+    """
+    def __init__(self, cpr: Tuple[int, int] = (_DEFAULT_CPR, _DEFAULT_CPR),
+                 track_buffer_size: int = _DEFAULT_TRACK_BUFFER_SIZE,
+                 slew_speed_deg: Tuple[float, float] = (_DEFAULT_SLEW_SPEED_DEG, _DEFAULT_SLEW_SPEED_DEG),
+                 acceleration_deg: Tuple[float, float] = (_DEFAULT_ACCELERATION_DEG, _DEFAULT_ACCELERATION_DEG),
+                 clock: Callable[[], float] = time.monotonic):
+        self.cpr = (int(cpr[0]), int(cpr[1]))
+        self.track_buffer_size = track_buffer_size
+        self.clock = clock
+        self.axes = [
+            _Axis(slew_speed_deg[i] / 360 * self.cpr[i], acceleration_deg[i] / 360 * self.cpr[i]) for i in range(2)
+        ]
+        self.status = MountStatus.STOPPED
+        self.goto_target = (0.0, 0.0)
+        self.track_buffer: Deque[Tuple[int, int, int]] = deque()
+        self._t = clock()
+        # Mount time counts milliseconds from boot until it is set
+        self._time_offset_ms = -self._t * 1000
+        self._handlers = {
+            "gp": self._cmd_get_pos,
+            "p": self._cmd_set_pos,
+            "t": self._cmd_set_time,
+            "gt": self._cmd_get_time,
+            "g": self._cmd_goto,
+            "s": self._cmd_stop,
+            "gc": self._cmd_get_cpr,
+            "gpv": self._cmd_get_protocol_version,
+            "gtbf": self._cmd_get_track_buffer_free,
+            "gtbs": self._cmd_get_track_buffer_size,
+            "tbc": self._cmd_track_buffer_clear,
+            "tp": self._cmd_track_point_add,
+            "tb": self._cmd_tracking_start,
+            "ts": self._cmd_tracking_stop,
+            "gs": self._cmd_get_status,
+        }
+
+    @property
+    def position(self) -> Tuple[int, int]:
+        return round(self.axes[0].pos), round(self.axes[1].pos)
+
+    def mount_time(self, t: float = None) -> float:
+        if t is None:
+            t = self._t
+        return t * 1000 + self._time_offset_ms
+
+    def handle_line(self, line: str, t: float = None) -> str:
+        """Processes one command line (without newline) and returns the response line"""
+        self.advance(self.clock() if t is None else t)
+        segments = line.strip().split(" ")
+        if len(segments[0]) < 2 or segments[0][0] != "+" or segments[0][1:] not in self._handlers:
+            return _RESPONSE_ERROR
+        cmd = segments[0][1:]
+        try:
+            args = [int(float(arg)) for arg in segments[1:]]
+            result = self._handlers[cmd](*args)
+        except (TypeError, ValueError):
+            return _RESPONSE_ERROR
+        if result is None:
+            return f"+{cmd}"
+        return " ".join([f"+{cmd}"] + [str(val) for val in result])
+
+    def advance(self, t: float) -> None:
+        """Integrates the axis kinematics up to time t"""
+        while self._t < t:
+            if self.status == MountStatus.STOPPED:
+                self._t = t
+                break
+            dt = min(_SIM_STEP, t - self._t)
+            self._t += dt
+            self._step(dt)
+
+    def _step(self, dt: float) -> None:
+        if self.status == MountStatus.GOTO:
+            arrived = True
+            for axis, target in zip(self.axes, self.goto_target):
+                axis.step(axis.goto_speed(target), dt)
+                if abs(target - axis.pos) < 0.5 and abs(axis.vel) <= axis.acceleration * dt:
+                    axis.pos = target
+                    axis.vel = 0.0
+                else:
+                    arrived = False
+            if arrived:
+                self.status = MountStatus.STOPPED
+        elif self.status == MountStatus.TRACKING:
+            speeds = self._track_speeds(self.mount_time())
+            if speeds is None:
+                self.status = MountStatus.BRAKING
+            else:
+                for axis, speed in zip(self.axes, speeds):
+                    axis.step(speed, dt)
+        if self.status == MountStatus.BRAKING:
+            for axis in self.axes:
+                axis.step(0.0, dt)
+            if all(axis.vel == 0.0 for axis in self.axes):
+                self.status = MountStatus.STOPPED
+
+    def _track_speeds(self, now_ms: float) -> List[float]:
+        """Returns desired speeds of both axes, or None when the track has ended"""
+        buffer = self.track_buffer
+        while len(buffer) >= 2 and buffer[1][2] <= now_ms:
+            buffer.popleft()
+        if len(buffer) == 0:
+            return None
+        p0 = buffer[0]
+        if now_ms < p0[2]:
+            # Track has not started yet, move to its first point and wait there
+            return [axis.goto_speed(p0[i]) for i, axis in enumerate(self.axes)]
+        if len(buffer) == 1:
+            buffer.popleft()
+            return None
+        p1 = buffer[1]
+        dt_ms = p1[2] - p0[2]
+        part = (now_ms - p0[2]) / dt_ms if dt_ms > 0 else 1.0
+        speeds = []
+        for i, axis in enumerate(self.axes):
+            target = p0[i] + (p1[i] - p0[i]) * part
+            v_ff = (p1[i] - p0[i]) / dt_ms * 1000 if dt_ms > 0 else 0.0
+            speeds.append(v_ff + (target - axis.pos) / _TRACK_LOOP_TAU)
+        return speeds
+
+    def _cmd_get_pos(self):
+        return self.position
+
+    def _cmd_set_pos(self, ax1: int, ax2: int):
+        self.axes[0].pos = float(ax1)
+        self.axes[1].pos = float(ax2)
+
+    def _cmd_set_time(self, mount_time: int):
+        self._time_offset_ms = mount_time - self._t * 1000
+
+    def _cmd_get_time(self):
+        return (round(self.mount_time()),)
+
+    def _cmd_goto(self, ax1: int, ax2: int):
+        self.goto_target = (float(ax1), float(ax2))
+        self.status = MountStatus.GOTO
+
+    def _cmd_stop(self, instant: int = 0):
+        if instant:
+            for axis in self.axes:
+                axis.vel = 0.0
+            self.status = MountStatus.STOPPED
+        elif self.status != MountStatus.STOPPED:
+            self.status = MountStatus.BRAKING
+
+    def _cmd_get_cpr(self):
+        return self.cpr
+
+    def _cmd_get_protocol_version(self):
+        return (_PROTOCOL_VERSION,)
+
+    def _cmd_get_track_buffer_free(self):
+        return (self.track_buffer_size - len(self.track_buffer),)
+
+    def _cmd_get_track_buffer_size(self):
+        return (self.track_buffer_size,)
+
+    def _cmd_track_buffer_clear(self):
+        self.track_buffer.clear()
+
+    def _cmd_track_point_add(self, ax1: int, ax2: int, mount_time: int):
+        if len(self.track_buffer) >= self.track_buffer_size:
+            return (TrackPointAddResult.BUFFER_FULL.value,)
+        self.track_buffer.append((ax1, ax2, mount_time))
+        return (TrackPointAddResult.OK.value,)
+
+    def _cmd_tracking_start(self):
+        if len(self.track_buffer) > 0:
+            self.status = MountStatus.TRACKING
+
+    def _cmd_tracking_stop(self):
+        if self.status == MountStatus.TRACKING:
+            self.status = MountStatus.BRAKING
+
+    def _cmd_get_status(self):
+        return (self.status.value,)
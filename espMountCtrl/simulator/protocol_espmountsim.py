@@ -0,0 +1,265 @@
+# pyserial URL handler for the simulated mount.
+#
+# URL format:    espmountsim://[?option=value[&option=value...]]
+# options:
+# - "cpr" counts per revolution, one value for both axes or "ax1,ax2"
+# - "buffer" track buffer size
+# - "speed" maximum slew speed in deg/s, one value or "ax1,ax2"
+# - "accel" axis acceleration in deg/s^2, one value or "ax1,ax2"
+# - "latency" firmware command processing time in ms
+# - "timing" 1 (default) to delay bytes according to the baudrate, 0 to deliver them instantly
+# - "drop" probability of a response getting lost, "garble" of a response arriving with a corrupted byte,
+#   and "seed" of the random generator deciding it, for testing recovery from line noise
+from collections import deque
+from typing import Deque, List, Optional
+from urllib import parse as urlparse
+import random
+import threading
+import time
+from serial.serialutil import SerialBase, SerialException, to_bytes, PortNotOpenError
+from .mountSimulator import MountSimulator
+
+_URL_SCHEME = "espmountsim"
+# Start bit, 8 data bits and a stop bit
+_BITS_PER_BYTE = 10
+
+def _parse_pair(value: str, cast) -> tuple:
+    values = [cast(v) for v in value.split(",")]
+    if len(values) == 1:
+        values = values * 2
+    if len(values) != 2:
+        raise ValueError(f"expected one or two values: {value!r}")
+    return tuple(values)
+
+class _PendingLine:
+    def __init__(self, data: bytes, start: float, byte_time: float):
+        self.data = data
+        self.start = start
+        self.byte_time = byte_time
+        self.offset = 0
+
+    def available(self, now: float) -> int:
+        """Number of bytes of this line that have arrived by `now` and were not read yet"""
+        if self.byte_time == 0:
+            received = len(self.data) if now >= self.start else 0
+        else:
+            received = min(len(self.data), int((now - self.start) / self.byte_time))
+        return max(0, received - self.offset)
+
+    def arrival(self, idx: int) -> float:
+        """Time when byte number idx of the line arrives"""
+        return self.start + (idx + 1) * self.byte_time
+
+class Serial(SerialBase):
+    """Serial port implementation talking to a MountSimulator instead of real hardware.
+
+    Commands are executed at the time their last byte would have been received by the mount and
+    responses become readable byte by byte at the configured baudrate.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.simulator: Optional[MountSimulator] = None
+        self.latency = 0.0
+        self.byte_timing = True
+        self.drop_rate = 0.0
+        self.garble_rate = 0.0
+        self._random = random.Random()
+        self._cond = threading.Condition()
+        self._incoming: Deque[_PendingLine] = deque()
+        self._partial = b""
+        self._tx_free_at = 0.0
+        self._rx_free_at = 0.0
+        self._read_cancelled = False
+        super().__init__(*args, **kwargs)
+
+    def open(self):
+        if self.is_open:
+            raise SerialException("Port is already open.")
+        if self._port is None:
+            raise SerialException("Port must be configured before it can be used.")
+        self.from_url(self.port)
+        self._reconfigure_port()
+        self.is_open = True
+        self.reset_input_buffer()
+
+    def close(self):
+        with self._cond:
+            self.is_open = False
+            self._cond.notify_all()
+        super().close()
+
+    def _reconfigure_port(self):
+        if not isinstance(self._baudrate, int) or self._baudrate <= 0:
+            raise ValueError(f"invalid baudrate: {self._baudrate!r}")
+
+    def from_url(self, url: str):
+        parts = urlparse.urlsplit(url)
+        if parts.scheme != _URL_SCHEME:
+            raise SerialException(f'expected a string in the form "{_URL_SCHEME}://[?option=value...]": {url!r}')
+        kwargs = {}
+        try:
+            for option, values in urlparse.parse_qs(parts.query, True).items():
+                value = values[0]
+                if option == "cpr":
+                    kwargs["cpr"] = _parse_pair(value, int)
+                elif option == "buffer":
+                    kwargs["track_buffer_size"] = int(value)
+                elif option == "speed":
+                    kwargs["slew_speed_deg"] = _parse_pair(value, float)
+                elif option == "accel":
+                    kwargs["acceleration_deg"] = _parse_pair(value, float)
+                elif option == "latency":
+                    self.latency = float(value) / 1000
+                elif option == "timing":
+                    self.byte_timing = value not in ("0", "false", "no")
+                elif option == "drop":
+                    self.drop_rate = float(value)
+                elif option == "garble":
+                    self.garble_rate = float(value)
+                elif option == "seed":
+                    self._random.seed(int(value))
+                else:
+                    raise ValueError(f"unknown option: {option!r}")
+        except ValueError as e:
+            raise SerialException(f"invalid {_URL_SCHEME} URL {url!r}: {e}")
+        self.simulator = MountSimulator(**kwargs)
+
+    @property
+    def _byte_time(self) -> float:
+        return _BITS_PER_BYTE / self._baudrate if self.byte_timing else 0.0
+
+    def write(self, data) -> int:
+        if not self.is_open:
+            raise PortNotOpenError()
+        data = to_bytes(data)
+        with self._cond:
+            now = time.monotonic()
+            byte_time = self._byte_time
+            lines = (self._partial + data).split(b"\n")
+            self._partial = lines.pop()
+            for line in lines:
+                # Bytes are sent one after another, the mount processes the line once all of it arrived
+                received = max(now, self._tx_free_at) + (len(line) + 1) * byte_time
+                self._tx_free_at = received
+                response = self.simulator.handle_line(line.decode("ascii", "replace"), received)
+                response_data = self._add_noise((response + "\n").encode("ascii"))
+                if response_data is None:
+                    continue
+                start = max(received + self.latency, self._rx_free_at)
+                self._rx_free_at = start + len(response_data) * byte_time
+                self._incoming.append(_PendingLine(response_data, start, byte_time))
+            self._cond.notify_all()
+        return len(data)
+
+    def _add_noise(self, data: bytes) -> Optional[bytes]:
+        """Returns the response as the host receives it, None if it gets lost"""
+        if self.drop_rate > 0 and self._random.random() < self.drop_rate:
+            return None
+        if self.garble_rate > 0 and self._random.random() < self.garble_rate:
+            idx = self._random.randrange(len(data) - 1)
+            data = data[:idx] + bytes([self._random.choice(b"#?~\x7f\xff")]) + data[idx + 1:]
+        return data
+
+    def _read(self, size: Optional[int], terminator: Optional[bytes]) -> bytes:
+        if not self.is_open:
+            raise PortNotOpenError()
+        deadline = None if self._timeout is None else time.monotonic() + self._timeout
+        data = bytearray()
+
+        def done() -> bool:
+            return (size is not None and len(data) >= size) or (terminator is not None and data.endswith(terminator))
+
+        with self._cond:
+            while self.is_open and not done() and not self._read_cancelled:
+                now = time.monotonic()
+                while len(self._incoming) > 0 and not done():
+                    line = self._incoming[0]
+                    count = line.available(now)
+                    if count == 0:
+                        break
+                    if size is not None:
+                        count = min(count, size - len(data))
+                    chunk = line.data[line.offset:line.offset + count]
+                    if terminator is not None and terminator in chunk:
+                        chunk = chunk[:chunk.index(terminator) + len(terminator)]
+                    data += chunk
+                    line.offset += len(chunk)
+                    if line.offset == len(line.data):
+                        self._incoming.popleft()
+                if done() or (deadline is not None and now >= deadline):
+                    break
+                wait_until = deadline
+                if len(self._incoming) > 0:
+                    line = self._incoming[0]
+                    next_byte = line.arrival(line.offset)
+                    wait_until = next_byte if deadline is None else min(deadline, next_byte)
+                self._cond.wait(None if wait_until is None else max(0.0, wait_until - now))
+            self._read_cancelled = False
+        return bytes(data)
+
+    def cancel_read(self):
+        """Makes a blocked read return what it has, e.g. for stopping pyserial's ReaderThread"""
+        with self._cond:
+            self._read_cancelled = True
+            self._cond.notify_all()
+
+    def read(self, size: int = 1) -> bytes:
+        return self._read(size, None)
+
+    def read_until(self, expected: bytes = b"\n", size: int = None) -> bytes:
+        return self._read(size, expected)
+
+    def readline(self, size: int = -1) -> bytes:
+        return self._read(None if size is None or size < 0 else size, b"\n")
+
+    @property
+    def in_waiting(self) -> int:
+        if not self.is_open:
+            raise PortNotOpenError()
+        with self._cond:
+            now = time.monotonic()
+            return sum(line.available(now) for line in self._incoming)
+
+    @property
+    def out_waiting(self) -> int:
+        return 0
+
+    def reset_input_buffer(self):
+        """Drops the bytes that already arrived. Responses still on the wire arrive later, like on a real port."""
+        with self._cond:
+            now = time.monotonic()
+            while len(self._incoming) > 0:
+                line = self._incoming[0]
+                line.offset += line.available(now)
+                if line.offset < len(line.data):
+                    break
+                self._incoming.popleft()
+
+    def reset_output_buffer(self):
+        with self._cond:
+            self._partial = b""
+
+    def _update_break_state(self):
+        pass
+
+    def _update_rts_state(self):
+        pass
+
+    def _update_dtr_state(self):
+        pass
+
+    @property
+    def cts(self):
+        return True
+
+    @property
+    def dsr(self):
+        return True
+
+    @property
+    def ri(self):
+        return False
+
+    @property
+    def cd(self):
+        return True
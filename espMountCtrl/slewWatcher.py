@@ -0,0 +1,193 @@
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+from time import monotonic, sleep
+import asyncio
+import threading
+from .mountConnection import MountStatus
+
+# Polling interval bounds, in seconds. Near the expected finish the mount is polled at the minimum.
+_MIN_POLL_INTERVAL = 0.05
+_MAX_POLL_INTERVAL = 2.0
+# Interval used while the remaining time can't be estimated (first poll, unknown target)
+_FALLBACK_POLL_INTERVAL = 0.1
+# Share of the estimated remaining time slept before the next poll
+_ETA_POLL_FRACTION = 0.5
+
+@dataclass
+class SlewSample:
+    t: float    # monotonic time of the poll
+    status: MountStatus
+    ax1: int
+    ax2: int
+
+def _axis_speeds(prev: SlewSample, cur: SlewSample) -> Tuple[float, float]:
+    dt = cur.t - prev.t
+    if dt <= 0:
+        return 0.0, 0.0
+    return abs(cur.ax1 - prev.ax1) / dt, abs(cur.ax2 - prev.ax2) / dt
+
+def _axis_eta(remaining: float, speed: float, accel: Optional[float], braking: bool) -> float:
+    # Braking at constant deceleration covers the distance at half the current speed on average
+    if braking:
+        return 2 * remaining / speed
+    if accel is None or accel <= 0:
+        return remaining / speed
+    braking_distance = speed ** 2 / (2 * accel)
+    if remaining <= braking_distance:
+        return 2 * remaining / speed
+    return (remaining - braking_distance) / speed + speed / accel
+
+def estimate_eta(prev: SlewSample, cur: SlewSample, target: Optional[Tuple[int, int]],
+                 accel: Tuple[Optional[float], Optional[float]] = (None, None)) -> Optional[float]:
+    """Estimated seconds until the mount stops, from two consecutive polls, the goto target and
+    axis accelerations (counts/s^2) if known. None if the polls don't tell (no target, axes not
+    moving yet, not slewing)."""
+    if cur.status == MountStatus.STOPPED:
+        return 0.0
+    if target is None or cur.status not in (MountStatus.GOTO, MountStatus.BRAKING):
+        return None
+    if cur.t <= prev.t:
+        return None
+    eta = 0.0
+    speeds = _axis_speeds(prev, cur)
+    for pos, goal, speed, axis_accel in zip((cur.ax1, cur.ax2), target, speeds, accel):
+        remaining = abs(goal - pos)
+        if remaining == 0:
+            continue
+        if speed == 0:
+            return None
+        eta = max(eta, _axis_eta(remaining, speed, axis_accel, cur.status == MountStatus.BRAKING))
+    return eta
+
+class SlewWatcher:
+    """Waits for the mount to stop, polling as little as possible.
+
+    The remaining slew time is estimated from the goto target and the axis speed observed between
+    polls. Polls are spaced at a fraction of that estimate, so they are sparse during a long slew
+    and dense near its end. `on_transition(old, new)` is called for every status change seen, and
+    `future(status)` returns a future resolved when the status is first seen. Statuses the mount
+    never showed (a goto may stop without braking) resolve when it stops.
+
+    `update` only does the bookkeeping, `wait` and `wait_async` poll a connection with it.
+    """
+    def __init__(self, target: Tuple[int, int] = None,
+                 on_transition: Callable[[MountStatus, MountStatus], None] = None,
+                 min_interval: float = _MIN_POLL_INTERVAL, max_interval: float = _MAX_POLL_INTERVAL):
+        self.target = target
+        self.on_transition = on_transition
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.polls = 0
+        self.eta: Optional[float] = None
+        # Highest axis accelerations seen so far (counts/s^2), they bound the braking time
+        self.accel: List[Optional[float]] = [None, None]
+        self.samples: List[SlewSample] = []
+        self._futures: Dict[MountStatus, Future] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def status(self) -> Optional[MountStatus]:
+        return self.samples[-1].status if len(self.samples) > 0 else None
+
+    @property
+    def stopped(self) -> bool:
+        return self.status == MountStatus.STOPPED
+
+    def future(self, status: MountStatus = MountStatus.STOPPED) -> Future:
+        with self._lock:
+            future = self._futures.get(status)
+            if future is None:
+                future = self._futures[status] = Future()
+                if status == self.status or self.stopped:
+                    future.set_result(status)
+            return future
+
+    def update(self, status: MountStatus, ax1: int, ax2: int, t: float = None) -> float:
+        """Records a poll and returns the delay before the next one"""
+        sample = SlewSample(monotonic() if t is None else t, status, ax1, ax2)
+        prev = self.samples[-1] if len(self.samples) > 0 else None
+        self.samples.append(sample)
+        self.polls += 1
+        if prev is not None and prev.status != status and self.on_transition is not None:
+            self.on_transition(prev.status, status)
+        with self._lock:
+            for future_status, future in self._futures.items():
+                if not future.done() and (future_status == status or status == MountStatus.STOPPED):
+                    future.set_result(future_status)
+        if status == MountStatus.STOPPED:
+            self.eta = 0.0
+            return 0.0
+        if prev is None:
+            self.eta = None
+        else:
+            self._update_accel()
+            self.eta = estimate_eta(prev, sample, self.target, tuple(self.accel))
+        if self.eta is None:
+            return _FALLBACK_POLL_INTERVAL
+        # Speeds seen while the axes still accelerate overestimate the remaining time, so the
+        # interval grows at most as fast as the time watched so far until the estimate settles
+        watched = sample.t - self.samples[0].t
+        return max(self.min_interval, min(self.max_interval, watched, self.eta * _ETA_POLL_FRACTION))
+
+    def _update_accel(self) -> None:
+        if len(self.samples) < 3:
+            return
+        s0, s1, s2 = self.samples[-3:]
+        dt = (s2.t - s0.t) / 2
+        if dt <= 0:
+            return
+        for i, (v0, v1) in enumerate(zip(_axis_speeds(s0, s1), _axis_speeds(s1, s2))):
+            accel = abs(v1 - v0) / dt
+            if self.accel[i] is None or accel > self.accel[i]:
+                self.accel[i] = accel
+
+    def wait(self, connection, timeout: float = None) -> None:
+        """Polls `connection` until the mount stops. Raises TimeoutError after `timeout` seconds."""
+        deadline = None if timeout is None else monotonic() + timeout
+        while True:
+            status = connection.get_mount_status()
+            if status == MountStatus.STOPPED:
+                self.update(status, *self._last_position())
+                return
+            delay = self._limit_delay(self.update(status, *connection.get_position()), deadline, timeout)
+            sleep(delay)
+
+    async def wait_async(self, connection, timeout: float = None) -> None:
+        """Same as wait, for AsyncMountConnection"""
+        deadline = None if timeout is None else monotonic() + timeout
+        while True:
+            status = await connection.get_mount_status()
+            if status == MountStatus.STOPPED:
+                self.update(status, *self._last_position())
+                return
+            delay = self._limit_delay(self.update(status, *(await connection.get_position())), deadline, timeout)
+            await asyncio.sleep(delay)
+
+    def start(self, connection, timeout: float = None) -> Future:
+        """Runs `wait` on a background thread. Returns the future of STOPPED, which also carries errors of the polling."""
+        stopped = self.future(MountStatus.STOPPED)
+        def run():
+            try:
+                self.wait(connection, timeout)
+            except Exception as e:
+                with self._lock:
+                    for future in self._futures.values():
+                        if not future.done():
+                            future.set_exception(e)
+        threading.Thread(target=run, name="SlewWatcher", daemon=True).start()
+        return stopped
+
+    def _limit_delay(self, delay: float, deadline: Optional[float], timeout: float) -> float:
+        if deadline is None:
+            return delay
+        remaining = deadline - monotonic()
+        if remaining <= 0:
+            raise TimeoutError(f"Mount didn't stop within {timeout} s")
+        return min(delay, remaining)
+
+    def _last_position(self) -> Tuple[int, int]:
+        # The final position isn't needed for anything, so stopping costs no extra query
+        if len(self.samples) > 0:
+            return self.samples[-1].ax1, self.samples[-1].ax2
+        return self.target if self.target is not None else (0, 0)
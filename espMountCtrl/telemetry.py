@@ -0,0 +1,152 @@
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Tuple
+from time import monotonic
+import threading
+import numpy as np
+from .mountConnection import MountStatus
+
+_DEFAULT_RATE_HZ = 10.0
+_DEFAULT_CAPACITY = 36000   # An hour at the default rate
+
+@dataclass
+class TelemetrySample:
+    time_ms: float      # Mount time (unix ms) at which the sample was taken
+    ax1: int
+    ax2: int
+    status: MountStatus
+
+class TelemetryBuffer:
+    """Fixed-capacity ring buffer of raw telemetry samples, stored as preallocated NumPy arrays.
+
+    Alt/az is only computed when asked for, in one vectorized batch for all samples added since
+    the previous request.
+    """
+    def __init__(self, capacity: int = _DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.times_ms = np.zeros(capacity, dtype=np.float64)
+        self.ax1 = np.zeros(capacity, dtype=np.int64)
+        self.ax2 = np.zeros(capacity, dtype=np.int64)
+        self.status = np.zeros(capacity, dtype=np.int8)
+        self._alt = np.zeros(capacity, dtype=np.float64)
+        self._az = np.zeros(capacity, dtype=np.float64)
+        # Total number of samples ever added and of samples converted to altaz
+        self.count = 0
+        self._converted = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return min(self.count, self.capacity)
+
+    def append(self, sample: TelemetrySample) -> None:
+        with self._lock:
+            slot = self.count % self.capacity
+            self.times_ms[slot] = sample.time_ms
+            self.ax1[slot] = sample.ax1
+            self.ax2[slot] = sample.ax2
+            self.status[slot] = sample.status.value
+            self.count += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self.count = 0
+            self._converted = 0
+
+    def _slots(self, since: int) -> np.ndarray:
+        """Ring slots of samples with total index >= since, oldest first"""
+        start = max(since, self.count - self.capacity)
+        return np.arange(start, self.count) % self.capacity
+
+    def raw(self, since: int = 0) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Returns copies of (times_ms, ax1, ax2, status) of the samples with total index >= since, oldest first"""
+        with self._lock:
+            slots = self._slots(since)
+            return self.times_ms[slots], self.ax1[slots], self.ax2[slots], self.status[slots]
+
+    def altaz(self, converter: Callable[[np.ndarray, np.ndarray], Tuple[np.ndarray, np.ndarray]], since: int = 0) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Returns (times_ms, alt, az) of samples with total index >= since, converting new samples with `converter`"""
+        with self._lock:
+            new_slots = self._slots(self._converted)
+            if len(new_slots) > 0:
+                self._alt[new_slots], self._az[new_slots] = converter(self.ax1[new_slots], self.ax2[new_slots])
+            self._converted = self.count
+            slots = self._slots(since)
+            return self.times_ms[slots], self._alt[slots], self._az[slots]
+
+class Telemetry:
+    """Polls mount position and status on its own thread at a fixed rate.
+
+    Samples go to a TelemetryBuffer and to subscribed callbacks, so that consumers (GUI, loggers)
+    don't need to issue serial commands of their own.
+    """
+    def __init__(self, mount, rate_hz: float = _DEFAULT_RATE_HZ, capacity: int = _DEFAULT_CAPACITY):
+        self.mount = mount
+        self.rate_hz = rate_hz
+        self.buffer = TelemetryBuffer(capacity)
+        self.latest: Optional[TelemetrySample] = None
+        self.error: Optional[Exception] = None
+        self._subscribers: List[Callable[[TelemetrySample], None]] = []
+        self._new_sample = threading.Condition()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def subscribe(self, callback: Callable[[TelemetrySample], None]) -> Callable[[], None]:
+        """Calls `callback` from the polling thread for every new sample. Returns a function that unsubscribes it."""
+        self._subscribers.append(callback)
+        return lambda: self._subscribers.remove(callback)
+
+    def start(self) -> None:
+        if self.is_running():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="Telemetry", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def wait_for_sample(self, after: int = 0, timeout: float = None) -> Optional[TelemetrySample]:
+        """Waits until more than `after` samples were taken in total and returns the latest one"""
+        with self._new_sample:
+            self._new_sample.wait_for(lambda: self.buffer.count > after or not self.is_running(), timeout)
+            return self.latest
+
+    def altaz(self, since: int = 0) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Returns (times_ms, alt, az) arrays of the buffered samples with total index >= since"""
+        mount = self.mount
+        return self.buffer.altaz(lambda ax1, ax2: mount._coordEngine.mount_pos_to_altaz(ax1, ax2, mount.cprRa, mount.cprDec), since)
+
+    def poll(self) -> TelemetrySample:
+        """Takes one sample"""
+        connection = self.mount.mountConnection
+        ax1, ax2 = connection.get_position()
+        time_ms = self.mount.time_ms()
+        status = connection.get_mount_status()
+        sample = TelemetrySample(time_ms, ax1, ax2, status)
+        with self._new_sample:
+            self.buffer.append(sample)
+            self.latest = sample
+            self._new_sample.notify_all()
+        for callback in list(self._subscribers):
+            callback(sample)
+        return sample
+
+    def _run(self) -> None:
+        period = 1.0 / self.rate_hz
+        next_poll = monotonic()
+        try:
+            while True:
+                self.poll()
+                # Keep a fixed rate regardless of how long the poll took, without trying to catch up missed polls
+                next_poll = max(next_poll + period, monotonic())
+                if self._stop_event.wait(next_poll - monotonic()):
+                    break
+        except Exception as e:
+            self.error = e
+        finally:
+            with self._new_sample:
+                self._new_sample.notify_all()
@@ -0,0 +1,192 @@
+"""Binary track files.
+
+A file is a fixed little-endian header followed by packed records, one per track point: int64 unix
+milliseconds and either float64 altitude/azimuth in degrees (TRACK_KIND_ALTAZ) or int32 axis counts
+(TRACK_KIND_AXES). Records start at `data_offset`, so they can be mapped with numpy.memmap and
+uploaded chunk by chunk without loading the whole track.
+
+The header stores the site, the mount's axis direction and counts per revolution the track was
+computed for, and the epoch of the TLE it came from. Any records are only valid at the same site,
+axis counts additionally need a mount with the same axis direction and CPR.
+"""
+from dataclasses import dataclass
+from itertools import chain
+from typing import Iterable, Iterator, Optional, Tuple, Union
+import math
+import struct
+import numpy as np
+from astropy.coordinates import EarthLocation
+from astropy.time import Time
+import astropy.units as u
+from .trackPath import TrackPath
+
+TRACK_FILE_VERSION = 1
+TRACK_KIND_ALTAZ = 0
+TRACK_KIND_AXES = 1
+
+_MAGIC = b"ESPTRACK"
+# magic, version, kind, data offset, point count, lat, lon (deg), elevation (m), axis alt, az (deg), cpr ra, dec, TLE epoch (unix ms)
+_HEADER = struct.Struct("<8sHHIQdddddqqd")
+_DATA_ALIGNMENT = 64
+_DATA_OFFSET = (_HEADER.size + _DATA_ALIGNMENT - 1) // _DATA_ALIGNMENT * _DATA_ALIGNMENT
+_RECORD_DTYPES = {
+    TRACK_KIND_ALTAZ: np.dtype([("time_ms", "<i8"), ("alt", "<f8"), ("az", "<f8")]),
+    TRACK_KIND_AXES: np.dtype([("time_ms", "<i8"), ("ax1", "<i4"), ("ax2", "<i4")]),
+}
+# Records converted to upload commands at once
+_CHUNK_SIZE = 4096
+# Axis direction stored in the file has to match the mount's this closely for axis records to be valid
+_AXIS_TOLERANCE_DEG = 1e-6
+# Records are only valid for a mount this close to the site they were computed for
+_LOCATION_TOLERANCE_M = 10.0
+
+def _optional(value: float) -> Optional[float]:
+    return None if math.isnan(value) else value
+
+@dataclass
+class TrackFileHeader:
+    kind: int = TRACK_KIND_ALTAZ
+    count: int = 0
+    location: Optional[EarthLocation] = None
+    ax_alt: Optional[float] = None      # Direction of the mount's first axis, degrees
+    ax_az: Optional[float] = None
+    cpr_ra: Optional[int] = None
+    cpr_dec: Optional[int] = None
+    tle_epoch: Optional[Time] = None
+    version: int = TRACK_FILE_VERSION
+    data_offset: int = _DATA_OFFSET
+
+    @classmethod
+    def for_mount(cls, mount, kind: int = TRACK_KIND_ALTAZ, tle_epoch: Time = None) -> "TrackFileHeader":
+        return cls(kind, 0, mount.location, float(mount.axCoord.alt.deg), float(mount.axCoord.az.deg),
+                   int(mount.cprRa), int(mount.cprDec), tle_epoch)
+
+    def pack(self) -> bytes:
+        nan = float("nan")
+        if self.location is not None:
+            lat, lon, elevation = self.location.lat.deg, self.location.lon.deg, self.location.height.to_value(u.m)
+        else:
+            lat = lon = elevation = nan
+        return _HEADER.pack(
+            _MAGIC, self.version, self.kind, self.data_offset, self.count, lat, lon, elevation,
+            nan if self.ax_alt is None else self.ax_alt, nan if self.ax_az is None else self.ax_az,
+            self.cpr_ra or 0, self.cpr_dec or 0, nan if self.tle_epoch is None else self.tle_epoch.unix * 1000
+        ).ljust(self.data_offset, b"\0")
+
+    @classmethod
+    def unpack(cls, data: bytes) -> "TrackFileHeader":
+        if len(data) < _HEADER.size or data[:len(_MAGIC)] != _MAGIC:
+            raise ValueError("Not a track file")
+        (_, version, kind, data_offset, count, lat, lon, elevation, ax_alt, ax_az,
+         cpr_ra, cpr_dec, tle_epoch_ms) = _HEADER.unpack_from(data)
+        if version > TRACK_FILE_VERSION:
+            raise ValueError(f"Track file version {version} is newer than the supported {TRACK_FILE_VERSION}")
+        if kind not in _RECORD_DTYPES:
+            raise ValueError(f"Unknown track file record kind {kind}")
+        location = None if math.isnan(lat) else EarthLocation.from_geodetic(lon=lon * u.deg, lat=lat * u.deg, height=elevation * u.m)
+        tle_epoch = _optional(tle_epoch_ms)
+        return cls(kind, count, location, _optional(ax_alt), _optional(ax_az), cpr_ra or None, cpr_dec or None,
+                   None if tle_epoch is None else Time(tle_epoch / 1000, format="unix"), version, data_offset)
+
+def _records(path: TrackPath, kind: int, mount) -> np.ndarray:
+    records = np.empty(len(path), dtype=_RECORD_DTYPES[kind])
+    records["time_ms"] = np.rint(path.times_ms)
+    if kind == TRACK_KIND_AXES:
+        records["ax1"], records["ax2"] = path.mount_pos(mount)
+    else:
+        records["alt"], records["az"] = path.altaz(mount)
+    return records
+
+def write_track_file(filepath: str, track: Union[TrackPath, Iterable[TrackPath]], mount=None, kind: int = None, tle_epoch: Time = None) -> TrackFileHeader:
+    """Saves a track, or a sequence of track chunks (e.g. a generator of a long scan), to a binary track file.
+
+    Records hold axis counts if the (first) path has them or `kind` is TRACK_KIND_AXES, altaz otherwise.
+    `mount` provides the header and converts positions where needed. `tle_epoch` is the epoch of the
+    elements the track was computed from, if any.
+    """
+    chunks = iter([track] if isinstance(track, TrackPath) else track)
+    first = next(chunks, None)
+    if kind is None:
+        kind = TRACK_KIND_AXES if first is not None and first.has_mount_pos else TRACK_KIND_ALTAZ
+    if kind == TRACK_KIND_AXES and mount is None:
+        raise ValueError("Axis count records need the mount they were computed for")
+    if mount is not None:
+        header = TrackFileHeader.for_mount(mount, kind, tle_epoch)
+    else:
+        location = first.location if first is not None else None
+        header = TrackFileHeader(kind, location=location, tle_epoch=tle_epoch)
+
+    with open(filepath, "wb") as f:
+        f.write(header.pack())
+        if first is not None:
+            for path in chain([first], chunks):
+                records = _records(path, kind, mount)
+                f.write(records.tobytes())
+                header.count += len(records)
+        # Point count is only known now
+        f.seek(0)
+        f.write(header.pack())
+    return header
+
+class TrackFile:
+    """Track file opened for reading, its records are memory-mapped (see `records`)"""
+    def __init__(self, filepath: str):
+        self.filepath = filepath
+        with open(filepath, "rb") as f:
+            self.header = TrackFileHeader.unpack(f.read(_DATA_OFFSET))
+        dtype = _RECORD_DTYPES[self.header.kind]
+        if self.header.count == 0:
+            self.records = np.empty(0, dtype=dtype)
+        else:
+            self.records = np.memmap(filepath, dtype=dtype, mode="r", offset=self.header.data_offset, shape=(self.header.count,))
+
+    def __len__(self) -> int:
+        return self.header.count
+
+    @property
+    def kind(self) -> int:
+        return self.header.kind
+
+    @property
+    def times_ms(self) -> np.ndarray:
+        return self.records["time_ms"]
+
+    def path(self, key=slice(None)) -> TrackPath:
+        """Loads the records (or a slice of them) as a TrackPath"""
+        records = self.records[key]
+        if self.kind == TRACK_KIND_AXES:
+            return TrackPath(records["time_ms"], ax1=records["ax1"], ax2=records["ax2"], location=self.header.location)
+        return TrackPath(records["time_ms"], alt=records["alt"], az=records["az"], location=self.header.location)
+
+    def check_mount(self, mount) -> None:
+        """Raises ValueError if the records of the file aren't valid for the mount"""
+        header = self.header
+        # Both altaz and axis records (hour angle and declination) are relative to the site
+        location = getattr(mount, "location", None)
+        if header.location is not None and location is not None:
+            distance = np.linalg.norm((header.location.get_itrs().cartesian - location.get_itrs().cartesian).xyz.to_value(u.m))
+            if distance > _LOCATION_TOLERANCE_M:
+                raise ValueError(f"Track file is for the site at lat {header.location.lat.deg:.6f}, lon {header.location.lon.deg:.6f}, "
+                                 f"mount is at lat {location.lat.deg:.6f}, lon {location.lon.deg:.6f}")
+        if self.kind != TRACK_KIND_AXES:
+            return
+        if (header.cpr_ra, header.cpr_dec) != (mount.cprRa, mount.cprDec):
+            raise ValueError(f"Track file is for CPR {header.cpr_ra}/{header.cpr_dec}, mount has {mount.cprRa}/{mount.cprDec}")
+        if header.ax_alt is not None and (abs(header.ax_alt - mount.axCoord.alt.deg) > _AXIS_TOLERANCE_DEG
+                                          or abs(header.ax_az - mount.axCoord.az.deg) > _AXIS_TOLERANCE_DEG):
+            raise ValueError("Track file is for a mount with another axis direction, save it as altaz to replay it elsewhere")
+
+    def mount_cmds(self, mount, chunk_size: int = _CHUNK_SIZE) -> Iterator[Tuple[int, int, int]]:
+        """(ax1, ax2, mount time) upload commands, read from the file one chunk at a time"""
+        self.check_mount(mount)
+        for start in range(0, len(self), chunk_size):
+            records = self.records[start:start + chunk_size]
+            if self.kind == TRACK_KIND_AXES:
+                ax1, ax2 = records["ax1"], records["ax2"]
+            else:
+                ax1, ax2 = mount._coordEngine.altaz_to_mount_pos(records["alt"], records["az"], mount.cprRa, mount.cprDec)
+            yield from zip(np.asarray(ax1).tolist(), np.asarray(ax2).tolist(), records["time_ms"].tolist())
+
+def is_track_file(filepath: str) -> bool:
+    with open(filepath, "rb") as f:
+        return f.read(len(_MAGIC)) == _MAGIC
@@ -0,0 +1,159 @@
+from astropy.coordinates import SkyCoord, EarthLocation, AltAz
+from astropy.time import Time
+import astropy.units as u
+import numpy as np
+from dataclasses import dataclass
+from typing import Iterable, Iterator, Optional, Tuple, Union
+
+@dataclass
+class TrackPoint:
+    coord: SkyCoord
+    t: Time
+
+class TrackPath:
+    """Track stored as arrays instead of a list of TrackPoint objects.
+
+    Times are float64 unix milliseconds. Positions are kept as altitude/azimuth in degrees, as
+    mount axis counts (ax1, ax2), or both. SkyCoord and Time objects are only created on demand.
+    Indexing with an integer returns a TrackPoint, so the path can be used where a list of
+    TrackPoints was used before.
+    """
+    def __init__(self, times_ms, alt=None, az=None, ax1=None, ax2=None, location: EarthLocation = None):
+        self.times_ms = np.asarray(times_ms, dtype=np.float64)
+        self.alt = None if alt is None else np.asarray(alt, dtype=np.float64)
+        self.az = None if az is None else np.asarray(az, dtype=np.float64)
+        self.ax1 = None if ax1 is None else np.asarray(ax1, dtype=np.int64)
+        self.ax2 = None if ax2 is None else np.asarray(ax2, dtype=np.int64)
+        self.location = location
+        if (self.alt is None) != (self.az is None) or (self.ax1 is None) != (self.ax2 is None):
+            raise ValueError("Both coordinates of a position have to be given")
+        if self.alt is None and self.ax1 is None:
+            raise ValueError("Track path needs either altaz or mount positions")
+        for arr in (self.alt, self.az, self.ax1, self.ax2):
+            if arr is not None and arr.shape != self.times_ms.shape:
+                raise ValueError("All track path arrays must have the same length")
+
+    @classmethod
+    def from_coord(cls, coord: SkyCoord) -> "TrackPath":
+        """Creates path from an array-valued coordinate with point times in its obstime"""
+        if not isinstance(coord.frame, AltAz):
+            coord = coord.transform_to("altaz")
+        return cls(coord.obstime.unix * 1000, alt=coord.alt.deg, az=coord.az.deg, location=coord.location)
+
+    @classmethod
+    def from_track_points(cls, trackPoints: Iterable[TrackPoint]) -> "TrackPath":
+        trackPoints = list(trackPoints)
+        if len(trackPoints) == 0:
+            return cls(np.empty(0), alt=np.empty(0), az=np.empty(0))
+        altaz = [point.coord if isinstance(point.coord.frame, AltAz) else point.coord.transform_to("altaz") for point in trackPoints]
+        return cls(
+            np.fromiter((point.t.unix * 1000 for point in trackPoints), dtype=np.float64, count=len(trackPoints)),
+            alt=np.fromiter((coord.alt.deg for coord in altaz), dtype=np.float64, count=len(altaz)),
+            az=np.fromiter((coord.az.deg for coord in altaz), dtype=np.float64, count=len(altaz)),
+            location=altaz[0].location
+        )
+
+    @classmethod
+    def of(cls, track: Union["TrackPath", SkyCoord, Iterable[TrackPoint]]) -> "TrackPath":
+        """Returns the track as TrackPath, converting it from any of the supported track types"""
+        if isinstance(track, TrackPath):
+            return track
+        if isinstance(track, SkyCoord):
+            return cls.from_coord(track)
+        return cls.from_track_points(track)
+
+    @classmethod
+    def concatenate(cls, paths: Iterable["TrackPath"]) -> "TrackPath":
+        paths = list(paths)
+        if len(paths) == 0:
+            raise ValueError("Nothing to concatenate")
+
+        def join(attr: str) -> Optional[np.ndarray]:
+            arrays = [getattr(path, attr) for path in paths]
+            if any(arr is None for arr in arrays):
+                return None
+            return np.concatenate(arrays)
+
+        return cls(join("times_ms"), alt=join("alt"), az=join("az"), ax1=join("ax1"), ax2=join("ax2"), location=paths[0].location)
+
+    def __add__(self, other: "TrackPath") -> "TrackPath":
+        return TrackPath.concatenate([self, other])
+
+    def __len__(self) -> int:
+        return len(self.times_ms)
+
+    def __getitem__(self, key) -> Union["TrackPath", TrackPoint]:
+        if isinstance(key, (int, np.integer)):
+            return TrackPoint(self._coord(key), Time(self.times_ms[key] / 1000, format="unix"))
+
+        def take(arr):
+            return None if arr is None else arr[key]
+        return TrackPath(self.times_ms[key], alt=take(self.alt), az=take(self.az), ax1=take(self.ax1), ax2=take(self.ax2), location=self.location)
+
+    def __iter__(self) -> Iterator[TrackPoint]:
+        # Elements of one array-valued coordinate, much cheaper than a SkyCoord and Time per point
+        for coord in self._coord():
+            yield TrackPoint(coord, coord.obstime)
+
+    @property
+    def has_altaz(self) -> bool:
+        return self.alt is not None
+
+    @property
+    def has_mount_pos(self) -> bool:
+        return self.ax1 is not None
+
+    @property
+    def times(self) -> Time:
+        return Time(self.times_ms / 1000, format="unix")
+
+    def _coord(self, key=slice(None)) -> SkyCoord:
+        if not self.has_altaz:
+            raise ValueError("Track path has only mount positions, use altaz(mount) to convert them first")
+        return SkyCoord(frame="altaz", alt=self.alt[key] * u.deg, az=self.az[key] * u.deg,
+                        obstime=Time(self.times_ms[key] / 1000, format="unix"), location=self.location)
+
+    @property
+    def coord(self) -> SkyCoord:
+        """All points as one array-valued altaz coordinate, with point times in its obstime"""
+        return self._coord()
+
+    def altaz(self, mount=None) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns (alt, az) arrays in degrees, converting them from mount positions if needed"""
+        if self.has_altaz:
+            return self.alt, self.az
+        if mount is None:
+            raise ValueError("Mount is needed to convert mount positions to altaz")
+        return mount._coordEngine.mount_pos_to_altaz(self.ax1, self.ax2, mount.cprRa, mount.cprDec)
+
+    def mount_pos(self, mount) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns (ax1, ax2) arrays, converting them from altaz using the mount if needed"""
+        if self.has_mount_pos:
+            return self.ax1, self.ax2
+        return mount._coordEngine.altaz_to_mount_pos(self.alt, self.az, mount.cprRa, mount.cprDec)
+
+    def with_mount_pos(self, mount) -> "TrackPath":
+        """Returns the path with precomputed mount positions, ready for repeated uploads"""
+        ax1, ax2 = self.mount_pos(mount)
+        return TrackPath(self.times_ms, alt=self.alt, az=self.az, ax1=ax1, ax2=ax2, location=self.location)
+
+    @classmethod
+    def from_csv(cls, filepath: str, location: EarthLocation = None) -> "TrackPath":
+        """Loads a path saved by to_csv. Columns are named in the header: time_ms and alt, az (degrees) and/or ax1, ax2 (counts)."""
+        data = np.genfromtxt(filepath, delimiter=",", names=True, ndmin=1)
+        names = data.dtype.names
+
+        def column(name: str):
+            return data[name] if name in names else None
+        if "time_ms" not in names:
+            raise ValueError(f"{filepath}: time_ms column is missing")
+        return cls(data["time_ms"], alt=column("alt"), az=column("az"), ax1=column("ax1"), ax2=column("ax2"), location=location)
+
+    def to_csv(self, filepath: str) -> None:
+        columns = [("time_ms", self.times_ms, "%.3f")]
+        if self.has_altaz:
+            columns += [("alt", self.alt, "%.9f"), ("az", self.az, "%.9f")]
+        if self.has_mount_pos:
+            columns += [("ax1", self.ax1, "%d"), ("ax2", self.ax2, "%d")]
+        np.savetxt(filepath, np.column_stack([c[1] for c in columns]), delimiter=",", header=",".join(c[0] for c in columns),
+                   comments="", fmt=[c[2] for c in columns])
@@ -0,0 +1,125 @@
+from collections import deque
+from dataclasses import dataclass
+from itertools import islice
+from typing import Iterable, Iterator, Tuple, Deque, Optional
+from time import monotonic
+import threading
+from .mountConnection import MountStatus, TrackPointAddResult
+
+_REFILL_INTERVAL = 0.5
+
+@dataclass
+class TrackStreamStats:
+    points_sent: int = 0
+    refills: int = 0
+    # Free track buffer space as reported by the mount before each refill
+    min_free_space: Optional[int] = None
+    max_free_space: Optional[int] = None
+    # Time spent by a single refill (free space query + upload), in seconds
+    max_refill_lag: float = 0.0
+    total_refill_lag: float = 0.0
+    # Mount finished its buffer while there were still points waiting on the host
+    starved: bool = False
+
+    @property
+    def mean_refill_lag(self) -> float:
+        if self.refills == 0:
+            return 0.0
+        return self.total_refill_lag / self.refills
+
+    def __str__(self) -> str:
+        return (f"points sent: {self.points_sent}, refills: {self.refills}, "
+                f"free space: {self.min_free_space}..{self.max_free_space}, "
+                f"refill lag: mean {round(self.mean_refill_lag * 1000, 1)} ms, max {round(self.max_refill_lag * 1000, 1)} ms, "
+                f"starved: {self.starved}")
+
+class TrackStreamer:
+    """Feeds an arbitrarily long track into the mount's finite track buffer.
+
+    `start()` uploads the first buffer-full of points and starts tracking, a background thread then
+    keeps topping up the buffer as the mount consumes points. Track points are pulled from the
+    iterable lazily, so generators work without holding the whole track in memory.
+    """
+    def __init__(self, mount, trackPoints: Iterable, refill_interval: float = _REFILL_INTERVAL):
+        self.mount = mount
+        self.refill_interval = refill_interval
+        self.stats = TrackStreamStats()
+        self.error: Optional[Exception] = None
+        self._commands: Iterator[Tuple[int, int, int]] = iter(mount._track_to_cmds(trackPoints))
+        self._pending: Deque[Tuple[int, int, int]] = deque()
+        self._exhausted = False
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def finished(self) -> bool:
+        """All track points have been uploaded to the mount"""
+        return self._exhausted and len(self._pending) == 0
+
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        connection = self.mount.mountConnection
+        connection.stop()
+        connection.clear_track_buffer()
+        self._refill()
+        self.mount.sync_time()
+        connection.tracking_start()
+        self._thread = threading.Thread(target=self._run, name="TrackStreamer", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stops refilling the buffer. The mount keeps tracking the points it already has."""
+        self._stop_event.set()
+        self.join()
+
+    def join(self, timeout: float = None) -> None:
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _take(self, count: int) -> None:
+        missing = count - len(self._pending)
+        if missing > 0 and not self._exhausted:
+            chunk = list(islice(self._commands, missing))
+            if len(chunk) < missing:
+                self._exhausted = True
+            self._pending.extend(chunk)
+
+    def _refill(self) -> None:
+        connection = self.mount.mountConnection
+        t_start = monotonic()
+        free_space = connection.get_track_buffer_free_space()
+        stats = self.stats
+        stats.min_free_space = free_space if stats.min_free_space is None else min(stats.min_free_space, free_space)
+        stats.max_free_space = free_space if stats.max_free_space is None else max(stats.max_free_space, free_space)
+
+        self._take(free_space)
+        if free_space == 0 or len(self._pending) == 0:
+            return
+        results = connection.add_track_points(islice(self._pending, free_space), free_space=free_space)
+        for result in results:
+            if result != TrackPointAddResult.OK:
+                break
+            self._pending.popleft()
+            stats.points_sent += 1
+        if TrackPointAddResult.INTERNAL in results:
+            raise Exception("Mount failed to add a track point")
+
+        lag = monotonic() - t_start
+        stats.refills += 1
+        stats.total_refill_lag += lag
+        stats.max_refill_lag = max(stats.max_refill_lag, lag)
+
+    def _run(self) -> None:
+        try:
+            while not self._stop_event.wait(self.refill_interval):
+                if self.finished:
+                    break
+                if self.mount.mountConnection.get_mount_status() == MountStatus.STOPPED:
+                    # Tracking ended before the rest of the track could be uploaded
+                    self.stats.starved = True
+                    break
+                self._refill()
+        except Exception as e:
+            self.error = e
@@ -34,12 +34,15 @@ for alt in range(alt_start, 91, alt_res):
     deltaT += 10 * time_per_degree
 
 # UPLOAD TRACK POINTS
+# The scan can be longer than the mount's track buffer, so it is streamed in as the mount consumes it
 print("Uploading track points")
-mount.track(trackPoints, print_upload_progres=True)
+streamer = mount.track_stream(trackPoints)
 print("Started tracking")
 
 # PLOT CURRENT STATUS
 trackGui = MatplotlibTrackGUI(mount, trackPoints)
 trackGui.loop()
+streamer.stop()
+print("Track streaming:", streamer.stats)
 
 print("Custom tracking finished")
\ No newline at end of file
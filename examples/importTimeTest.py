@@ -0,0 +1,47 @@
+import subprocess
+import sys
+
+# Import time budgets in milliseconds, measured in a fresh interpreter
+MOUNT_CONNECTION_BUDGET_MS = 100
+PACKAGE_BUDGET_MS = 50
+# Modules that must stay unloaded after the import, they are loaded on first use
+HEAVY_MODULES = ["astropy", "skyfield", "matplotlib", "alive_progress"]
+
+CODE = """
+import sys
+from time import perf_counter
+t = perf_counter()
+import {module}
+elapsed = (perf_counter() - t) * 1000
+loaded = [name for name in {heavy} if name in sys.modules]
+print(elapsed)
+print(",".join(loaded))
+"""
+
+def measure(module: str, repeat: int = 3):
+    """Returns the best import time in ms and the heavy modules the import loaded"""
+    best = None
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, "-c", CODE.format(module=module, heavy=HEAVY_MODULES)], check=True, capture_output=True, text=True)
+        elapsed, loaded = result.stdout.split("\n")[:2]
+        best = float(elapsed) if best is None else min(best, float(elapsed))
+    return best, [name for name in loaded.split(",") if name]
+
+failed = False
+full_stack_ms, _ = measure("espMountCtrl.mount, espMountCtrl.satellites.satelliteTracker, espMountCtrl.gui.matplotlibTrackGui")
+print(f"Full stack: {full_stack_ms:.0f} ms")
+
+for module, budget, heavy_allowed in [
+    ("espMountCtrl.mountConnection", MOUNT_CONNECTION_BUDGET_MS, []),
+    ("espMountCtrl.satellites", PACKAGE_BUDGET_MS, []),
+    ("espMountCtrl.gui", PACKAGE_BUDGET_MS, []),
+    ("espMountCtrl.mount", None, ["astropy"]),
+]:
+    elapsed, loaded = measure(module)
+    unexpected = [name for name in loaded if name not in heavy_allowed]
+    ok = (budget is None or elapsed <= budget) and len(unexpected) == 0
+    failed |= not ok
+    budget_str = "-" if budget is None else f"{budget} ms"
+    print(f"{module:<32} {elapsed:6.0f} ms  budget {budget_str:<8} {'OK' if ok else 'FAILED'}" + (f"  loaded: {', '.join(unexpected)}" if unexpected else ""))
+
+sys.exit(1 if failed else 0)
@@ -0,0 +1,31 @@
+from espMountCtrl.mount import Mount
+from astropy.coordinates import SkyCoord, EarthLocation
+import astropy.units as u
+from astropy.time import Time
+import asyncio
+
+# SETUP MOUNT
+location = EarthLocation.from_geodetic(48, 16)
+axCoord = SkyCoord(alt=30 * u.degree, az=270 * u.degree, frame="altaz", obstime=Time.now(), location=location)
+mount = Mount(axCoord)
+
+async def print_position(interval: float):
+    while True:
+        print("Current pos:", await mount.get_position_async())
+        await asyncio.sleep(interval)
+
+async def main():
+    await mount.connect_async()
+    await mount.sync_time_async()
+    await mount.stop_async(block=True)
+
+    # Position keeps being printed while the goto runs, both share the connection
+    printer = asyncio.create_task(print_position(1.0))
+    print("Goto to zenit")
+    await mount.goto_async(SkyCoord(alt=89 * u.deg, az=180 * u.deg, frame="altaz", obstime=Time.now(), location=location), block=True)
+    print("Goto finished")
+    printer.cancel()
+
+    await mount.disconnect_async()
+
+asyncio.run(main())
@@ -2,8 +2,12 @@ from espMountCtrl.mount import Mount
 from astropy.coordinates import SkyCoord, EarthLocation
 from astropy.time import Time
 import astropy.units as u
+import numpy as np
 from time import time
 
+# Maximum allowed difference between the closed-form engine and the astropy frame transform
+TOLERANCE_ARCSEC = 0.1
+
 mount = Mount.from_ax_altaz(10 * u.deg, 90 * u.deg, 49 * u.deg, 16 * u.deg)
 
 mount.cprRa = 360
@@ -23,5 +27,36 @@ for i in range(0, 10):
 t2 = time()
 print("Stress test time:", t2 - t1, "s")
 
+# REGRESSION AGAINST THE ASTROPY PATH
+# The mount frame is the hadec frame at a fake location with latitude equal to the axis altitude
+t = Time.now()
+fakeLocation = EarthLocation.from_geodetic(lon=0 * u.deg, lat=mount.axCoord.alt)
+rng = np.random.default_rng(0)
+alts = rng.uniform(-89, 89, 1000)
+azs = rng.uniform(0, 360, 1000)
+
+t1 = time()
+fake_hadec = SkyCoord(alt=alts * u.deg, az=azs * u.deg - mount.axCoord.az, frame="altaz", obstime=t, location=fakeLocation).transform_to("hadec")
+t2 = time()
+ha, dec = mount._coordEngine.altaz_to_hadec(alts, azs)
+t3 = time()
+engine_hadec = SkyCoord(ha=ha * u.deg, dec=dec * u.deg, frame="hadec", obstime=t, location=fakeLocation)
+err_forward = fake_hadec.separation(engine_hadec).arcsec.max()
+print("altaz -> mount max error:", err_forward, "arcsec")
+print(f"Astropy: {t2 - t1} s, engine: {t3 - t2} s ({len(alts)} points)")
+
+fake_altaz = fake_hadec.transform_to("altaz")
+alts_back, azs_back = mount._coordEngine.hadec_to_altaz(fake_hadec.ha.deg, fake_hadec.dec.deg)
+engine_altaz = SkyCoord(alt=alts_back * u.deg, az=azs_back * u.deg - mount.axCoord.az, frame="altaz", obstime=t, location=fakeLocation)
+err_backward = fake_altaz.separation(engine_altaz).arcsec.max()
+print("mount -> altaz max error:", err_backward, "arcsec")
+
+ax1, ax2 = mount._coord_to_mount_pos(SkyCoord(alt=alts * u.deg, az=azs * u.deg, frame="altaz", obstime=t, location=loc))
+roundtrip = mount._mount_pos_to_coord(ax1, ax2)
+print("Round trip max error at 1 deg per count:", np.abs(roundtrip.alt.deg - alts).max(), "deg")
+
+assert err_forward < TOLERANCE_ARCSEC and err_backward < TOLERANCE_ARCSEC, "Coordinate engine differs from astropy"
+print("Coordinate engine matches astropy within", TOLERANCE_ARCSEC, "arcsec")
+
 test = Time.now()
-print(test.to_value("unix") * 1000)
\ No newline at end of file
+print(test.to_value("unix") * 1000)
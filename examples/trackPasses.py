@@ -0,0 +1,33 @@
+from espMountCtrl.mount import Mount
+from espMountCtrl.satellites import SatelliteFinder, SatelliteTracker, PassScheduler, PassPipeline
+from astropy.time import Time
+import astropy.units as u
+
+## DOWNLOAD SATELLITE INFO
+names = ['grbalpha', 'iss']
+sats = [SatelliteFinder.fromName(name, False)[0] for name in names]
+print("Satellites:", ", ".join(sat.name for sat in sats))
+
+# SETUP MOUNT
+mount = Mount.from_ax_altaz(alt='49deg', az='0deg', lon='16deg', lat='49deg', elevation='220m')
+mount.connect()
+mount.stop(block=True)
+mount.calibrate_ant_coord(mount.local_altaz('0deg', '90deg'))
+
+# PLAN PASSES OF THE NEXT DAY
+satTracker = SatelliteTracker(mount)
+transits = satTracker.find_transits_many(sats, time_to=Time.now() + 1 * u.day, min_elev=10 * u.deg, time_from=Time.now())
+scheduler = PassScheduler(mount)
+scheduler.add(transits)
+scheduler.set_origin(Time.now(), mount.mountConnection.get_position())
+plan = scheduler.plan()
+print(plan)
+
+# OBSERVE THEM BACK TO BACK
+def print_armed(report, track):
+    print("Armed:", report)
+
+pipeline = PassPipeline(mount, plan.passes, max_error_arcsec=20, on_armed=print_armed)
+stats = pipeline.run()
+print(stats)
+mount.disconnect()
@@ -35,7 +35,9 @@ print("Best transit:", best_transit)
 
 # CALCULATE TRACK DATA FOR THE SELECTED TRANSIT
 print("Running track preview")
-track_points = best_transit.calculate_track_points(600)
+adaptive_track = best_transit.calculate_adaptive_track(mount, max_error_arcsec=20)
+print("Track:", adaptive_track)
+track_points = adaptive_track.track
 
 # INITIALIZE GUI
 trackGui = MatplotlibTrackGUI(mount, track_points)
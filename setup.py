@@ -1,3 +1,4 @@
 from setuptools import setup, find_packages
 
-setup(name='espMountCtrl', version='1.0', packages=find_packages())
\ No newline at end of file
+setup(name='espMountCtrl', version='1.0', packages=find_packages(),
+      entry_points={'console_scripts': ['espmount = espMountCtrl.cli:main']})
\ No newline at end of file